@@ -0,0 +1,106 @@
+"""Catalog parsing benchmark
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This script compares parse time and peak memory of the minidom path (building
+the whole tree of the catalog) and of the streaming `iter_catalog` parser, on a
+synthetic Video@RNP catalog. Each method runs in its own process, so that the
+peak resident set size of one does not hide the other's.
+
+Usage:
+
+    $ python -m crawlers.benchmarks.bench_catalog_parsing --entries 100000
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * parse - Parses a catalog file with one of the methods and measures it.
+    * run - Writes a synthetic catalog and benchmarks every method against it.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from xml.dom import minidom
+
+if __package__ in (None, ''):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))  # Running as a script
+
+from crawlers.rnp.catalog import iter_catalog
+from crawlers.tests.mock_server import catalog_xml
+
+METHODS = ['minidom', 'iter_catalog']
+
+
+def parse(catalog_path: str, method: str):
+    """Parses a catalog file with one of the methods and measures it.
+
+    :param catalog_path: Path to the catalog xml.
+    :type catalog_path: str
+
+    :param method: Either 'minidom' or 'iter_catalog'.
+    :type method: str
+
+    :returns: A dict with the 'method', the number of 'videos' found, the parse 'seconds' and the 'peak_rss_mib' of
+        the process.
+    :rtype: dict
+    """
+    start = time.perf_counter()
+    if method == 'minidom':
+        with open(catalog_path) as f:
+            xml = minidom.parseString(f.read())
+        video_ids = [video_node.childNodes[0].childNodes[0].nodeValue for video_node in xml.childNodes[0].childNodes]
+        n_videos = len(video_ids)
+    else:
+        with open(catalog_path, 'rb') as f:
+            n_videos = sum(1 for _ in iter_catalog(f))
+    seconds = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss is in KiB on Linux
+    return {'method': method, 'videos': n_videos, 'seconds': seconds, 'peak_rss_mib': peak_rss}
+
+
+def run(entries: int = 100000):
+    """Writes a synthetic catalog and benchmarks every method against it, each in a fresh process.
+
+    :param entries: Number of videos in the synthetic catalog.
+    :type entries: int, optional
+
+    :returns: A list with the result of each method, as returned by parse.
+    :rtype: list
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.xml', delete=False) as f:
+        f.write(catalog_xml(str(10000 + i) for i in range(entries)))
+        catalog_path = f.name
+    results = []
+    try:
+        for method in METHODS:
+            output = subprocess.check_output([sys.executable, '-m', 'crawlers.benchmarks.bench_catalog_parsing',
+                                              '--catalog', catalog_path, '--method', method],
+                                             cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+            result = json.loads(output.decode().strip().splitlines()[-1])
+            results.append(result)
+            print(f"{result['method']:>12}: {result['videos']} videos in {result['seconds']:.2f}s, "
+                  f"peak RSS {result['peak_rss_mib']:.1f} MiB")
+    finally:
+        os.remove(catalog_path)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the parsing of the Video@RNP catalog.')
+    parser.add_argument("--entries", type=int, help="Number of videos in the synthetic catalog", default=100000)
+    parser.add_argument("--catalog", type=str, help="Parse this catalog file (used internally)", default=None)
+    parser.add_argument("--method", choices=METHODS, help="Parsing method (used with --catalog)", default=None)
+    args = parser.parse_args()
+
+    if args.catalog:
+        print(json.dumps(parse(args.catalog, args.method)))
+    else:
+        run(args.entries)
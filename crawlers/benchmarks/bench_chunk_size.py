@@ -0,0 +1,116 @@
+"""Chunk size benchmark
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This script measures the CPU time spent by `download_file` per GiB received
+from a local HTTP server, for the former transfer path (``iter_content`` in
+1 KiB chunks, each one a new bytes object) and for the current one (large
+chunks read with ``readinto`` into a reused buffer, see ``iter_body``) at
+several chunk sizes.
+
+Only the CPU time of the downloading thread is counted, the local server runs
+in another thread of the same process.
+
+Usage:
+
+    $ python -m crawlers.benchmarks.bench_chunk_size --size 256 --chunk_kb 1 64 1024
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * legacy_download - Downloads a file the way download_file used to, 1 KiB at a time.
+    * run - Downloads the same file with each transfer path and reports the CPU time per GiB.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+if __package__ in (None, ''):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))  # Running as a script
+
+from crawlers.common.http_client import HttpClient
+from crawlers.rnp.rnp_crawler import download_file, sizeof_fmt
+from crawlers.tests.mock_server import MockRNPServer
+
+# CPU time of the calling thread (of the whole process before Python 3.7)
+_thread_time = getattr(time, 'thread_time', time.process_time)
+
+
+def legacy_download(url: str, file_path: str, http_client: HttpClient):
+    """Downloads a file the way download_file used to, 1 KiB at a time.
+
+    :returns: The size in bytes of the downloaded file.
+    :rtype: int
+    """
+    dl = 0
+    with http_client.get(url, stream=True) as r, open(file_path, 'wb') as f:
+        for chunk in r.iter_content(1024):
+            dl += len(chunk)
+            f.write(chunk)
+    return dl
+
+
+def run(size_mib: int = 256, chunk_sizes_kib: list = (1, 64, 1024), repeat: int = 3, preallocate: bool = False):
+    """Downloads the same file with each transfer path and reports the CPU time per GiB.
+
+    :param size_mib: Size of the downloaded file, in MiB.
+    :type size_mib: int, optional
+
+    :param chunk_sizes_kib: Chunk sizes of the current path to benchmark, in KiB.
+    :type chunk_sizes_kib: list, optional
+
+    :param repeat: Number of downloads of each path, the best one is reported.
+    :type repeat: int, optional
+
+    :param preallocate: Whether the current path preallocates the file, see download_file.
+    :type preallocate: bool, optional
+
+    :returns: A list of (path name, cpu seconds per GiB, wall seconds per GiB) tuples.
+    :rtype: list
+    """
+    paths = [('legacy, 1 KiB', None)] + [(f'readinto, {size} KiB', size * 1024) for size in chunk_sizes_kib]
+    results = []
+    http_client = HttpClient(pool_maxsize=1)
+    with MockRNPServer(n_videos=1, video_size=size_mib * 1024 * 1024) as server:
+        url = f'{server.base_url}/vod/{server.video_ids[0]}.mp4'
+        server.payload(server.video_ids[0])  # Built before timing
+        for name, chunk_size in paths:
+            best_cpu = best_wall = None
+            for _ in range(repeat):
+                save_dir = tempfile.mkdtemp()
+                try:
+                    cpu_start, wall_start = _thread_time(), time.perf_counter()
+                    if chunk_size is None:
+                        size = legacy_download(url, os.path.join(save_dir, 'video.mp4'), http_client)
+                    else:
+                        size = download_file(url, save_dir, local_filename='video.mp4', verbose=False,
+                                             http_client=http_client, chunk_size=chunk_size, preallocate=preallocate)
+                    cpu, wall = _thread_time() - cpu_start, time.perf_counter() - wall_start
+                finally:
+                    shutil.rmtree(save_dir)
+                gibs = size / 1024 ** 3
+                best_cpu = min(best_cpu, cpu / gibs) if best_cpu is not None else cpu / gibs
+                best_wall = min(best_wall, wall / gibs) if best_wall is not None else wall / gibs
+            results.append((name, best_cpu, best_wall))
+            print(f'{name:>20}: {best_cpu:.2f} CPU s/GiB, {best_wall:.2f} s/GiB '
+                  f'({sizeof_fmt(1024 ** 3 / best_wall)}/s)')
+    http_client.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the CPU time per GiB of the download transfer paths.')
+    parser.add_argument("--size", type=int, help="Size of the downloaded file, in MiB", default=256)
+    parser.add_argument("--chunk_kb", type=int, nargs='+', help="Chunk sizes to benchmark, in KiB",
+                        default=[1, 64, 1024])
+    parser.add_argument("--repeat", type=int, help="Number of downloads of each path", default=3)
+    parser.add_argument("--preallocate", action='store_true', help="Preallocate the downloaded files")
+    args = parser.parse_args()
+
+    run(args.size, args.chunk_kb, args.repeat, args.preallocate)
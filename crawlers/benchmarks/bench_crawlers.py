@@ -0,0 +1,282 @@
+"""Crawlers benchmark
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This script runs each mode of the crawlers end to end against local stand-ins,
+so that their throughput can be measured offline and reproducibly: the Video@RNP
+crawler against a mock of its API (synthetic catalog, versions and video files,
+with injectable latency, throttling and failures), and the youtube tools with a
+stub of youtube_dl. For each mode it reports videos/s, MB/s, CPU time and peak
+memory.
+
+Each mode runs in its own process (the mock server stays in this one), so that
+the CPU time and the peak memory are those of the crawler alone. Results can be
+saved as JSON and compared with a previous run, failing when the throughput of
+a mode drops, to catch regressions.
+
+Usage:
+
+    $ python -m crawlers.benchmarks.bench_crawlers --videos 200 --size 1024 --latency 5 --save bench.json
+    $ python -m crawlers.benchmarks.bench_crawlers --baseline bench.json --tolerance 0.2
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * run_mode - Runs a single mode of the crawlers and measures it.
+    * run - Runs every requested mode against the local stand-ins and reports them.
+    * regressions - Compares results with a baseline.
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import queue as queue_module
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak memory is not reported there
+    resource = None
+
+if __package__ in (None, ''):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))  # Running as a script
+
+from crawlers.common.download_index import VIDEO_EXTENSIONS
+from crawlers.tests.mock_server import MockRNPServer
+
+# Keyword arguments of crawl_and_download of each mode of the Video@RNP crawler
+RNP_MODES = {
+    'rnp': {},
+    'rnp_concurrent': {'lookup_workers': 4, 'download_workers': 4},
+    'rnp_segmented': {'lookup_workers': 2, 'download_workers': 2, 'segments': 4},
+    'rnp_state_store': {'lookup_workers': 4, 'download_workers': 4, 'state_db_path': '{tmp}/state.db',
+                        'store_dir': '{tmp}/store', 'index_path': '{tmp}/index.json'},
+    'rnp_verify': {'lookup_workers': 4, 'download_workers': 4, 'verify': True, 'verify_workers': 2},
+}
+
+# Modes of the youtube tools, run with the stub of youtube_dl
+YOUTUBE_MODES = ('youtube_csv', 'youtube_csv_metadata', 'youtube_search')
+
+MODES = tuple(RNP_MODES) + YOUTUBE_MODES
+
+
+def _count_files(directory: str):
+    """Counts the downloaded videos (not partial ones, nor links to them) under a directory and their bytes."""
+    n_files = n_bytes = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.rpartition('.')[2] not in VIDEO_EXTENSIONS or os.path.islink(path):
+                continue
+            n_files += 1
+            n_bytes += os.path.getsize(path)
+    return n_files, n_bytes
+
+
+def _youtube_mode(mode: str, tmp_dir: str, save_dir: str, n_videos: int, video_size: int, latency: float):
+    import youtube_dl
+    from crawlers.common.rate_limiter import AdaptiveRateLimiter
+    from crawlers.tests.stub_youtube_dl import StubYoutubeDL
+    from crawlers.youtube.metadata import MetadataFilter
+    from crawlers.youtube.yt_downloader_from_csv import read_csv_and_download_videos
+    from crawlers.youtube.yt_search import search_many
+
+    StubYoutubeDL.reset()
+    StubYoutubeDL.video_size = video_size
+    StubYoutubeDL.download_time = latency
+    youtube_dl.YoutubeDL = StubYoutubeDL  # Only in the process of the mode
+    if mode == 'youtube_search':
+        queries = [f'query {n}' for n in range(max(1, n_videos // 10))]
+        search_many(queries, save_dir, max_n=10, workers=4, download_workers=4,
+                    rate_limiter=AdaptiveRateLimiter(rate=None), links=True)
+        return
+    csv_path = os.path.join(tmp_dir, 'urls.csv')
+    with open(csv_path, 'w') as csv_file:
+        csv_file.write('\n'.join(f'https://www.youtube.com/watch?v=video{n:06d},' for n in range(n_videos)))
+    metadata = mode == 'youtube_csv_metadata'
+    read_csv_and_download_videos(csv_path, save_dir, wait_time=0, rate_limiter=AdaptiveRateLimiter(rate=None),
+                                 workers=4, metadata_dir=os.path.join(tmp_dir, 'metadata') if metadata else None,
+                                 video_filter=MetadataFilter(max_duration=600) if metadata else None,
+                                 metadata_rate_limiter=AdaptiveRateLimiter(rate=None))
+
+
+def run_mode(mode: str, n_videos: int, video_size: int, api_url: str = None, client_key: str = None,
+             latency: float = 0.0, verbose: bool = False):
+    """Runs a single mode of the crawlers and measures it. Call it in a process of its own, see run.
+
+    :param mode: One of MODES.
+    :type mode: str
+
+    :param n_videos: Number of videos to crawl.
+    :type n_videos: int
+
+    :param video_size: Size in bytes of each video.
+    :type video_size: int
+
+    :param api_url: Address of the mock of the Video@RNP API, for the rnp modes.
+    :type api_url: str, optional
+
+    :param client_key: Client key expected by the mock.
+    :type client_key: str, optional
+
+    :param latency: Time in seconds each youtube_dl download takes, for the youtube modes (the latency of the RNP
+        modes is set in the mock server).
+    :type latency: float, optional
+
+    :param verbose: Whether to keep the output of the crawler.
+    :type verbose: bool, optional
+
+    :returns: A dict with the 'mode', number of 'videos' and 'bytes' downloaded, 'elapsed' and 'cpu' seconds,
+        'videos_per_second', 'mb_per_second' and 'peak_memory_mb' (None where it cannot be measured).
+    :rtype: dict
+    """
+    tmp_dir = tempfile.mkdtemp()
+    save_dir = os.path.join(tmp_dir, 'videos') + os.sep  # The youtube tools expect the trailing separator
+    output = None if verbose else open(os.devnull, 'w')
+    cpu_start, start = time.process_time(), time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output or sys.stdout), contextlib.redirect_stderr(output or sys.stderr):
+            if mode in RNP_MODES:
+                from crawlers.rnp.rnp_crawler import crawl_and_download
+                options = {name: value.format(tmp=tmp_dir) if isinstance(value, str) else value
+                           for name, value in RNP_MODES[mode].items()}
+                crawl_and_download(client_key, save_dir, max_n=n_videos, requests_per_second=None, api_url=api_url,
+                                   **options)
+            else:
+                _youtube_mode(mode, tmp_dir, save_dir, n_videos, video_size, latency)
+        elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+        videos, n_bytes = _count_files(save_dir)
+    finally:
+        if output is not None:
+            output.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    peak_memory = None
+    if resource is not None:
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin'
+                                                                            else 1024)
+    return {'mode': mode, 'videos': videos, 'bytes': n_bytes, 'elapsed': elapsed, 'cpu': cpu,
+            'videos_per_second': videos / elapsed, 'mb_per_second': n_bytes / elapsed / 1024 ** 2,
+            'peak_memory_mb': peak_memory}
+
+
+def _run_in_process(queue, *args):
+    queue.put(run_mode(*args))
+
+
+def run(modes: list = MODES, n_videos: int = 100, video_size: int = 1024 * 1024, latency: float = 0.0,
+        throttle_first: int = 0, fail_every: int = None, verbose: bool = False):
+    """Runs every requested mode against the local stand-ins and reports them.
+
+    :param modes: Modes to run, see MODES.
+    :type modes: list, optional
+
+    :param n_videos: Number of videos crawled by each mode.
+    :type n_videos: int, optional
+
+    :param video_size: Size in bytes of each video.
+    :type video_size: int, optional
+
+    :param latency: Time in seconds the mock server (and the stub of youtube_dl) takes to answer each request.
+    :type latency: float, optional
+
+    :param throttle_first: Number of requests the mock server answers with 429 before serving normally.
+    :type throttle_first: int, optional
+
+    :param fail_every: If given, every n-th request to the mock server fails with a 500.
+    :type fail_every: int, optional
+
+    :param verbose: Whether to keep the output of the crawlers.
+    :type verbose: bool, optional
+
+    :returns: The results of each mode, see run_mode.
+    :rtype: list
+    """
+    context = multiprocessing.get_context('spawn')  # A fresh process, so peak memory is the mode's own
+    results = []
+    for mode in modes:
+        with MockRNPServer(n_videos=n_videos, video_size=video_size, latency=latency,
+                           throttle_first=throttle_first, fail_every=fail_every) as server:
+            server.payload(server.video_ids[0])
+            queue = context.Queue()
+            process = context.Process(target=_run_in_process, args=(queue, mode, n_videos, video_size,
+                                                                     server.api_url, server.client_key, latency,
+                                                                     verbose))
+            process.start()
+            while True:
+                try:
+                    result = queue.get(timeout=1)
+                    break
+                except queue_module.Empty:
+                    if not process.is_alive():
+                        raise RuntimeError(f'The {mode} mode failed with exit code {process.exitcode}.')
+            process.join()
+        results.append(result)
+        memory = f"{result['peak_memory_mb']:.1f} MiB" if result['peak_memory_mb'] is not None else '?'
+        print(f"{mode:>22}: {result['videos']:>5} videos in {result['elapsed']:.2f}s, "
+              f"{result['videos_per_second']:.1f} videos/s, {result['mb_per_second']:.1f} MB/s, "
+              f"{result['cpu']:.2f}s CPU, peak {memory}")
+    return results
+
+
+def regressions(results: list, baseline: list, tolerance: float = 0.2):
+    """Compares results with a baseline.
+
+    :param results: Results of run.
+    :type results: list
+
+    :param baseline: Results of a previous run, e.g. loaded from a file saved with --save.
+    :type baseline: list
+
+    :param tolerance: Fraction of the videos/s of the baseline a mode may lose before it is a regression.
+    :type tolerance: float, optional
+
+    :returns: A message for each mode whose throughput dropped more than the tolerance.
+    :rtype: list
+    """
+    previous = {result['mode']: result for result in baseline}
+    messages = []
+    for result in results:
+        before = previous.get(result['mode'])
+        if before and result['videos_per_second'] < (1 - tolerance) * before['videos_per_second']:
+            messages.append(f"{result['mode']}: {result['videos_per_second']:.1f} videos/s, down from "
+                            f"{before['videos_per_second']:.1f}")
+    return messages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the crawlers against local stand-ins.')
+    parser.add_argument("--modes", type=str, nargs='+', choices=MODES, help="Modes to run", default=list(MODES))
+    parser.add_argument("--videos", type=int, help="Number of videos crawled by each mode", default=100)
+    parser.add_argument("--size", type=int, help="Size of each video, in KiB", default=1024)
+    parser.add_argument("--latency", type=float, help="Latency of each request, in milliseconds", default=0)
+    parser.add_argument("--throttle_first", type=int, help="Number of requests throttled with a 429", default=0)
+    parser.add_argument("--fail_every", type=int, help="Every n-th request fails with a 500", default=None)
+    parser.add_argument("--save", type=str, help="Path to a JSON file where the results are saved", default=None)
+    parser.add_argument("--baseline", type=str, help="Path to the JSON results of a previous run to compare with",
+                        default=None)
+    parser.add_argument("--tolerance", type=float,
+                        help="Fraction of the videos/s of the baseline a mode may lose", default=0.2)
+    parser.add_argument("--verbose", action='store_true', help="Keep the output of the crawlers")
+    args = parser.parse_args()
+
+    bench_results = run(args.modes, args.videos, args.size * 1024, args.latency / 1000, args.throttle_first,
+                        args.fail_every, args.verbose)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(bench_results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(bench_results, json.load(f), args.tolerance)
+        for message in found:
+            print('Regression:', message)
+        if found:
+            sys.exit(1)
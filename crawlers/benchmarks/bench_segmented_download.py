@@ -0,0 +1,87 @@
+"""Segmented download benchmark
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This script compares the single stream and the segmented (multi-connection)
+modes of `download_file` against a local range capable HTTP server, whose
+connections can be throttled to imitate a server that caps the speed of each
+connection.
+
+Usage:
+
+    $ python -m crawlers.benchmarks.bench_segmented_download --size 64 --segments 1 2 4 8 --connection_rate 16
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * run - Downloads the same file once per number of segments and reports the throughput.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+if __package__ in (None, ''):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))  # Running as a script
+
+from crawlers.rnp.rnp_crawler import download_file_segmented, download_file, sizeof_fmt
+from crawlers.tests.mock_server import MockRNPServer
+
+
+def run(size_mib: int = 64, segments_list: list = (1, 2, 4, 8), connection_rate_mib: float = None):
+    """Downloads the same file once per number of segments and reports the throughput.
+
+    :param size_mib: Size of the downloaded file, in MiB.
+    :type size_mib: int, optional
+
+    :param segments_list: Numbers of segments to benchmark, 1 means the single stream mode.
+    :type segments_list: list, optional
+
+    :param connection_rate_mib: Speed cap of each connection of the server, in MiB/s. None means no cap.
+    :type connection_rate_mib: float, optional
+
+    :returns: A list of (segments, report) tuples, as returned by download_file_segmented.
+    :rtype: list
+    """
+    connection_rate = int(connection_rate_mib * 1024 * 1024) if connection_rate_mib else None
+    results = []
+    with MockRNPServer(n_videos=1, video_size=size_mib * 1024 * 1024, connection_rate=connection_rate) as server:
+        video_id = server.video_ids[0]
+        url = f'{server.base_url}/vod/{video_id}.mp4'
+        for segments in segments_list:
+            save_dir = tempfile.mkdtemp()
+            try:
+                if segments == 1:
+                    start = time.perf_counter()
+                    size = download_file(url, save_dir, local_filename='video.mp4', verbose=False)
+                    elapsed = time.perf_counter() - start
+                    report = {'complete': size > 0, 'bytes': size, 'elapsed': elapsed,
+                              'throughput': size / elapsed, 'segments': []}
+                else:
+                    report = download_file_segmented(url, os.path.join(save_dir, 'video.mp4'), segments)
+            finally:
+                shutil.rmtree(save_dir)
+            results.append((segments, report))
+
+            print(f"{segments:>3} segment(s): {sizeof_fmt(report['bytes'])} in {report['elapsed']:.2f}s, "
+                  f"{sizeof_fmt(report['throughput'])}/s")
+            for segment in report['segments']:
+                print(f"      bytes {segment['start']}-{segment['end']}: {sizeof_fmt(segment['throughput'])}/s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark single stream and segmented downloads.')
+    parser.add_argument("--size", type=int, help="Size of the downloaded file, in MiB", default=64)
+    parser.add_argument("--segments", type=int, nargs='+', help="Numbers of segments to benchmark",
+                        default=[1, 2, 4, 8])
+    parser.add_argument("--connection_rate", type=float,
+                        help="Speed cap of each server connection, in MiB/s", default=None)
+    args = parser.parse_args()
+
+    run(args.size, args.segments, args.connection_rate)
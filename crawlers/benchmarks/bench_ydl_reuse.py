@@ -0,0 +1,68 @@
+"""YoutubeDL reuse benchmark
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This script measures the per-url setup overhead of building a new YoutubeDL
+for every url (as `download` does when called alone) against reusing the
+single instance of a `VideoDownloader`. Only the setup is measured, nothing is
+downloaded, so it runs offline.
+
+Usage:
+
+    $ python -m crawlers.benchmarks.bench_ydl_reuse --urls 200
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * run - Measures the setup overhead of both approaches.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import youtube_dl
+
+if __package__ in (None, ''):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))  # Running as a script
+
+from crawlers.youtube.yt_downloader_from_csv import VideoDownloader, download_options
+
+
+def run(n_urls: int = 200):
+    """Measures the setup overhead of both approaches.
+
+    :param n_urls: Number of urls the setup is paid (or amortized) for.
+    :type n_urls: int, optional
+
+    :returns: A dict with the per-url overhead in seconds of the 'per_call' and of the 'reused' approaches.
+    :rtype: dict
+    """
+    save_dir = tempfile.gettempdir() + '/'
+
+    start = time.perf_counter()
+    for _ in range(n_urls):
+        with youtube_dl.YoutubeDL(download_options(save_dir)) as ydl:
+            ydl.get_info_extractor('Youtube')
+    per_call = (time.perf_counter() - start) / n_urls
+
+    downloader = VideoDownloader(save_dir)
+    downloader.urls = n_urls  # As if it had downloaded n_urls videos
+    reused = downloader.overhead_per_url
+
+    print(f'YoutubeDL per call: {1000 * per_call:.2f}ms per url')
+    print(f'Reused VideoDownloader: {1000 * reused:.3f}ms per url ({1000 * downloader.setup_time:.2f}ms setup)')
+    print(f'Saved: {n_urls * (per_call - reused):.2f}s over {n_urls} urls')
+    return {'per_call': per_call, 'reused': reused}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the setup overhead of YoutubeDL instances.')
+    parser.add_argument("--urls", type=int, help="Number of urls", default=200)
+    args = parser.parse_args()
+
+    run(args.urls)
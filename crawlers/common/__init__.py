@@ -0,0 +1,4 @@
+#import sys
+#sys.path.append('.')  # Used for Sphinx
+#sys.path.append('..')  # Used for Sphinx
+#sys.path.append('../..')  # Used for Sphinx
@@ -0,0 +1,106 @@
+"""Content Store
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides a content-addressed store for the downloaded videos: each
+file is stored once, under the digest of its content, so that the same video
+downloaded under different ids (or from different platforms) takes its space a
+single time. The files keep being available under their usual names, as hard
+links to the stored file (symbolic links when the save dir and the store are
+in different filesystems), and every name is recorded with its digest in the
+manifest of the store.
+
+The crawlers hash the content while writing it, so storing a file does not
+read it again, see ``download_file``.
+
+This file can also be imported as a module and contains the following
+classes:
+
+    * ContentStore - Stores files once under the digest of their content.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+
+class ContentStore:
+    """Stores files once under the digest of their content, ``<store_dir>/objects/<ab>/<digest>.<ext>``.
+
+    :param store_dir: Path to the store, it is created if it does not exist.
+    :type store_dir: str
+
+    :param algorithm: Name of the hashlib algorithm used to digest the files.
+    :type algorithm: str, optional
+    """
+
+    def __init__(self, store_dir: str, algorithm: str = 'sha256'):
+        self.store_dir = store_dir
+        self.algorithm = algorithm
+        self.manifest_path = os.path.join(store_dir, 'manifest.jsonl')
+        self.duplicates = 0
+        self.saved_bytes = 0
+        self._lock = threading.Lock()
+        if not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+
+    def hasher(self):
+        """Returns a new hashlib object of the store's algorithm, to digest a file while it is written."""
+        return hashlib.new(self.algorithm)
+
+    def hash_file(self, file_path: str, chunk_size: int = 1024 * 1024):
+        """Digests a file that was written without hashing it.
+
+        :returns: The hex digest of the file.
+        :rtype: str
+        """
+        hasher = self.hasher()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def object_path(self, digest: str, extension: str = ''):
+        """Returns the path of the stored file of a digest."""
+        name = digest + '.' + extension if extension else digest
+        return os.path.join(self.store_dir, 'objects', digest[:2], name)
+
+    def add(self, file_path: str, digest: str = None):
+        """Moves a file into the store (or drops it, if its content is already stored) and links it back in place.
+
+        :param file_path: Path to the downloaded file, it keeps being available at this path.
+        :type file_path: str
+
+        :param digest: Hex digest of the file, computed while it was written. The file is read to digest it if not
+            given.
+        :type digest: str, optional
+
+        :returns: The digest of the file.
+        :rtype: str
+        """
+        if digest is None:
+            digest = self.hash_file(file_path)
+        name = os.path.basename(file_path)
+        extension = name.partition('.')[2]
+        object_path = self.object_path(digest, extension)
+        size = os.path.getsize(file_path)
+        with self._lock:
+            if os.path.exists(object_path):
+                os.remove(file_path)
+                self.duplicates += 1
+                self.saved_bytes += size
+            else:
+                if not os.path.exists(os.path.dirname(object_path)):
+                    os.makedirs(os.path.dirname(object_path))
+                shutil.move(file_path, object_path)  # A rename, unless the store is in another filesystem
+            try:
+                os.link(object_path, file_path)
+            except OSError:
+                os.symlink(os.path.abspath(object_path), file_path)
+            with open(self.manifest_path, 'a') as manifest:
+                manifest.write(json.dumps({'path': os.path.abspath(file_path), 'digest': digest, 'size': size}) + '\n')
+        return digest
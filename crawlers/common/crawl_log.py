@@ -0,0 +1,191 @@
+"""Crawl Log
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides the logging of the crawlers: events are printed to the
+console as plain messages and written to a log file as JSON lines carrying
+their structured fields (video id, status, bytes, latency, HTTP status...),
+through a single buffered handler over a rotating file. A metrics reporter
+periodically logs a summary of the counters of a run (and flushes the buffer),
+so that long runs can be followed and tuned from the log file.
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * setup_logging - Configures the console and the buffered, rotating JSON file handlers of a logger.
+    * close_logging - Flushes and removes the handlers added by setup_logging.
+    * event - Logs a message along with structured fields.
+
+and the following classes:
+
+    * JsonFormatter - Formats each log record as a JSON line.
+    * MetricsReporter - Periodically logs a summary of the counters of a run.
+"""
+
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+
+# Name of the logger of the crawlers, its children (e.g. 'crawlers.rnp') share its handlers
+LOGGER_NAME = 'crawlers'
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each log record as a JSON line with its time, level, logger, message and structured fields."""
+
+    def format(self, record: logging.LogRecord):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(log_dir: str = None, file_name: str = 'crawl.log', name: str = LOGGER_NAME,
+                  max_bytes: int = 64 * 1024 * 1024, backup_count: int = 5, buffer_capacity: int = 256,
+                  console: bool = True):
+    """Configures the console and the buffered, rotating JSON file handlers of a logger.
+
+    :param log_dir: Directory of the log file. If None, events are only printed to the console.
+    :type log_dir: str, optional
+
+    :param file_name: Name of the log file.
+    :type file_name: str, optional
+
+    :param name: Name of the logger.
+    :type name: str, optional
+
+    :param max_bytes: Size at which the log file is rotated (renamed to ``<file_name>.1`` and so on).
+    :type max_bytes: int, optional
+
+    :param backup_count: Number of rotated log files kept.
+    :type backup_count: int, optional
+
+    :param buffer_capacity: Number of events buffered before they are written to the file. Warnings and errors are
+        written at once, along with the events buffered before them.
+    :type buffer_capacity: int, optional
+
+    :param console: Whether to print the messages to the console.
+    :type console: bool, optional
+
+    :returns: The configured logger (its previous handlers are removed), to be closed with close_logging.
+    :rtype: logging.Logger
+    """
+    logger = logging.getLogger(name)
+    close_logging(logger)  # Handlers left by a previous run that was not closed
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(console_handler)
+    if log_dir:
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        file_handler = logging.handlers.RotatingFileHandler(os.path.join(log_dir, file_name), maxBytes=max_bytes,
+                                                            backupCount=backup_count)
+        file_handler.setFormatter(JsonFormatter())
+        logger.addHandler(logging.handlers.MemoryHandler(buffer_capacity, flushLevel=logging.WARNING,
+                                                         target=file_handler))
+    return logger
+
+
+def close_logging(logger: logging.Logger):
+    """Flushes and removes the handlers added by setup_logging, closing the log file."""
+    for handler in list(logger.handlers):
+        handler.flush()
+        if isinstance(handler, logging.handlers.MemoryHandler) and handler.target:
+            handler.target.close()
+        handler.close()
+        logger.removeHandler(handler)
+
+
+def event(logger: logging.Logger, message: str, level: int = logging.INFO, **fields):
+    """Logs a message along with structured fields, which are written as keys of its JSON line.
+
+    :param logger: The logger, see setup_logging.
+    :type logger: logging.Logger
+
+    :param message: The human readable message, also printed to the console.
+    :type message: str
+
+    :param level: Level of the event, e.g. logging.WARNING.
+    :type level: int, optional
+
+    :param fields: Structured fields of the event, e.g. video_id='123', status='done', bytes=1024.
+    """
+    logger.log(level, message, extra={'fields': fields})
+
+
+class MetricsReporter:
+    """Periodically logs a summary of the counters of a run, with the rates since the start and since the last one.
+
+    :param logger: The logger, see setup_logging.
+    :type logger: logging.Logger
+
+    :param snapshot: Returns the current counters as a dict of numbers, e.g. CrawlCounters.snapshot.
+    :type snapshot: callable
+
+    :param interval: Seconds between two summaries.
+    :type interval: float, optional
+    """
+
+    def __init__(self, logger: logging.Logger, snapshot, interval: float = 60.0):
+        self.logger = logger
+        self.snapshot = snapshot
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-reporter', daemon=True)
+        self._start = self._last_time = time.perf_counter()
+        self._last = self.snapshot()
+
+    def report(self):
+        """Logs a summary of the counters now, and flushes the log file."""
+        now = time.perf_counter()
+        counters = self.snapshot()
+        elapsed = max(now - self._start, 1e-6)
+        window = max(now - self._last_time, 1e-6)
+        fields = dict(counters)
+        fields['elapsed'] = round(elapsed, 3)
+        for name, value in counters.items():
+            fields[name + '_per_second'] = round(value / elapsed, 3)
+            fields[name + '_per_second_recent'] = round((value - self._last.get(name, 0)) / window, 3)
+        self._last, self._last_time = counters, now
+        summary = ', '.join(f'{name}: {value}' for name, value in counters.items())
+        event(self.logger, f'Metrics after {elapsed:.0f}s: {summary}', event_type='metrics', **fields)
+        for handler in self.logger.handlers:
+            handler.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def start(self):
+        """Starts logging summaries in a background thread."""
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the background thread and logs a last summary."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.report()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
@@ -0,0 +1,223 @@
+"""Crawl State
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides a persistent store (a SQLite database) recording the state
+of every video a crawler knows about, so that an interrupted run can be resumed
+by picking up exactly the outstanding work, instead of scanning the whole listing
+or probing the filesystem.
+
+This file can also be imported as a module and contains the following
+classes:
+
+    * CrawlState - SQLite backed store of the status of each video.
+"""
+
+import sqlite3
+import threading
+import time
+
+PENDING = 'pending'
+VERSION_RESOLVED = 'version-resolved'
+DOWNLOADING = 'downloading'
+DONE = 'done'
+FAILED = 'failed'
+DENIED = 'denied'
+
+STATUSES = (PENDING, VERSION_RESOLVED, DOWNLOADING, DONE, FAILED, DENIED)
+OUTSTANDING_STATUSES = (PENDING, VERSION_RESOLVED, DOWNLOADING, FAILED, DENIED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    source TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    url TEXT,
+    format TEXT,
+    size INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL,
+    PRIMARY KEY (source, video_id)
+);
+CREATE INDEX IF NOT EXISTS videos_by_status ON videos (source, status, position);
+CREATE TABLE IF NOT EXISTS listings (
+    source TEXT PRIMARY KEY,
+    completed_at REAL NOT NULL,
+    max_videos INTEGER
+);
+"""
+
+
+class CrawlState:
+    """SQLite backed store of the status of each video, shared by the crawler workers.
+
+    Every video is identified by its ``source`` (e.g. 'rnp' or 'youtube') and its id on
+    that platform, and goes through the statuses pending, version-resolved, downloading
+    and then done, failed or denied.
+
+    :param db_path: Path to the database file, it is created if it does not exist.
+    :type db_path: str
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        columns = [row['name'] for row in self._conn.execute('PRAGMA table_info(listings)')]
+        if 'max_videos' not in columns:
+            # Listings recorded before their limit was kept may have been cut short, they count as empty
+            self._conn.execute('ALTER TABLE listings ADD COLUMN max_videos INTEGER DEFAULT 0')
+
+    def add(self, source: str, entries):
+        """Registers videos as pending, videos that are already known keep their state.
+
+        :param source: Platform the videos come from.
+        :type source: str
+
+        :param entries: Iterable of video ids, or of (video_id, url) tuples.
+
+        :returns: The number of videos that were not known before.
+        :rtype: int
+        """
+        with self._lock:
+            position = self._conn.execute('SELECT COALESCE(MAX(position), -1) + 1 FROM videos WHERE source = ?',
+                                          (source,)).fetchone()[0]
+            before = self._conn.total_changes
+            self._conn.execute('BEGIN')
+            for entry in entries:
+                video_id, url = entry if isinstance(entry, tuple) else (entry, None)
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO videos (source, video_id, position, url, updated_at) VALUES (?, ?, ?, ?, ?)',
+                    (source, str(video_id), position, url, time.time()))
+                position += cursor.rowcount
+            self._conn.execute('COMMIT')
+            return self._conn.total_changes - before
+
+    def has_videos(self, source: str):
+        """Checks if any video of the source was already registered.
+
+        :rtype: bool
+        """
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM videos WHERE source = ? LIMIT 1', (source,)).fetchone() is not None
+
+    def mark_listing_complete(self, source: str, max_videos: int = None):
+        """Records that the listing of the source was registered, so later runs can resume from the stored videos
+        alone instead of going through the listing again.
+
+        :param source: Platform the videos come from.
+        :type source: str
+
+        :param max_videos: Limit of videos the listing was cut at, None if it was listed to the end.
+        :type max_videos: int, optional
+        """
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO listings (source, completed_at, max_videos) VALUES (?, ?, ?)',
+                               (source, time.time(), max_videos))
+
+    def listing_complete(self, source: str, max_videos: int = None):
+        """Checks if the listing of the source was registered up to a limit, see mark_listing_complete. A run
+        interrupted while registering the listing leaves it incomplete, and a listing cut at a lower limit does not
+        cover a larger one.
+
+        :param source: Platform the videos come from.
+        :type source: str
+
+        :param max_videos: Number of videos of the listing needed, None for the whole listing.
+        :type max_videos: int, optional
+
+        :rtype: bool
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT max_videos FROM listings WHERE source = ?', (source,)).fetchone()
+        return row is not None and (row['max_videos'] is None or
+                                    (max_videos is not None and max_videos <= row['max_videos']))
+
+    def get(self, source: str, video_id: str):
+        """Returns the stored state of a video.
+
+        :returns: A dict with the columns of the video, or None if the video is unknown.
+        :rtype: dict
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM videos WHERE source = ? AND video_id = ?',
+                                     (source, str(video_id))).fetchone()
+        return dict(row) if row else None
+
+    def outstanding(self, source: str, max_attempts: int = None):
+        """Lists the videos that still have to be downloaded, in the order they were registered.
+
+        :param source: Platform the videos come from.
+        :type source: str
+
+        :param max_attempts: Videos that were already attempted this many times are left out.
+        :type max_attempts: int, optional
+
+        :returns: A list of dicts, one per video, with the columns of the video.
+        :rtype: list
+        """
+        query = 'SELECT * FROM videos WHERE source = ? AND status IN (%s)' % ','.join('?' * len(OUTSTANDING_STATUSES))
+        params = [source, *OUTSTANDING_STATUSES]
+        if max_attempts is not None:
+            query += ' AND attempts < ?'
+            params.append(max_attempts)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY position', params).fetchall()
+        return [dict(row) for row in rows]
+
+    def mark(self, source: str, video_id: str, status: str, url: str = None, video_format: str = None,
+             size: int = None, new_attempt: bool = False):
+        """Updates the status of a video, the other given fields are stored along with it.
+
+        :param source: Platform the video comes from.
+        :type source: str
+
+        :param video_id: Id of the video.
+        :type video_id: str
+
+        :param status: One of the statuses in ``STATUSES``.
+        :type status: str
+
+        :param url: Resolved url of the video file.
+        :type url: str, optional
+
+        :param video_format: Format (extension) of the video file.
+        :type video_format: str, optional
+
+        :param size: Size in bytes of the video file.
+        :type size: int, optional
+
+        :param new_attempt: Whether to count this update as a new attempt to download the video.
+        :type new_attempt: bool, optional
+        """
+        if status not in STATUSES:
+            raise ValueError(f'Unknown status: {status}')
+        with self._lock:
+            self._conn.execute(
+                'UPDATE videos SET status = ?, url = COALESCE(?, url), format = COALESCE(?, format), '
+                'size = COALESCE(?, size), attempts = attempts + ?, updated_at = ? WHERE source = ? AND video_id = ?',
+                (status, url, video_format, size, int(new_attempt), time.time(), source, str(video_id)))
+
+    def counts(self, source: str):
+        """Counts the videos of a source in each status.
+
+        :returns: A dict mapping each status to its number of videos.
+        :rtype: dict
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM videos WHERE source = ? GROUP BY status',
+                                      (source,)).fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update({status: n for status, n in rows})
+        return counts
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._conn.close()
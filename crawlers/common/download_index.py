@@ -0,0 +1,158 @@
+"""Download Index
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides an in-memory index of the videos already downloaded to a
+directory, built with a single scan of the directory at startup, so that the
+crawlers can check if a video was downloaded without probing the filesystem
+once per video (which is slow on network filesystems with millions of files).
+The index can be persisted to a file and is updated as new videos are downloaded.
+
+This file can also be imported as a module and contains the following
+classes:
+
+    * DownloadIndex - Maps the id of each downloaded video to its extension and size.
+"""
+
+import json
+import os
+import threading
+import time
+
+# Containers youtube_dl (and the Video@RNP API) may produce
+VIDEO_EXTENSIONS = ('mp4', 'webm', 'mkv', 'flv', 'f4v', '3gp', 'mov', 'avi', 'm4v', 'ogv', 'ogg', 'm4a', 'mp3',
+                    'opus', 'aac', 'wav')
+
+
+class DownloadIndex:
+    """Maps the id of each downloaded video to its extension and size.
+
+    Files are expected to be named ``<id>.<ext>``, as both crawlers save them. Partial files (e.g. ``.part``) and
+    intermediate youtube_dl files (e.g. ``<id>.f137.mp4``) are not indexed.
+
+    :param save_dir: Path to the directory where the videos are saved.
+    :type save_dir: str
+
+    :param index_path: If given, the index is loaded from this file and only the files that are not in it yet are
+        looked up (their sizes are read), then it can be written back with :meth:`save`.
+    :type index_path: str, optional
+
+    :param extensions: Extensions of the files that count as downloaded videos.
+    :type extensions: tuple, optional
+    """
+
+    def __init__(self, save_dir: str, index_path: str = None, extensions: tuple = VIDEO_EXTENSIONS):
+        self.save_dir = save_dir
+        self.index_path = index_path
+        self.extensions = {extension.lower() for extension in extensions}
+        self._lock = threading.Lock()
+        self._videos = {}
+        self._files = {}  # (st_dev, st_ino) of the file of each video, videos linked to a content store may share one
+        start = time.perf_counter()
+        self._build()
+        self.build_time = time.perf_counter() - start
+
+    def _build(self):
+        known = {}
+        if self.index_path and os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                known = {video_id: tuple(entry) for video_id, entry in json.load(f).items()}
+        if not os.path.isdir(self.save_dir):
+            return
+        device = os.stat(self.save_dir).st_dev
+        with os.scandir(self.save_dir) as entries:
+            for entry in entries:
+                video_id, _, extension = entry.name.partition('.')
+                if extension.lower() not in self.extensions:
+                    continue
+                if video_id in known and known[video_id][0] == extension:
+                    self._videos[video_id] = known[video_id]
+                elif entry.is_file():
+                    self._videos[video_id] = (extension, entry.stat().st_size)
+                else:
+                    continue
+                if entry.is_symlink():
+                    stat = entry.stat()
+                    self._files[video_id] = (stat.st_dev, stat.st_ino)
+                else:
+                    self._files[video_id] = (device, entry.inode())  # Read along with the name, without a stat
+
+    def _file(self, video_id: str, extension: str):
+        try:
+            stat = os.stat(os.path.join(self.save_dir, f'{video_id}.{extension}'))
+        except OSError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def get(self, video_id: str):
+        """Returns the extension and size of a downloaded video.
+
+        :returns: An (extension, size) tuple, or None if the video was not downloaded.
+        :rtype: tuple
+        """
+        with self._lock:
+            return self._videos.get(str(video_id))
+
+    def is_downloaded(self, video_id: str, min_size: int = 1):
+        """Checks if a video was downloaded, with at least min_size bytes.
+
+        :rtype: bool
+        """
+        entry = self.get(video_id)
+        return entry is not None and entry[1] >= min_size
+
+    def __contains__(self, video_id):
+        return self.is_downloaded(video_id)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._videos)
+
+    def total_size(self):
+        """Sum of the sizes in bytes of the downloaded videos. Videos whose files are links to the same file (e.g.
+        duplicates in a content store) are counted once.
+
+        :rtype: int
+        """
+        with self._lock:
+            files = {}
+            for video_id, (_, size) in self._videos.items():
+                files[self._files.get(video_id, video_id)] = size
+            return sum(files.values())
+
+    def add(self, video_id: str, extension: str, size: int):
+        """Records a newly downloaded video.
+
+        :param video_id: Id of the video.
+        :type video_id: str
+
+        :param extension: Extension of the file, e.g. 'mp4'.
+        :type extension: str
+
+        :param size: Size of the file in bytes.
+        :type size: int
+        """
+        file = self._file(video_id, extension)
+        with self._lock:
+            self._videos[str(video_id)] = (extension, size)
+            if file is not None:
+                self._files[str(video_id)] = file
+
+    def remove(self, video_id: str):
+        """Forgets a video, e.g. after its file was deleted."""
+        with self._lock:
+            self._videos.pop(str(video_id), None)
+            self._files.pop(str(video_id), None)
+
+    def save(self):
+        """Writes the index to index_path, so the next run only has to look up the new files."""
+        if not self.index_path:
+            return
+        with self._lock:
+            videos = dict(self._videos)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(videos, f)
+        os.replace(tmp_path, self.index_path)
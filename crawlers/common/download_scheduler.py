@@ -0,0 +1,329 @@
+"""Download Scheduler
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides the scheduler deciding when the downloads of the crawlers
+may run, so that unattended crawls stay within their budgets instead of filling
+the disk: a storage budget (max bytes of videos kept in the save directory), a
+bandwidth budget (bytes per second and bytes per day) and a min free space on
+the disk of the save directory, below which the running downloads are stopped
+and the new ones are paused until space is freed.
+
+Each download is admitted with its expected size (e.g. the ``Content-Length``
+of its file) before it starts, which is reserved in the storage budget, and the
+bytes it receives are reported as they arrive, which paces them to the
+bandwidth budget and moves them from its reservation to the bytes used. The
+expected sizes are also used to order the queue of downloads, e.g. the smallest
+first to get the most videos out of the budgets.
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * size_priority - Builds the sort key of the queued downloads for an order, from their expected size.
+
+and the following classes:
+
+    * DownloadScheduler - Admits and paces downloads within storage, bandwidth and free space budgets.
+    * Admission - A download admitted by a DownloadScheduler.
+"""
+
+import errno
+import logging
+import shutil
+import threading
+import time
+
+from crawlers.common.crawl_log import event
+from crawlers.common.metrics import MetricsRegistry
+
+# Orders of the queued downloads: as listed by the platform, or by expected size
+ORDERS = ('listed', 'smallest', 'largest')
+
+# Length in seconds of the window of the daily bandwidth budget
+DAY = 24 * 3600
+
+# Seconds between two checks of the free space while downloads are running
+DISK_CHECK_INTERVAL = 1.0
+
+
+def size_priority(order: str):
+    """Builds the sort key of the queued downloads for an order, from their expected size. Downloads whose size is
+    unknown come after the others.
+
+    :param order: One of ORDERS.
+    :type order: str
+
+    :returns: A function of the expected size (None if unknown) giving the sort key, or None for the 'listed' order.
+    :rtype: callable
+    """
+    if order not in ORDERS:
+        raise ValueError(f'order should be one of {ORDERS}, not {order!r}.')
+    if order == 'listed':
+        return None
+    sign = 1 if order == 'smallest' else -1
+    return lambda size: (size is None, sign * (size or 0))
+
+
+class DownloadScheduler:
+    """Admits and paces downloads within storage, bandwidth and free space budgets. Safe to share between threads.
+    Budgets left as None are not enforced.
+
+    Each download is admitted with :meth:`admit` before it starts, and reports each chunk it receives and its end to
+    the :class:`Admission` it gets.
+
+    :param save_dir: Directory where the videos are saved, whose disk is watched.
+    :type save_dir: str
+
+    :param max_bytes: Storage budget, max bytes of videos in save_dir. Downloads that do not fit in what is left of
+        it are skipped. The expected size of a running download is reserved until its bytes arrive, downloads of
+        unknown size are admitted while the budget is not spent.
+    :type max_bytes: int, optional
+
+    :param used_bytes: Bytes of the videos already in save_dir, counted in the storage budget.
+    :type used_bytes: int, optional
+
+    :param bytes_per_second: Bandwidth budget, max bytes per second received by all the downloads together.
+    :type bytes_per_second: float, optional
+
+    :param bytes_per_day: Max bytes received in a day. Once they are spent, new downloads wait for the next day
+        (counted from the first bytes received), the ones running are finished.
+    :type bytes_per_day: int, optional
+
+    :param min_free_bytes: Min free space on the disk of save_dir. New downloads wait while their expected size, along
+        with what the running downloads still have to write, would leave less than this free, checking every
+        check_interval seconds. The free space is also checked while downloads run (every DISK_CHECK_INTERVAL
+        seconds), since their sizes may be unknown, and once it falls below this the running downloads are stopped.
+    :type min_free_bytes: int, optional
+
+    :param check_interval: Seconds between two checks of a paused download.
+    :type check_interval: float, optional
+
+    :param metrics: Registry where the bytes used, the paused and the skipped downloads are recorded.
+    :type metrics: MetricsRegistry, optional
+
+    :param logger: Logger where the pauses are reported, see crawl_log. By default they are printed.
+    :type logger: logging.Logger, optional
+    """
+
+    def __init__(self, save_dir: str, max_bytes: int = None, used_bytes: int = 0, bytes_per_second: float = None,
+                 bytes_per_day: int = None, min_free_bytes: int = None, check_interval: float = 60.0,
+                 metrics: MetricsRegistry = None, logger: logging.Logger = None):
+        self.save_dir = save_dir
+        self.max_bytes = max_bytes
+        self.used_bytes = used_bytes
+        self.bytes_per_second = bytes_per_second
+        self.bytes_per_day = bytes_per_day
+        self.min_free_bytes = min_free_bytes
+        self.check_interval = check_interval
+        self.metrics = metrics
+        self.logger = logger
+        self.skipped = 0
+        self.paused_seconds = 0.0
+        self._reserved = 0  # Bytes the admitted downloads expect and did not receive yet
+        self._lock = threading.Lock()
+        self._allowance = bytes_per_second or 0.0  # Bytes that can be received right away, up to a second worth
+        self._last = time.monotonic()
+        self._day_start = None  # Set when the first bytes are received
+        self._day_bytes = 0
+        self._disk_checked = time.monotonic()
+        self._disk_low = False  # Whether the last check found less than min_free_bytes free
+        if metrics is not None:
+            metrics.describe('crawler_storage_used_bytes', 'Bytes of videos in the save directory.')
+            metrics.describe('crawler_downloads_paused', 'Downloads waiting for free space or for the daily budget, '
+                                                         'by reason.')
+            metrics.describe('crawler_downloads_skipped_total', 'Downloads skipped for not fitting in the storage '
+                                                                'budget.')
+            metrics.adjust('crawler_storage_used_bytes', used_bytes)
+
+    @property
+    def needs_sizes(self):
+        """Whether the expected sizes of the downloads are used, i.e. there is a storage or a free space budget."""
+        return self.max_bytes is not None or self.min_free_bytes is not None
+
+    @property
+    def exhausted(self):
+        """Whether the storage budget is spent, no download is admitted anymore."""
+        with self._lock:
+            return self.max_bytes is not None and self.used_bytes + self._reserved >= self.max_bytes
+
+    def _report(self, message: str, level: int = logging.INFO, **fields):
+        if self.logger is not None:
+            event(self.logger, message, level, **fields)
+        else:
+            print(message)
+
+    def _count(self, n_bytes: int):
+        """Adds bytes (negative to remove them) to the bytes used, with the lock held."""
+        self.used_bytes += n_bytes
+        if self.metrics is not None:
+            self.metrics.adjust('crawler_storage_used_bytes', n_bytes)
+
+    def admit(self, expected_size: int = None):
+        """Waits until a download may start, reserving its expected size in the storage budget.
+
+        Blocks while the disk of save_dir is too full for it and while the daily budget is spent.
+
+        :param expected_size: Expected size in bytes of the file, None if unknown.
+        :type expected_size: int, optional
+
+        :returns: None if the download does not fit in what is left of the storage budget, so it should be skipped.
+            Otherwise the Admission of the download, which must be released once it is over.
+        :rtype: Admission
+        """
+        expected = expected_size or 0
+        with self._lock:
+            if self.max_bytes is not None and (self.used_bytes + self._reserved >= self.max_bytes or
+                                               self.used_bytes + self._reserved + expected > self.max_bytes):
+                self.skipped += 1
+                if self.metrics is not None:
+                    self.metrics.inc('crawler_downloads_skipped_total')
+                return None
+            self._reserved += expected
+        self._pause('disk', self._disk_wait)
+        self._pause('daily', self._daily_wait)
+        return Admission(self, expected)
+
+    def _disk_wait(self):
+        if self.min_free_bytes is None:
+            return None
+        free = shutil.disk_usage(self.save_dir).free
+        with self._lock:
+            reserved = self._reserved  # Along with the bytes the other running downloads still have to write
+            if free - reserved >= self.min_free_bytes:
+                self._disk_checked, self._disk_low = time.monotonic(), False
+                return None
+        return self.check_interval, f'{free} bytes free on the disk of {self.save_dir}, the {reserved} bytes ' \
+                                    f'expected by the downloads would leave less than {self.min_free_bytes}'
+
+    def _new_day(self, now: float):
+        """Starts a new window of the daily budget if the current one is over, with the lock held."""
+        if self._day_start is not None and now - self._day_start >= DAY:
+            self._day_start, self._day_bytes = None, 0
+
+    def _daily_wait(self):
+        if self.bytes_per_day is None:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            self._new_day(now)
+            if self._day_start is None or self._day_bytes < self.bytes_per_day:
+                return None
+            remaining = self._day_start + DAY - now
+        return min(remaining, self.check_interval), f'the {self.bytes_per_day} bytes of the day were received, ' \
+                                                    f'resuming in {remaining / 3600:.1f}h'
+
+    def _pause(self, reason: str, waiting):
+        """Sleeps while waiting returns a (seconds, message) tuple instead of None, reporting the pause once."""
+        paused = None
+        while True:
+            wait = waiting()
+            if wait is None:
+                break
+            if paused is None:
+                paused = time.monotonic()
+                self._report(f'Download paused: {wait[1]}.', logging.WARNING, event_type='pause', reason=reason)
+                if self.metrics is not None:
+                    self.metrics.adjust('crawler_downloads_paused', 1, reason=reason)
+            time.sleep(wait[0])
+        if paused is not None:
+            elapsed = time.monotonic() - paused
+            with self._lock:
+                self.paused_seconds += elapsed
+            self._report(f'Download resumed after {elapsed:.0f}s.', event_type='resume', reason=reason,
+                         paused_seconds=round(elapsed, 3))
+            if self.metrics is not None:
+                self.metrics.adjust('crawler_downloads_paused', -1, reason=reason)
+
+    def _consume(self, admission, n_bytes: int):
+        delay = 0.0
+        check = False
+        with self._lock:
+            # The bytes are no longer expected, they are used
+            self._reserved -= max(0, min(n_bytes, admission.expected_size - admission.received))
+            admission.received += n_bytes
+            self._count(n_bytes)
+            now = time.monotonic()
+            self._new_day(now)
+            if self._day_start is None:
+                self._day_start = now
+            self._day_bytes += n_bytes
+            if self.bytes_per_second:
+                self._allowance = min(self.bytes_per_second,
+                                      self._allowance + (now - self._last) * self.bytes_per_second) - n_bytes
+                self._last = now
+                if self._allowance < 0:
+                    delay = -self._allowance / self.bytes_per_second
+            if self.min_free_bytes is not None and now - self._disk_checked >= DISK_CHECK_INTERVAL:
+                self._disk_checked, check = now, True
+            low = self._disk_low
+        if check:
+            free = shutil.disk_usage(self.save_dir).free
+            with self._lock:
+                was_low, self._disk_low = self._disk_low, free < self.min_free_bytes
+                low = self._disk_low
+            if low and not was_low:
+                self._report(f'Downloads stopped: {free} bytes free on the disk of {self.save_dir}, less than '
+                             f'{self.min_free_bytes}.', logging.WARNING, event_type='stop', reason='disk')
+        if low:
+            admission.stopped = True
+            raise OSError(errno.ENOSPC, f'Download stopped, less than {self.min_free_bytes} bytes free on the disk of '
+                                        f'{self.save_dir}')
+        if delay:
+            time.sleep(delay)
+
+    def _release(self, admission, size: int):
+        with self._lock:
+            self._reserved -= max(0, admission.expected_size - admission.received)
+            # The bytes kept may differ from the ones received (none if it failed, more if it resumed a partial file)
+            self._count(size - admission.received)
+
+    def remove(self, n_bytes: int):
+        """Uncounts the bytes of a video that no longer counts in save_dir, e.g. a bad file moved out of the way.
+
+        :param n_bytes: Size of the video.
+        :type n_bytes: int
+        """
+        with self._lock:
+            self._count(-n_bytes)
+
+
+class Admission:
+    """A download admitted by a DownloadScheduler, see DownloadScheduler.admit.
+
+    :param scheduler: The scheduler that admitted the download.
+    :type scheduler: DownloadScheduler
+
+    :param expected_size: Expected size in bytes of the file, 0 if unknown.
+    :type expected_size: int
+    """
+
+    def __init__(self, scheduler: DownloadScheduler, expected_size: int):
+        self.scheduler = scheduler
+        self.expected_size = expected_size
+        self.received = 0
+        self.stopped = False  # Whether the download was stopped for the lack of free space
+        self._released = False
+
+    def consume(self, n_bytes: int):
+        """Counts bytes received by the download, waiting as long as needed to keep to the bandwidth budget.
+
+        Raises an OSError (ENOSPC) once the disk of save_dir has less than the min free space of the scheduler, which
+        stops the download. The bytes received are kept in its ``.part`` file, to be resumed by a later run.
+
+        :param n_bytes: Number of bytes received (and written to save_dir).
+        :type n_bytes: int
+        """
+        self.scheduler._consume(self, n_bytes)
+
+    def release(self, size: int):
+        """Ends the download, freeing what is left of its reservation. Only the bytes of the file kept count as used
+        from then on. Calling it again has no effect.
+
+        :param size: Size in bytes of the file kept in save_dir, 0 if the download failed.
+        :type size: int
+        """
+        if not self._released:
+            self._released = True
+            self.scheduler._release(self, size)
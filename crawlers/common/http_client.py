@@ -0,0 +1,302 @@
+"""HTTP Client
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides the HTTP layer shared by the crawlers: a pooled session
+(so that connections are kept alive and reused between requests, with a limit
+of connections per host) and a pluggable retry policy, by default exponential
+backoff with jitter that honors the ``Retry-After`` header of 429 and 503
+responses.
+
+This tool requires `requests` to be installed within the Python
+environment you are running this tool in.
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * retry_after_seconds - Reads the ``Retry-After`` header of a response.
+    * default_client - Returns the HttpClient shared by default by the crawlers.
+    * iter_body - Iterates over the body of a streamed response in large chunks, reusing a single buffer.
+
+and the following classes:
+
+    * RetryPolicy - Exponential backoff with jitter, honoring ``Retry-After``.
+    * HttpClient - Pooled requests session that retries failed requests following a RetryPolicy.
+"""
+
+import email.utils
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from crawlers.common.rate_limiter import AdaptiveRateLimiter, host_of
+from crawlers.common.metrics import MetricsRegistry, endpoint_of
+
+# Size in bytes of the chunks in which response bodies are read
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter, honoring ``Retry-After``.
+
+    Subclass it and override :meth:`should_retry` and :meth:`delay` to plug in another policy.
+
+    :param max_retries: Max number of retries of a request (0 disables retries).
+    :type max_retries: int, optional
+
+    :param backoff_factor: The n-th retry waits up to ``backoff_factor * 2 ** n`` seconds.
+    :type backoff_factor: float, optional
+
+    :param max_backoff: Max wait in seconds between two attempts, also caps ``Retry-After``.
+    :type max_backoff: float, optional
+
+    :param jitter: Whether to wait a random time between zero and the backoff ("full jitter"), so that workers
+        throttled at the same moment do not retry at the same moment.
+    :type jitter: bool, optional
+
+    :param retry_statuses: Response statuses that are retried.
+    :type retry_statuses: tuple, optional
+    """
+
+    def __init__(self, max_retries: int = 3, backoff_factor: float = 1.0, max_backoff: float = 300.0,
+                 jitter: bool = True, retry_statuses: tuple = (429, 500, 502, 503, 504)):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = retry_statuses
+
+    def should_retry(self, attempt: int, response: requests.Response = None, exception: Exception = None):
+        """Decides if a request that failed should be sent again.
+
+        :param attempt: Number of the attempt that failed, starting at 0.
+        :type attempt: int
+
+        :param response: The response of the attempt, if any.
+        :type response: requests.Response, optional
+
+        :param exception: The exception raised by the attempt, if any.
+        :type exception: Exception, optional
+
+        :rtype: bool
+        """
+        if attempt >= self.max_retries:
+            return False
+        if exception is not None:
+            return isinstance(exception, (requests.ConnectionError, requests.Timeout))
+        return response is not None and response.status_code in self.retry_statuses
+
+    def delay(self, attempt: int, response: requests.Response = None):
+        """Computes how long to wait before the next attempt.
+
+        :param attempt: Number of the attempt that failed, starting at 0.
+        :type attempt: int
+
+        :param response: The response of the attempt, if any.
+        :type response: requests.Response, optional
+
+        :returns: The wait in seconds.
+        :rtype: float
+        """
+        retry_after = retry_after_seconds(response) if response is not None and response.status_code in (429, 503) \
+            else None
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        backoff = min(self.backoff_factor * 2 ** attempt, self.max_backoff)
+        return random.uniform(0, backoff) if self.jitter else backoff
+
+
+def retry_after_seconds(response: requests.Response):
+    """Reads the ``Retry-After`` header of a response, given either in seconds or as a HTTP date.
+
+    :returns: The wait in seconds, or None if the header is missing or invalid.
+    :rtype: float
+    """
+    value = response.headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """Pooled requests session that retries failed requests following a RetryPolicy.
+
+    The session keeps connections alive between requests and is safe to share between worker threads. At most
+    ``pool_maxsize`` connections are opened to each host, further requests wait for a free connection.
+
+    :param pool_maxsize: Max number of connections kept open to each host.
+    :type pool_maxsize: int, optional
+
+    :param retry_policy: Policy deciding which failed requests are retried and how long to wait. Defaults to a
+        RetryPolicy with its default parameters.
+    :type retry_policy: RetryPolicy, optional
+
+    :param headers: Headers sent with every request.
+    :type headers: dict, optional
+
+    :param rate_limiter: If given, every attempt of the rate limited requests (see :meth:`request`) waits for its turn
+        in the limiter, which is told the outcome of each attempt (throttled, failed or successful) so it can tune the
+        pace of each host.
+    :type rate_limiter: AdaptiveRateLimiter, optional
+
+    :param metrics: If given, the latency of every attempt (per endpoint), its outcome and the retries are recorded in
+        it. The crawlers record their own metrics (bytes downloaded, videos...) in the same registry.
+    :type metrics: MetricsRegistry, optional
+    """
+
+    def __init__(self, pool_maxsize: int = 10, retry_policy: RetryPolicy = None, headers: dict = None,
+                 rate_limiter: AdaptiveRateLimiter = None, metrics: MetricsRegistry = None):
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe('crawler_http_request_seconds', 'Latency of the requests, up to their response headers.')
+            metrics.describe('crawler_http_requests_total', 'Requests sent, by host and response status.')
+            metrics.describe('crawler_http_retries_total', 'Requests sent again after a failure or throttling.')
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def request(self, method: str, url: str, rate_limited: bool = True, **kwargs):
+        """Sends a request, retrying it while the retry policy allows.
+
+        Only the sending of the request and its status are retried, errors while reading a streamed body are left to
+        the caller.
+
+        :param method: HTTP method, e.g. 'GET'.
+        :type method: str
+
+        :param url: Url of the request.
+        :type url: str
+
+        :param rate_limited: Whether the request is paced by the rate limiter, e.g. the calls to the API of a platform.
+            File downloads (and their segments and HEAD requests) are not, so they do not wait behind the API budget.
+        :type rate_limited: bool, optional
+
+        :param kwargs: Any other argument accepted by ``requests.Session.request`` (params, headers, stream, ...).
+
+        :returns: The last response received.
+        :rtype: requests.Response
+        """
+        host = host_of(url)
+        rate_limiter = self.rate_limiter if rate_limited else None
+        attempt = 0
+        while True:
+            if rate_limiter:
+                rate_limiter.acquire(host)
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except Exception as e:
+                self._record(url, host, start, 'error')
+                if rate_limiter:
+                    rate_limiter.failure(host)
+                if not self.retry_policy.should_retry(attempt, exception=e):
+                    raise
+                self._record_retry(host)
+                time.sleep(self.retry_policy.delay(attempt))
+                attempt += 1
+                continue
+            self._record(url, host, start, response.status_code)
+            if rate_limiter:
+                self._report(host, response)
+            if not self.retry_policy.should_retry(attempt, response=response):
+                return response
+            self._record_retry(host)
+            wait = self.retry_policy.delay(attempt, response)
+            response.close()
+            time.sleep(wait)
+            attempt += 1
+
+    def _record(self, url: str, host: str, start: float, status):
+        """Records the latency (up to the response headers, for streamed requests) and outcome of an attempt."""
+        if self.metrics is not None:
+            self.metrics.observe('crawler_http_request_seconds', time.perf_counter() - start, endpoint=endpoint_of(url))
+            self.metrics.inc('crawler_http_requests_total', host=host, status=status)
+
+    def _record_retry(self, host: str):
+        if self.metrics is not None:
+            self.metrics.inc('crawler_http_retries_total', host=host)
+
+    def _report(self, host: str, response: requests.Response):
+        """Tells the rate limiter the outcome of a request."""
+        if response.status_code in (429, 503):
+            self.rate_limiter.throttled(host, retry_after_seconds(response))
+        elif response.status_code >= 500:
+            self.rate_limiter.failure(host)
+        elif response.status_code < 400:
+            self.rate_limiter.success(host)
+
+    def get(self, url: str, **kwargs):
+        """Sends a GET request, see :meth:`request`."""
+        return self.request('GET', url, **kwargs)
+
+    def close(self):
+        """Closes every pooled connection."""
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client():
+    """Returns the HttpClient shared by default by the crawlers, creating it on the first call.
+
+    :rtype: HttpClient
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
+
+
+def iter_body(response: requests.Response, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Iterates over the body of a streamed response in large chunks, reusing a single buffer.
+
+    When the body is sent as is (no ``Content-Encoding``), it is read with ``readinto`` straight from the connection
+    into a preallocated buffer, and each chunk is a memoryview of that buffer: no bytes object is allocated (nor
+    copied by urllib3) per chunk. A chunk is only valid until the next one is read, so it must be written (or
+    hashed) right away. Compressed bodies are decoded by ``iter_content`` instead.
+
+    Either way the whole body is never held in memory, and once it is read the connection goes back to the pool.
+
+    :param response: A response requested with ``stream=True``.
+    :type response: requests.Response
+
+    :param chunk_size: Max size in bytes of each chunk.
+    :type chunk_size: int, optional
+
+    :returns: A generator of chunks (memoryviews or bytes).
+    :rtype: generator
+    """
+    source = getattr(response.raw, '_fp', None)  # The http.client response under urllib3
+    if response.headers.get('content-encoding', 'identity') != 'identity' or not hasattr(source, 'readinto'):
+        yield from response.iter_content(chunk_size)
+        return
+    view = memoryview(bytearray(chunk_size))
+    while True:
+        n_bytes = source.readinto(view)
+        if not n_bytes:
+            break
+        yield view[:n_bytes]
+    # The body was read under urllib3, draining the (now empty) iterator marks it consumed so that the connection is
+    # released to the pool instead of closed
+    for _ in response.iter_content(chunk_size):
+        pass
@@ -0,0 +1,380 @@
+"""Metrics
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides live metrics of the crawlers: counters, gauges and
+histograms (bytes downloaded per worker, request latency per endpoint, retries,
+queue depth, denied videos...) kept in memory and exposed in the Prometheus
+text format, either on a local HTTP endpoint (``/metrics``) or in a file
+rewritten periodically (e.g. for the textfile collector of node_exporter), so
+that the crawl rate can be followed on dashboards without tailing the logs.
+
+It also provides a progress bar throttled by time, instead of redrawn on every
+chunk written.
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * endpoint_of - Returns the endpoint of a url, with its ids replaced by a placeholder.
+
+and the following classes:
+
+    * MetricsRegistry - Thread-safe counters, gauges and histograms rendered in the Prometheus text format.
+    * MetricsServer - Serves the metrics of a registry on a local HTTP endpoint.
+    * MetricsFile - Periodically writes the metrics of a registry to a file.
+    * ByteMeter - Counts the bytes of a transfer, adding them to a counter at most once per interval.
+    * Progress - Progress bar of a download, redrawn at most once per interval.
+"""
+
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit
+
+# Upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Content type of the Prometheus text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def endpoint_of(url: str):
+    """Returns the endpoint of a url, with its ids replaced by a placeholder, so that latencies can be grouped per
+    endpoint (e.g. 'https://video.rnp.br/services/video/versions/123' gives 'video.rnp.br/services/video/versions/{id}').
+    """
+    parts = urlsplit(url)
+    segments = ['{id}' if any(c.isdigit() for c in segment) else segment for segment in parts.path.split('/')]
+    return parts.netloc + '/'.join(segments)
+
+
+def _size(n_bytes: float):
+    """Formats a number of bytes to a short human readable string, e.g. '12.3 MiB'."""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(n_bytes) < 1024.0:
+            return '%3.1f %s' % (n_bytes, unit)
+        n_bytes /= 1024.0
+    return '%.1f TiB' % n_bytes
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(labels: tuple, extra: str = None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms rendered in the Prometheus text format.
+
+    Metrics are created on their first update. Each one may have several series, one per set of labels
+    (e.g. ``registry.inc('crawler_videos_total', status='done')``).
+
+    :param buckets: Upper bounds of the buckets of the histograms.
+    :type buckets: tuple, optional
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._kinds = {}
+        self._help = {}
+        self._values = {}
+
+    def describe(self, name: str, help_text: str):
+        """Sets the help text of a metric."""
+        with self._lock:
+            self._help[name] = help_text
+
+    def _series(self, name: str, kind: str, labels: dict):
+        known = self._kinds.setdefault(name, kind)
+        if known != kind:
+            raise ValueError(f'{name} is a {known}, not a {kind}.')
+        return self._values.setdefault(name, {}), tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increments a counter."""
+        with self._lock:
+            series, key = self._series(name, 'counter', labels)
+            series[key] = series.get(key, 0) + value
+
+    def adjust(self, name: str, delta: float, **labels):
+        """Adds to a gauge, e.g. +1 when a download starts and -1 when it ends."""
+        with self._lock:
+            series, key = self._series(name, 'gauge', labels)
+            series[key] = series.get(key, 0) + delta
+
+    def set(self, name: str, value: float, **labels):
+        """Sets a gauge."""
+        with self._lock:
+            series, key = self._series(name, 'gauge', labels)
+            series[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Records an observation (e.g. a latency in seconds) in a histogram."""
+        with self._lock:
+            series, key = self._series(name, 'histogram', labels)
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for n, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][n] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def value(self, name: str, **labels):
+        """Returns the value of a counter or gauge series (the count of a histogram series), zero if unknown."""
+        with self._lock:
+            current = self._values.get(name, {}).get(tuple(sorted(labels.items())), 0)
+            return current['count'] if isinstance(current, dict) else current
+
+    def render(self):
+        """Renders every metric in the Prometheus text format.
+
+        :rtype: str
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(self._values):
+                kind = self._kinds[name]
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, current in sorted(self._values[name].items()):
+                    if kind != 'histogram':
+                        lines.append(f'{name}{_labels_text(labels)} {_number(current)}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float('inf'),), current['buckets'] + [None]):
+                        # Observations above the last bound are only counted by the +Inf bucket
+                        cumulative = current['count'] if count is None else cumulative + count
+                        le = 'le="%s"' % _number(bound)
+                        lines.append(f'{name}_bucket{_labels_text(labels, le)} {cumulative}')
+                    lines.append(f'{name}_sum{_labels_text(labels)} {_number(current["sum"])}')
+                    lines.append(f'{name}_count{_labels_text(labels)} {current["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+class ByteMeter:
+    """Counts the bytes of a transfer, adding them to a counter of a registry at most once per interval, so that
+    chunks can be counted as they are written without taking the lock of the registry for each one.
+
+    :param metrics: The registry, nothing is counted if None.
+    :type metrics: MetricsRegistry
+
+    :param name: Name of the counter.
+    :type name: str
+
+    :param interval: Min seconds between two updates of the counter.
+    :type interval: float, optional
+
+    :param labels: Labels of the series of the counter, e.g. worker='download_0'.
+    """
+
+    def __init__(self, metrics: MetricsRegistry, name: str, interval: float = 1.0, **labels):
+        self.metrics = metrics
+        self.name = name
+        self.interval = interval
+        self.labels = labels
+        self._pending = 0
+        self._last = time.perf_counter()
+
+    def add(self, n_bytes: int):
+        """Counts bytes, updating the counter if the interval has passed since the last update."""
+        if self.metrics is None:
+            return
+        self._pending += n_bytes
+        now = time.perf_counter()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.flush()
+
+    def flush(self):
+        """Adds the bytes counted since the last update to the counter."""
+        if self.metrics is not None and self._pending:
+            self.metrics.inc(self.name, self._pending, **self.labels)
+            self._pending = 0
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer:
+    """Serves the metrics of a registry on a local HTTP endpoint, ``http://<host>:<port>/metrics``, to be scraped by
+    Prometheus. Use it as a context manager, or call start and stop.
+
+    :param registry: The metrics to serve.
+    :type registry: MetricsRegistry
+
+    :param port: Port of the endpoint, zero picks a free port (see the ``port`` attribute once started).
+    :type port: int, optional
+
+    :param host: Address the endpoint listens on, only the local machine by default.
+    :type host: str, optional
+    """
+
+    def __init__(self, registry: MetricsRegistry, port: int = 0, host: str = '127.0.0.1'):
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] not in ('/', '/metrics'):
+                    handler.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', CONTENT_TYPE)
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass  # Scrapes are not worth a line in the console
+
+        self._server = _ThreadingHTTPServer((host, port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+
+    def start(self):
+        """Starts serving in a background thread."""
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+        if self._thread.is_alive():
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+class MetricsFile:
+    """Periodically writes the metrics of a registry to a file, replacing it atomically (e.g. a ``.prom`` file in
+    the directory of the textfile collector of node_exporter). Use it as a context manager, or call start and stop.
+
+    :param registry: The metrics to write.
+    :type registry: MetricsRegistry
+
+    :param path: Path to the file.
+    :type path: str
+
+    :param interval: Seconds between two writes.
+    :type interval: float, optional
+    """
+
+    def __init__(self, registry: MetricsRegistry, path: str, interval: float = 15.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-file', daemon=True)
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def write(self):
+        """Writes the current metrics now."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.registry.render())
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def start(self):
+        """Writes the metrics, then keeps writing them in a background thread."""
+        self.write()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the background thread and writes the final metrics."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.write()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+class Progress:
+    """Progress bar of a download, redrawn at most once per interval instead of on every chunk written.
+
+    :param total: Expected number of bytes, None if unknown (only the downloaded bytes and speed are shown then).
+    :type total: int, optional
+
+    :param initial: Bytes already downloaded, e.g. by a previous run that is being resumed.
+    :type initial: int, optional
+
+    :param interval: Min seconds between two redraws.
+    :type interval: float, optional
+
+    :param stream: Where the bar is drawn.
+    """
+
+    def __init__(self, total: int = None, initial: int = 0, interval: float = 0.5, stream=None):
+        self.total = total
+        self.initial = self.done = initial
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self._start = time.perf_counter()
+        self._last_draw = None
+
+    def update(self, n_bytes: int):
+        """Adds downloaded bytes, redrawing the bar if the interval has passed since the last redraw."""
+        self.done += n_bytes
+        now = time.perf_counter()
+        if self._last_draw is None or now - self._last_draw >= self.interval:
+            self._last_draw = now
+            self.draw(now)
+
+    def draw(self, now: float = None):
+        """Redraws the bar."""
+        now = now if now is not None else time.perf_counter()
+        speed = (self.done - self.initial) / max(now - self._start, 1e-6)
+        if self.total:
+            filled = int(50 * min(self.done, self.total) / self.total)
+            bar = '[%s%s], ' % ('=' * filled, ' ' * (50 - filled))
+            total = _size(self.total)
+        else:
+            bar, total = '', '?'
+        self.stream.write('\r%sSpeed: %s/s, Downloaded: %s of %s' % (bar, _size(speed), _size(self.done),
+                                                                      total))
+        self.stream.flush()
+
+    def close(self):
+        """Draws the final state of the bar and ends its line."""
+        self.draw()
+        self.stream.write('\n')
+        self.stream.flush()
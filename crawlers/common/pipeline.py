@@ -0,0 +1,189 @@
+"""Pipeline
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides a staged producer/consumer pipeline: items flow from a
+source through a sequence of stages (e.g. version resolver, downloader,
+verifier), each with its own pool of worker threads and a bounded queue in
+front of it. A slow stage fills its queue and, once it is full, the stages
+before it wait (back-pressure), so memory stays bounded while every stage is
+kept busy, e.g. the versions of upcoming videos are resolved while the current
+ones download.
+
+The depth of each queue, the busy workers and the latency of each stage are
+recorded in a metrics registry (and summarized by the pipeline itself), so
+that the bottleneck stage can be found.
+
+This file can also be imported as a module and contains the following
+classes:
+
+    * Stage - A step of a pipeline, run by its own worker threads.
+    * Pipeline - Runs items through a sequence of stages, with a bounded queue in front of each.
+"""
+
+import itertools
+import queue
+import threading
+import time
+
+from crawlers.common.metrics import MetricsRegistry
+
+# Marks the end of the items of a queue
+_DONE = object()
+
+
+class Stage:
+    """A step of a pipeline, run by its own worker threads.
+
+    :param name: Name of the stage, used in the metrics.
+    :type name: str
+
+    :param function: Called with each item. What it returns is handed to the next stage, unless it is None (the
+        item then leaves the pipeline, e.g. a video that failed).
+    :type function: callable
+
+    :param workers: Number of items processed at the same time.
+    :type workers: int, optional
+
+    :param queue_size: Max number of items waiting for the stage. Defaults to twice its workers.
+    :type queue_size: int, optional
+
+    :param priority: Called with each item to get its sort key. If given, the waiting items are processed in the
+        order of their keys (e.g. the smallest files first) instead of in the order they arrived. Only the items in
+        the queue are ordered, so a larger queue_size orders more of them.
+    :type priority: callable, optional
+    """
+
+    def __init__(self, name: str, function, workers: int = 1, queue_size: int = None, priority=None):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.priority = priority
+        maxsize = queue_size or 2 * self.workers
+        self.queue = queue.PriorityQueue(maxsize=maxsize) if priority else queue.Queue(maxsize=maxsize)
+        self.items = 0
+        self.seconds = 0.0
+        self.max_depth = 0
+        self._running = self.workers
+        self._lock = threading.Lock()
+        self._arrival = itertools.count()  # Keeps items of equal keys in the order they arrived
+
+    def put(self, item):
+        """Queues an item, waiting while the queue is full."""
+        if self.priority is None:
+            self.queue.put(item)
+        elif item is _DONE:
+            self.queue.put((1, None, next(self._arrival), item))  # After every item
+        else:
+            self.queue.put((0, self.priority(item), next(self._arrival), item))
+
+    def get(self):
+        """Takes the next item, waiting while the queue is empty."""
+        item = self.queue.get()
+        return item if self.priority is None else item[-1]
+
+
+class Pipeline:
+    """Runs items through a sequence of stages, with a bounded queue in front of each.
+
+    The following metrics are recorded, labeled by stage: ``crawler_stage_queue_depth`` (items waiting),
+    ``crawler_stage_busy_workers``, ``crawler_stage_seconds`` (time to process an item) and
+    ``crawler_stage_items_total``.
+
+    :param stages: The stages, in order.
+    :type stages: list
+
+    :param metrics: Registry where the metrics of the stages are recorded.
+    :type metrics: MetricsRegistry, optional
+
+    :param on_error: Called with the stage, the item and the exception when a stage raises, the item then leaves the
+        pipeline. By default the exception is printed.
+    :type on_error: callable, optional
+    """
+
+    def __init__(self, stages: list, metrics: MetricsRegistry = None, on_error=None):
+        self.stages = stages
+        self.metrics = metrics
+        self.on_error = on_error or (lambda stage, item, e: print(f'Error in the {stage.name} stage: {e}'))
+        if metrics is not None:
+            metrics.describe('crawler_stage_queue_depth', 'Items waiting in the queue of each stage.')
+            metrics.describe('crawler_stage_busy_workers', 'Workers of each stage processing an item.')
+            metrics.describe('crawler_stage_seconds', 'Time each stage takes to process an item.')
+            metrics.describe('crawler_stage_items_total', 'Items processed by each stage.')
+
+    def _put(self, position: int, item):
+        """Queues an item for a stage, waiting while its queue is full."""
+        stage = self.stages[position]
+        if item is not _DONE and self.metrics is not None:
+            self.metrics.adjust('crawler_stage_queue_depth', 1, stage=stage.name)
+        stage.put(item)
+        if item is not _DONE:
+            depth = stage.queue.qsize()
+            with stage._lock:
+                stage.max_depth = max(stage.max_depth, depth)
+
+    def _work(self, position: int):
+        stage = self.stages[position]
+        while True:
+            item = stage.get()
+            if item is _DONE:
+                break
+            if self.metrics is not None:
+                self.metrics.adjust('crawler_stage_queue_depth', -1, stage=stage.name)
+                self.metrics.adjust('crawler_stage_busy_workers', 1, stage=stage.name)
+            start = time.perf_counter()
+            try:
+                result = stage.function(item)
+            except Exception as e:
+                result = None
+                self.on_error(stage, item, e)
+            elapsed = time.perf_counter() - start
+            with stage._lock:
+                stage.items += 1
+                stage.seconds += elapsed
+            if self.metrics is not None:
+                self.metrics.adjust('crawler_stage_busy_workers', -1, stage=stage.name)
+                self.metrics.observe('crawler_stage_seconds', elapsed, stage=stage.name)
+                self.metrics.inc('crawler_stage_items_total', stage=stage.name)
+            if result is not None and position + 1 < len(self.stages):
+                self._put(position + 1, result)
+        with stage._lock:
+            stage._running -= 1
+            last = stage._running == 0
+        if last and position + 1 < len(self.stages):
+            # Every item of this stage was handed over, the next one can finish once it is done with them
+            for _ in range(self.stages[position + 1].workers):
+                self._put(position + 1, _DONE)
+
+    def run(self, items):
+        """Runs items through every stage, returning once all of them left the pipeline.
+
+        The items are read from the iterable as the first stage has room for them, so it may be a lazily parsed
+        catalog.
+
+        :param items: Iterable of the items handed to the first stage.
+        """
+        threads = [threading.Thread(target=self._work, args=(position,), name=f'{stage.name}_{n}', daemon=True)
+                   for position, stage in enumerate(self.stages) for n in range(stage.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for item in items:
+                self._put(0, item)
+        finally:
+            for _ in range(self.stages[0].workers):
+                self._put(0, _DONE)
+            for thread in threads:
+                thread.join()
+
+    def stats(self):
+        """Summarizes each stage.
+
+        :returns: A dict mapping the name of each stage to the number of 'items' it processed, the 'mean_seconds' it
+            took for each and the 'max_depth' its queue reached.
+        :rtype: dict
+        """
+        return {stage.name: {'items': stage.items, 'mean_seconds': round(stage.seconds / max(stage.items, 1), 4),
+                             'max_depth': stage.max_depth} for stage in self.stages}
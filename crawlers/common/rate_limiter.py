@@ -0,0 +1,166 @@
+"""Rate Limiter
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides the thread-safe rate limiter shared by the crawlers, so
+that a pool of workers can respect a single requests-per-second budget per host
+instead of each worker sleeping a fixed amount of time between requests. The
+limiter also tunes that budget from the outcome of the requests, speeding up
+while they succeed and backing off when the platform throttles them.
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * host_of - Extracts the host of a url, used as the key of the per-host state.
+
+and the following classes:
+
+    * AdaptiveRateLimiter - Per-host token buckets whose rates adapt to the server responses.
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+
+
+def host_of(url: str):
+    """Extracts the host of a url (e.g. 'video.rnp.br'), used as the key of the per-host state.
+
+    :param url: The url, or directly a host name.
+    :type url: str
+
+    :rtype: str
+    """
+    return urlparse(url).netloc or url
+
+
+class _HostBucket:
+    """Token bucket of a single host."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.consecutive_failures = 0
+
+
+class AdaptiveRateLimiter:
+    """Per-host token buckets whose rates adapt to the server responses.
+
+    Each host starts at ``rate`` requests per second. Every successful request multiplies the rate of its host by
+    ``increase_factor`` (up to ``max_rate``), while a throttled request (e.g. a 429) or ``failure_threshold``
+    consecutive failures multiply it by ``decrease_factor`` (down to ``min_rate``). This way the crawlers run close to
+    the rate the platform tolerates, instead of always waiting for the worst case.
+
+    :param rate: Initial number of requests per second of each host. ``None`` or ``0`` disables the limiter.
+    :type rate: float, optional
+
+    :param min_rate: The rate never goes below this many requests per second.
+    :type min_rate: float, optional
+
+    :param max_rate: The rate never goes above this many requests per second.
+    :type max_rate: float, optional
+
+    :param increase_factor: Factor applied to the rate after each successful request.
+    :type increase_factor: float, optional
+
+    :param decrease_factor: Factor applied to the rate after a throttled request.
+    :type decrease_factor: float, optional
+
+    :param failure_threshold: Number of consecutive failures that count as being throttled.
+    :type failure_threshold: int, optional
+
+    :param burst: Max number of requests that can be sent at once after a quiet period.
+    :type burst: float, optional
+    """
+
+    def __init__(self, rate: float = 1.0, min_rate: float = 0.005, max_rate: float = 10.0,
+                 increase_factor: float = 1.05, decrease_factor: float = 0.5, failure_threshold: int = 3,
+                 burst: float = 1.0):
+        self.rate = rate
+        self.min_rate = min(min_rate, rate) if rate else min_rate
+        self.max_rate = max(max_rate, rate) if rate else max_rate
+        self.increase_factor = increase_factor
+        self.decrease_factor = decrease_factor
+        self.failure_threshold = failure_threshold
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _bucket(self, host: str):
+        if host not in self._buckets:
+            self._buckets[host] = _HostBucket(self.rate, self.burst)
+        return self._buckets[host]
+
+    def acquire(self, host: str = ''):
+        """Blocks until the caller is allowed to send a request to the host.
+
+        :param host: The host of the request (see host_of), each host has its own rate.
+        :type host: str, optional
+
+        :returns: The time in seconds the caller waited.
+        :rtype: float
+        """
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            bucket = self._bucket(host)
+            now = time.monotonic()
+            bucket.tokens = min(bucket.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+            bucket.updated = now
+            # Tokens may go negative: each caller reserves its turn and waits for it outside the lock
+            bucket.tokens -= 1
+            wait = max(-bucket.tokens / bucket.rate if bucket.tokens < 0 else 0.0, bucket.blocked_until - now)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def success(self, host: str = ''):
+        """Reports a successful request, speeding up the host."""
+        if not self.rate:
+            return
+        with self._lock:
+            bucket = self._bucket(host)
+            bucket.consecutive_failures = 0
+            bucket.rate = min(self.max_rate, bucket.rate * self.increase_factor)
+
+    def throttled(self, host: str = '', retry_after: float = None):
+        """Reports a request refused for being too many (e.g. a 429), backing off the host.
+
+        :param host: The host of the request.
+        :type host: str, optional
+
+        :param retry_after: If given, no other request is allowed to the host for this many seconds.
+        :type retry_after: float, optional
+        """
+        if not self.rate:
+            return
+        with self._lock:
+            bucket = self._bucket(host)
+            bucket.consecutive_failures = 0
+            bucket.rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+            if retry_after:
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+
+    def failure(self, host: str = ''):
+        """Reports a failed request, the host is backed off after ``failure_threshold`` consecutive failures."""
+        if not self.rate:
+            return
+        with self._lock:
+            bucket = self._bucket(host)
+            bucket.consecutive_failures += 1
+            backoff = bucket.consecutive_failures >= self.failure_threshold
+        if backoff:
+            self.throttled(host)
+
+    def current_rate(self, host: str = ''):
+        """Returns the current number of requests per second allowed to the host.
+
+        :rtype: float
+        """
+        with self._lock:
+            return self._bucket(host).rate if self.rate else None
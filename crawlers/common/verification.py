@@ -0,0 +1,353 @@
+"""Download Verification
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This script verifies the integrity of the downloaded videos of a directory, so
+that truncated files or error pages saved as videos do not end up in a
+dataset. Each file is checked against its expected size (when known), its first
+bytes are matched against the signatures of the video (and audio) containers,
+the box structure of mp4 files is walked to detect truncation and, optionally,
+its duration is probed with ffprobe. Files are verified concurrently and the
+result of each one is recorded in a SQLite database, so later runs only verify
+new or changed files. Bad files can be re-queued: they are renamed out of the
+way (so the crawlers download them again) and marked as failed in the crawl
+state database.
+
+Usage:
+
+    $ python -m crawlers.common.verification ~/rnp_videos/ --results verification.db --workers 16 --requeue
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * sniff_container - Identifies the container of a file from its first bytes.
+    * mp4_complete - Checks that the boxes of a mp4 file span the whole file.
+    * probe_duration - Probes the duration of a video with ffprobe.
+    * verify_file - Verifies a downloaded video.
+    * verify_dir - Verifies every video of a directory concurrently.
+
+and the following classes:
+
+    * VerificationResults - SQLite backed record of the verification of each file.
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+if __package__ in (None, ''):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))  # Running as a script
+
+from crawlers.common import crawl_state
+from crawlers.common.crawl_state import CrawlState
+from crawlers.common.download_index import VIDEO_EXTENSIONS
+
+# Suffix appended to the name of the bad files that are re-queued
+BAD_SUFFIX = '.corrupt'
+
+# Top level boxes of the ISO base media file format (mp4, mov, 3gp, m4a...)
+MP4_BOXES = (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot', b'uuid', b'moof', b'mfra', b'meta',
+             b'pdin', b'sidx', b'styp', b'emsg', b'prft')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verifications (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    ok INTEGER NOT NULL,
+    reason TEXT,
+    container TEXT,
+    duration REAL,
+    verified_at REAL
+);
+"""
+
+
+def sniff_container(path: str):
+    """Identifies the container of a file from its first bytes.
+
+    :returns: 'mp4' (also m4a), 'matroska' (also webm), 'flv', 'avi', 'ogg' (also opus), 'mpegts', the audio only
+        'mp3', 'aac' and 'wav', 'html' (an error page saved in place of the video), or None if the file is not
+        recognized.
+    :rtype: str
+    """
+    with open(path, 'rb') as f:
+        head = f.read(512)
+    if head[4:8] in MP4_BOXES:
+        return 'mp4'
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'matroska'
+    if head.startswith(b'FLV'):
+        return 'flv'
+    if head.startswith(b'RIFF') and head[8:12] == b'AVI ':
+        return 'avi'
+    if head.startswith(b'OggS'):
+        return 'ogg'
+    if head[:1] == b'\x47' and head[188:189] in (b'\x47', b''):
+        return 'mpegts'
+    if head.startswith(b'RIFF') and head[8:12] == b'WAVE':
+        return 'wav'
+    if head.startswith(b'ID3'):
+        return 'mp3'  # Tagged, the frames come after the tag
+    if head[:1] == b'\xff' and len(head) > 1 and head[1] & 0xe0 == 0xe0:
+        # Frame sync of MPEG audio: layer 0 is the ADTS header of aac, the other layers are mp3
+        return 'aac' if head[1] & 0x06 == 0 else 'mp3'
+    if head.lstrip()[:15].lower().startswith((b'<!doctype', b'<html', b'<?xml', b'{')):
+        return 'html'
+    return None
+
+
+def mp4_complete(path: str):
+    """Checks that the top level boxes of a mp4 file span the whole file, which a truncated file fails.
+
+    :rtype: bool
+    """
+    size = os.path.getsize(path)
+    offset = 0
+    with open(path, 'rb') as f:
+        while offset < size:
+            f.seek(offset)
+            header = f.read(16)
+            if len(header) < 8:
+                return False
+            box_size, box_type = struct.unpack('>I4s', header[:8])
+            if box_size == 1:
+                if len(header) < 16:
+                    return False
+                box_size = struct.unpack('>Q', header[8:16])[0]
+            elif box_size == 0:
+                return True  # The last box extends to the end of the file
+            if box_size < 8:
+                return False
+            offset += box_size
+    return offset == size
+
+
+def probe_duration(path: str, ffprobe: str = 'ffprobe'):
+    """Probes the duration of a video with ffprobe.
+
+    :returns: The duration in seconds, or None if ffprobe could not read it.
+    :rtype: float
+    """
+    try:
+        output = subprocess.run([ffprobe, '-v', 'error', '-show_entries', 'format=duration', '-of',
+                                 'default=noprint_wrappers=1:nokey=1', path],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60).stdout
+        return float(output.decode().strip())
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def verify_file(path: str, expected_size: int = None, ffprobe: str = None):
+    """Verifies a downloaded video.
+
+    :param path: Path to the video.
+    :type path: str
+
+    :param expected_size: Size the file should have, e.g. the Content-Length of its download.
+    :type expected_size: int, optional
+
+    :param ffprobe: Path to the ffprobe executable. If given, the file must have a positive duration.
+    :type ffprobe: str, optional
+
+    :returns: A dict with the 'path', 'size', 'mtime', whether it is 'ok', the 'reason' it is not, its 'container'
+        and its 'duration' (if probed).
+    :rtype: dict
+    """
+    stat = os.stat(path)
+    result = {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime, 'ok': False, 'reason': None,
+              'container': None, 'duration': None}
+    if stat.st_size == 0:
+        result['reason'] = 'empty file'
+        return result
+    if expected_size is not None and stat.st_size != expected_size:
+        result['reason'] = f'size {stat.st_size} differs from the expected {expected_size}'
+        return result
+    container = result['container'] = sniff_container(path)
+    if container is None or container == 'html':
+        result['reason'] = 'not a video file' if container is None else 'error page instead of a video'
+        return result
+    if container == 'mp4' and not mp4_complete(path):
+        result['reason'] = 'truncated mp4'
+        return result
+    if ffprobe:
+        duration = result['duration'] = probe_duration(path, ffprobe)
+        if not duration or duration <= 0:
+            result['reason'] = 'ffprobe could not read a duration'
+            return result
+    result['ok'] = True
+    return result
+
+
+class VerificationResults:
+    """SQLite backed record of the verification of each file, keyed by path.
+
+    :param db_path: Path to the database file, it is created if it does not exist.
+    :type db_path: str
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, path: str):
+        """Returns the last result recorded for a file.
+
+        :returns: A dict with the fields of the result, or None if the file was never verified.
+        :rtype: dict
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM verifications WHERE path = ?', (path,)).fetchone()
+        return dict(row) if row else None
+
+    def record(self, result: dict):
+        """Records the result of the verification of a file, see verify_file."""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO verifications (path, size, mtime, ok, reason, container, duration, '
+                'verified_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (result['path'], result['size'], result['mtime'], int(result['ok']), result['reason'],
+                 result['container'], result['duration'], time.time()))
+
+    def bad(self):
+        """Lists the files whose last verification failed.
+
+        :rtype: list
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT * FROM verifications WHERE ok = 0 ORDER BY path').fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def _video_files(save_dir: str):
+    """Yields the (video_id, path) of the videos of a directory, as named by the crawlers."""
+    with os.scandir(save_dir) as entries:
+        for entry in entries:
+            video_id, _, extension = entry.name.partition('.')
+            if extension.lower() in VIDEO_EXTENSIONS and entry.is_file():
+                yield video_id, entry.path
+
+
+def verify_dir(save_dir: str, results: VerificationResults = None, workers: int = 8, ffprobe: str = None,
+               state: CrawlState = None, source: str = None, requeue: bool = False):
+    """Verifies every video of a directory concurrently.
+
+    :param save_dir: Path to the directory of the videos.
+    :type save_dir: str
+
+    :param results: Record of the verifications. Files already verified, whose size and modification time did not
+        change since, are not verified again (unless they were bad and are to be re-queued).
+    :type results: VerificationResults, optional
+
+    :param workers: Number of files verified at the same time.
+    :type workers: int, optional
+
+    :param ffprobe: Path to the ffprobe executable, to also probe the duration of each video.
+    :type ffprobe: str, optional
+
+    :param state: Crawl state database. The sizes recorded in it are checked, and re-queued videos are marked as
+        failed in it.
+    :type state: CrawlState, optional
+
+    :param source: Source of the videos in the crawl state database, e.g. 'rnp' or 'youtube'.
+    :type source: str, optional
+
+    :param requeue: Whether to re-queue the bad files: they are renamed with the BAD_SUFFIX, so the crawlers download
+        them again, and marked as failed in the crawl state.
+    :type requeue: bool, optional
+
+    :returns: A dict with the number of 'files', the ones 'skipped' (verified before), 'ok' and 'bad', and the
+        'requeued' ones.
+    :rtype: dict
+    """
+    counts = {'files': 0, 'skipped': 0, 'ok': 0, 'bad': 0, 'requeued': 0}
+
+    def verify(video_id, path):
+        known = state.get(source, video_id) if state and source else None
+        expected_size = known['size'] if known and known['status'] == crawl_state.DONE else None
+        return video_id, verify_file(path, expected_size, ffprobe)
+
+    files = iter(_video_files(save_dir))
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while len(in_flight) < 2 * workers:
+                video = next(files, None)
+                if video is None:
+                    break
+                counts['files'] += 1
+                previous = results.get(video[1]) if results else None
+                if previous and (previous['ok'] or not requeue):
+                    stat = os.stat(video[1])
+                    if previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime:
+                        counts['skipped'] += 1
+                        continue
+                in_flight.add(executor.submit(verify, *video))
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                video_id, result = future.result()
+                if results:
+                    results.record(result)
+                if result['ok']:
+                    counts['ok'] += 1
+                    continue
+                counts['bad'] += 1
+                print(f"Bad file {result['path']}: {result['reason']}")
+                if requeue:
+                    os.replace(result['path'], result['path'] + BAD_SUFFIX)
+                    if state and source and state.get(source, video_id):
+                        state.mark(source, video_id, crawl_state.FAILED)
+                    counts['requeued'] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Verify the integrity of the downloaded videos of a directory.')
+    parser.add_argument("save_dir", type=str, help="The path to the directory of the videos")
+    parser.add_argument("--results", type=str,
+                        help="Path to a database where the result of each file is kept, so that later runs only "
+                             "verify new files", default=None)
+    parser.add_argument("--workers", type=int, help="Number of files verified at the same time", default=8)
+    parser.add_argument("--ffprobe", action='store_true',
+                        help="Also probe the duration of each video with ffprobe (if it is installed)")
+    parser.add_argument("--state_db", type=str,
+                        help="Path to the crawl state database of the crawler that downloaded the videos", default=None)
+    parser.add_argument("--source", type=str, choices=['rnp', 'youtube'],
+                        help="Crawler that downloaded the videos, in the crawl state database", default='rnp')
+    parser.add_argument("--requeue", action='store_true',
+                        help="Rename the bad files out of the way, so that the crawlers download them again")
+    args = parser.parse_args()
+
+    ffprobe = shutil.which('ffprobe') if args.ffprobe else None
+    if args.ffprobe and not ffprobe:
+        print('ffprobe not found, durations will not be probed.')
+    results = VerificationResults(args.results) if args.results else None
+    state = CrawlState(args.state_db) if args.state_db else None
+    start = time.perf_counter()
+    counts = verify_dir(args.save_dir, results, args.workers, ffprobe, state, args.source, args.requeue)
+    print(f"{counts['files']} files in {time.perf_counter() - start:.1f}s: {counts['ok']} ok, {counts['bad']} bad "
+          f"({counts['requeued']} re-queued) and {counts['skipped']} verified before.")
+    if results:
+        results.close()
+    if state:
+        state.close()
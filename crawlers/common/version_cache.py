@@ -0,0 +1,140 @@
+"""Version Cache
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides a persistent cache (a SQLite database) of the versions
+the crawlers resolve for each video, e.g. the urls, formats and sizes of the
+versions of a Video@RNP video, so that reruns and audits do not ask the
+platform again for what they already know. Entries are fresh for a time to
+live, after which they are revalidated with a conditional request
+(``If-None-Match`` with the ``ETag`` they were stored with), and the least
+recently used entries are evicted once the cache holds more than its max
+number of entries. Databases created under the former name of the cache
+(MetadataCache, whose table was ``metadata``) are migrated when opened.
+
+This file can also be imported as a module and contains the following
+classes:
+
+    * VersionCache - SQLite backed cache of the versions of the videos, with a time to live and LRU eviction.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    key TEXT PRIMARY KEY,
+    record TEXT NOT NULL,
+    etag TEXT,
+    fetched_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_by_use ON versions (used_at);
+"""
+
+# Databases created before the cache was renamed store the same entries in the metadata table
+_MIGRATION = """
+ALTER TABLE metadata RENAME TO versions;
+DROP INDEX IF EXISTS metadata_by_use;
+"""
+
+
+class VersionCache:
+    """SQLite backed cache of the versions of the videos, with a time to live and LRU eviction. Safe to share
+    between threads.
+
+    :param db_path: Path to the database file, it is created if it does not exist.
+    :type db_path: str
+
+    :param ttl: Seconds an entry is fresh after it was fetched (or last revalidated). Stale entries are still
+        returned by :meth:`get`, so that they can be revalidated with their ETag.
+    :type ttl: float, optional
+
+    :param max_entries: Max number of entries kept, the least recently used ones are evicted beyond it.
+    :type max_entries: int, optional
+    """
+
+    def __init__(self, db_path: str, ttl: float = 7 * 24 * 3600, max_entries: int = 1000000):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        tables = {row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'metadata' in tables and 'versions' not in tables:
+            self._conn.executescript(_MIGRATION)
+        self._conn.executescript(_SCHEMA)
+        self._count = self._conn.execute('SELECT COUNT(*) FROM versions').fetchone()[0]
+
+    def get(self, key: str):
+        """Looks up an entry, marking it as recently used.
+
+        :param key: Key of the entry, e.g. the id of a video.
+        :type key: str
+
+        :returns: A dict with the 'record', its 'etag' (or None), the time it was 'fetched_at' and whether it is still
+            'fresh', or None if the key is not cached.
+        :rtype: dict
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT record, etag, fetched_at FROM versions WHERE key = ?',
+                                     (str(key),)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE versions SET used_at = ? WHERE key = ?', (now, str(key)))
+        record, etag, fetched_at = row
+        return {'record': json.loads(record), 'etag': etag, 'fetched_at': fetched_at,
+                'fresh': now - fetched_at < self.ttl}
+
+    def put(self, key: str, record: dict, etag: str = None):
+        """Stores an entry, replacing the previous one of the key, and evicts the least recently used entries if the
+        cache is over its max number of entries.
+
+        :param key: Key of the entry, e.g. the id of a video.
+        :type key: str
+
+        :param record: The record, e.g. the versions of a video, anything that can be serialized to JSON.
+        :type record: dict
+
+        :param etag: The ETag the record was served with, used to revalidate the entry once it is stale.
+        :type etag: str, optional
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO versions (key, record, etag, fetched_at, used_at) VALUES (?, ?, ?, ?, ?)',
+                (str(key), json.dumps(record), etag, now, now))
+            if cursor.rowcount:
+                self._count += 1
+            else:
+                self._conn.execute('UPDATE versions SET record = ?, etag = ?, fetched_at = ?, used_at = ? '
+                                   'WHERE key = ?', (json.dumps(record), etag, now, now, str(key)))
+            if self._count > self.max_entries:
+                self._conn.execute('DELETE FROM versions WHERE key IN (SELECT key FROM versions ORDER BY used_at '
+                                   'LIMIT ?)', (self._count - self.max_entries,))
+                self._count = self.max_entries
+
+    def refresh(self, key: str):
+        """Marks an entry as fresh again, e.g. after the server answered ``304 Not Modified`` to its ETag."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('UPDATE versions SET fetched_at = ?, used_at = ? WHERE key = ?', (now, now, str(key)))
+
+    def discard(self, key: str):
+        """Removes an entry, if it is cached."""
+        with self._lock:
+            self._count -= self._conn.execute('DELETE FROM versions WHERE key = ?', (str(key),)).rowcount
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._conn.close()
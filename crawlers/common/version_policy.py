@@ -0,0 +1,143 @@
+"""Version Policy
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides the policy choosing which version (rendition) of a video
+is downloaded, among the ones a platform offers: by resolution, bitrate, file
+size and format preference, taking the first, the smallest or the largest of
+the acceptable versions. Training pipelines often only need a low resolution,
+so taking the smallest acceptable version instead of the largest one cuts the
+transferred bytes and the storage by a large factor.
+
+The versions are compact dicts, e.g. as parsed from the versions endpoint of
+Video@RNP, and the same policy can be turned into a youtube_dl format string
+for the youtube tools.
+
+This file can also be imported as a module and contains the following
+classes:
+
+    * VersionPolicy - Chooses the version of a video to download.
+"""
+
+# Ways of choosing among the acceptable versions
+PREFERENCES = ('first', 'smallest', 'largest')
+
+
+class VersionPolicy:
+    """Chooses the version of a video to download. Criteria left as None are not checked, and versions missing the
+    field of a criterion are accepted.
+
+    Each version is a dict with the 'url' and 'format' of its file, its 'width' and 'height' in pixels, its
+    'bitrate' in kbps and its 'size' in bytes (any of them may be None if unknown).
+
+    :param min_height: Min height (resolution) of the version, in pixels.
+    :type min_height: int, optional
+
+    :param max_height: Max height (resolution) of the version, in pixels.
+    :type max_height: int, optional
+
+    :param max_bitrate: Max bitrate of the version, in kbps.
+    :type max_bitrate: float, optional
+
+    :param max_size: Max size of the file of the version, in bytes.
+    :type max_size: int, optional
+
+    :param formats: Preferred formats, in order (e.g. ('mp4', 'webm')). Versions of these formats are chosen over the
+        others, which are still acceptable.
+    :type formats: tuple, optional
+
+    :param prefer: Which of the acceptable versions is chosen: the 'first' one, in the order of the platform (its
+        best version, for Video@RNP and youtube), the 'smallest' or the 'largest' one (by bitrate, then resolution).
+    :type prefer: str, optional
+    """
+
+    def __init__(self, min_height: int = None, max_height: int = None, max_bitrate: float = None,
+                 max_size: int = None, formats: tuple = (), prefer: str = 'first'):
+        if prefer not in PREFERENCES:
+            raise ValueError(f'prefer should be one of {PREFERENCES}, not {prefer!r}.')
+        self.min_height = min_height
+        self.max_height = max_height
+        self.max_bitrate = max_bitrate
+        self.max_size = max_size
+        self.formats = tuple(video_format.lower() for video_format in formats)
+        self.prefer = prefer
+
+    def rejection(self, version: dict):
+        """Checks a version against every criterion.
+
+        :param version: The version.
+        :type version: dict
+
+        :returns: Why the version is rejected, or None if it is accepted.
+        :rtype: str
+        """
+        height = version.get('height')
+        if height is not None:
+            if self.min_height is not None and height < self.min_height:
+                return f'lower than {self.min_height}p ({height}p)'
+            if self.max_height is not None and height > self.max_height:
+                return f'higher than {self.max_height}p ({height}p)'
+        bitrate = version.get('bitrate')
+        if bitrate is not None and self.max_bitrate is not None and bitrate > self.max_bitrate:
+            return f'bitrate above {self.max_bitrate} kbps ({bitrate} kbps)'
+        size = version.get('size')
+        if size is not None and self.max_size is not None and size > self.max_size:
+            return f'larger than {self.max_size} bytes ({size} bytes)'
+        return None
+
+    def _rank(self, position: int, version: dict):
+        video_format = (version.get('format') or '').lower()
+        format_rank = self.formats.index(video_format) if video_format in self.formats else len(self.formats)
+        if self.prefer == 'first':
+            return format_rank, position
+        magnitude = (version.get('bitrate') or 0, (version.get('width') or 0) * (version.get('height') or 0))
+        if self.prefer == 'largest':
+            magnitude = tuple(-value for value in magnitude)
+        return (format_rank,) + magnitude + (position,)
+
+    def select(self, versions: list, size_of=None):
+        """Chooses the version to download.
+
+        :param versions: The versions of the video, in the order of the platform.
+        :type versions: list
+
+        :param size_of: Called with a version whose size is unknown to find it out (e.g. with a HEAD request), only
+            when there is a max_size and only for the versions considered, in order of preference. The size found is
+            stored in the version.
+        :type size_of: callable, optional
+
+        :returns: The chosen version, or None if no version is acceptable.
+        :rtype: dict
+        """
+        ranked = sorted(enumerate(versions), key=lambda item: self._rank(*item))
+        for _, version in ranked:
+            if self.rejection(version) is not None:
+                continue
+            if self.max_size is not None and version.get('size') is None and size_of is not None:
+                version['size'] = size_of(version)
+                if self.rejection(version) is not None:
+                    continue
+            return version
+        return None
+
+    def ytdl_format(self):
+        """Builds the youtube_dl format string of the policy, e.g. 'worst[ext=mp4][height>=?360]/worst[height>=?360]'.
+
+        Formats whose fields are unknown pass the filters, as with the versions. If no format passes them, youtube_dl
+        fails to download the video.
+
+        :rtype: str
+        """
+        base = 'worst' if self.prefer == 'smallest' else 'best'
+        filters = ''
+        if self.min_height is not None:
+            filters += f'[height>=?{self.min_height}]'
+        if self.max_height is not None:
+            filters += f'[height<=?{self.max_height}]'
+        if self.max_bitrate is not None:
+            filters += f'[tbr<=?{self.max_bitrate}]'
+        if self.max_size is not None:
+            filters += f'[filesize<=?{self.max_size}]'
+        return '/'.join([f'{base}[ext={video_format}]{filters}' for video_format in self.formats] + [base + filters])
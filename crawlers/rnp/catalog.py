@@ -0,0 +1,264 @@
+"""Video@RNP Catalog
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module keeps a local copy of the Video@RNP catalog (the listing of the
+``/services/video`` endpoint) in a SQLite database. The catalog is synced in
+fixed-size pages (``limit`` and ``offset`` parameters), several of them fetched
+in parallel, and each page is stored as soon as it arrives, so a failed request
+only costs its page and an interrupted sync picks up where it stopped.
+
+Once the catalog is stored, later syncs only fetch its tail: the last known
+page is fetched again to check that the listing did not shift (a video removed
+or inserted before it), and then only the pages after it, with the new videos.
+If the listing shifted, or when a full sync is requested, every page is fetched
+again and the entries whose fields changed are reported along with the new and
+removed ones.
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * iter_catalog - Incrementally parses the video catalog, yielding one record per video.
+    * fingerprint - Digest of the fields of a catalog record, used to detect changed entries.
+
+and the following classes:
+
+    * Catalog - Local copy of the Video@RNP catalog, synced page by page.
+"""
+
+import hashlib
+import io
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+from crawlers.common.http_client import HttpClient, default_client
+
+# Number of videos requested in each page of the catalog
+DEFAULT_PAGE_SIZE = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog (
+    video_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    record TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS catalog_by_position ON catalog (position);
+"""
+
+
+def iter_catalog(stream):
+    """Incrementally parses the video catalog, yielding one record per video.
+
+    The catalog is read from the stream as it arrives and each video element is discarded once its record is built,
+    so memory stays flat regardless of the size of the catalog (unlike building a minidom tree of the whole of it).
+
+    :param stream: A file-like object with the catalog xml (e.g. a file or the ``raw`` of a streamed response).
+
+    :returns: A generator of dicts mapping the tag of each field of a video to its text. The 'id' key always holds
+        the id of the video (the first field, as the API lists it first).
+    :rtype: generator
+    """
+    depth = 0
+    root = None
+    for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            if depth == 0:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            record = {field.tag: field.text for field in element}
+            if 'id' not in record and len(element):
+                record['id'] = element[0].text
+            root.clear()  # Drops the videos that were already yielded
+            yield record
+
+
+def fingerprint(record: dict):
+    """Digest of the fields of a catalog record, used to detect changed entries.
+
+    :rtype: str
+    """
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+class Catalog:
+    """Local copy of the Video@RNP catalog, synced page by page. The videos keep the order of the listing.
+
+    :param db_path: Path to the database file, it is created if it does not exist.
+    :type db_path: str
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM catalog').fetchone()[0]
+
+    def video_ids(self, limit: int = None, offset: int = 0):
+        """Lists the ids of the stored videos, in the order of the listing.
+
+        :param limit: Max number of ids.
+        :type limit: int, optional
+
+        :param offset: Number of videos skipped from the start of the listing.
+        :type offset: int, optional
+
+        :rtype: list
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT video_id FROM catalog WHERE position >= ? ORDER BY position LIMIT ?',
+                                      (offset, -1 if limit is None else limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def get(self, video_id: str):
+        """Returns the stored record of a video, or None if it is not in the catalog.
+
+        :rtype: dict
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT record FROM catalog WHERE video_id = ?', (str(video_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def fetch_page(self, offset: int, limit: int, api_url: str, headers: dict, http_client: HttpClient = None):
+        """Fetches a page of the catalog from the API.
+
+        :param offset: Position of the first video of the page in the listing.
+        :type offset: int
+
+        :param limit: Number of videos of the page.
+        :type limit: int
+
+        :param api_url: Base address of the Video@RNP API.
+        :type api_url: str
+
+        :param headers: Headers sent to the API (e.g. the client key).
+        :type headers: dict
+
+        :param http_client: Client used for the request, defaults to the client shared by the crawlers.
+        :type http_client: HttpClient, optional
+
+        :returns: The records of the videos of the page, see iter_catalog. Fewer than limit at the end of the listing.
+        :rtype: list
+        """
+        http_client = http_client or default_client()
+        r = http_client.get(f'{api_url}/video', params={'limit': limit, 'offset': offset}, headers=headers)
+        r.raise_for_status()
+        return list(iter_catalog(io.BytesIO(r.content)))
+
+    def _store(self, offset: int, records: list, now: float, summary: dict):
+        """Stores a page of records from the given position of the listing, noting the new and changed videos."""
+        with self._lock:
+            self._conn.execute('BEGIN')
+            for position, record in enumerate(records, offset):
+                video_id, digest = str(record['id']), fingerprint(record)
+                row = self._conn.execute('SELECT fingerprint FROM catalog WHERE video_id = ?', (video_id,)).fetchone()
+                if row is None:
+                    summary['new'].append(video_id)
+                elif row[0] != digest:
+                    summary['changed'].append(video_id)
+                self._conn.execute('INSERT OR REPLACE INTO catalog (video_id, position, fingerprint, record, synced_at)'
+                                   ' VALUES (?, ?, ?, ?, ?)', (video_id, position, digest, json.dumps(record), now))
+            self._conn.execute('COMMIT')
+
+    def sync(self, api_url: str, headers: dict, http_client: HttpClient = None, page_size: int = DEFAULT_PAGE_SIZE,
+             workers: int = 1, limit: int = None, full: bool = False):
+        """Syncs the local copy with the API, fetching only the tail of the listing when the copy is up to date.
+
+        :param api_url: Base address of the Video@RNP API.
+        :type api_url: str
+
+        :param headers: Headers sent to the API (e.g. the client key).
+        :type headers: dict
+
+        :param http_client: Client used for the requests, defaults to the client shared by the crawlers. The pace of
+            the requests is set by its rate limiter.
+        :type http_client: HttpClient, optional
+
+        :param page_size: Number of videos requested in each page.
+        :type page_size: int, optional
+
+        :param workers: Number of pages fetched at the same time.
+        :type workers: int, optional
+
+        :param limit: Only the first limit videos of the listing are synced.
+        :type limit: int, optional
+
+        :param full: Whether to fetch every page again, to find the entries that changed (a sync of the tail only finds
+            the new ones).
+        :type full: bool, optional
+
+        :returns: A dict with the number of 'pages' fetched, the ids of the 'new', 'changed' and 'removed' videos,
+            whether the sync was 'full', whether it reached the end of the listing ('complete') and the 'error' that
+            stopped it, if any.
+        :rtype: dict
+        """
+        http_client = http_client or default_client()
+        workers = max(1, workers)
+        known = len(self)
+        full = full or not known
+        summary = {'pages': 0, 'new': [], 'changed': [], 'removed': [], 'full': full, 'complete': False, 'error': None}
+        if not full and limit is not None and known >= limit:
+            return summary
+        now = time.time()
+        # A sync of the tail starts from the last known page, to check the listing did not shift
+        offset = 0 if full else max(0, known - page_size)
+        check, shifted = not full, False
+        with ThreadPoolExecutor(workers, thread_name_prefix='catalog') as executor:
+            while not (summary['complete'] or summary['error'] or shifted):
+                pages = [(page_offset, page_size if limit is None else min(page_size, limit - page_offset))
+                         for page_offset in range(offset, offset + workers * page_size, page_size)
+                         if limit is None or page_offset < limit]
+                if not pages:
+                    break  # Reached the limit
+                futures = [executor.submit(self.fetch_page, page_offset, page_limit, api_url, headers, http_client)
+                           for page_offset, page_limit in pages]
+                for (page_offset, page_limit), future in zip(pages, futures):
+                    try:
+                        records = future.result()
+                    except Exception as e:
+                        summary['error'] = str(e)
+                        break
+                    summary['pages'] += 1
+                    if check:
+                        check = False
+                        stored = self.video_ids(page_size, page_offset)
+                        if [str(record['id']) for record in records[:len(stored)]] != stored:
+                            shifted = True
+                            break
+                    self._store(page_offset, records, now, summary)
+                    if len(records) < page_limit:
+                        summary['complete'] = True
+                        break
+                for future in futures:
+                    future.cancel()
+                offset = pages[-1][0] + page_size
+        if shifted:
+            # A video was removed or inserted before the known tail, the whole listing is fetched again
+            return self.sync(api_url, headers, http_client, page_size, workers, limit, full=True)
+        if full and summary['complete']:
+            # Videos that are no longer listed
+            with self._lock:
+                rows = self._conn.execute('SELECT video_id FROM catalog WHERE synced_at < ?', (now,)).fetchall()
+                summary['removed'] = [row[0] for row in rows]
+                self._conn.execute('DELETE FROM catalog WHERE synced_at < ?', (now,))
+        return summary
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._conn.close()
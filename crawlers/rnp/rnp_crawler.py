@@ -18,20 +18,63 @@ functions:
     * scandown - Scan and print a xml tree.
     * log - Rudimentary logging function.
     * download_file - Downloads a file from the provided url.
+    * download_file_segmented - Downloads a file over several parallel connections, one per byte range.
+    * parse_versions - Parses the answer of the versions endpoint into a compact record per version.
+    * content_length - Asks the size of a file with a HEAD request.
+    * resolve_version - Resolves the version of a video to download, i.e. the url and format of its file.
+    * download_version - Downloads the resolved version of a video.
+    * verify_download - Verifies a downloaded video, moving it out of the way if it is bad.
     * crawl_and_download - Crawls the VideoAtRNP API, collecting and downloading video data.
+
+and the following classes:
+
+    * CrawlCounters - Thread-safe success/denied/failed counters shared by the download workers.
 """
 
-import requests
 import os
 import sys
-from xml.dom import minidom
+from xml.etree import ElementTree
 import time
 import datetime
 import argparse
+import errno
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+if __package__ in (None, ''):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))  # Running as a script
+
+from crawlers.common.rate_limiter import AdaptiveRateLimiter, host_of
+from crawlers.common.http_client import HttpClient, RetryPolicy, default_client, iter_body, DEFAULT_CHUNK_SIZE
+from crawlers.common import crawl_state
+from crawlers.common.crawl_state import CrawlState
+from crawlers.common.download_index import DownloadIndex
+from crawlers.common.content_store import ContentStore
+from crawlers.common.crawl_log import LOGGER_NAME, setup_logging, close_logging, event, MetricsReporter
+from crawlers.common.metrics import MetricsRegistry, MetricsServer, MetricsFile, ByteMeter, Progress
+from crawlers.common.pipeline import Pipeline, Stage
+from crawlers.common.verification import verify_file, BAD_SUFFIX
+from crawlers.common.version_cache import VersionCache
+from crawlers.common.version_policy import VersionPolicy, PREFERENCES
+from crawlers.common.download_scheduler import DownloadScheduler, Admission, ORDERS, size_priority
+from crawlers.rnp.catalog import Catalog, iter_catalog, DEFAULT_PAGE_SIZE
 
 # Please put your client key here
 CLIENT_KEY = None
 
+# Base address of the Video@RNP API
+API_URL = 'https://video.rnp.br/services'
+
+# Name of the videos of this crawler in the crawl state database
+STATE_SOURCE = 'rnp'
+
+# Lock used to keep lines written by concurrent workers from interleaving
+_LOG_LOCK = threading.Lock()
+
+# Logger of the crawler, configured by crawl_and_download
+LOGGER = logging.getLogger(LOGGER_NAME + '.rnp')
+
 
 def sizeof_fmt(n_bytes: int, suffix: str = 'B'):
     """Formats number of bytes to a human readable string.
@@ -89,14 +132,22 @@ def log(string: str, file=None):
 
      :returns: It just prints or writes the string to a file.
      """
-    print(string)
-    if file:
-        file.write(string + '\n')
+    with _LOG_LOCK:
+        print(string)
+        if file:
+            file.write(string + '\n')
 
 
-def download_file(url: str, save_dir: str, local_filename: str = None, verbose: bool = True):
+def download_file(url: str, save_dir: str, local_filename: str = None, verbose: bool = True, segments: int = 1,
+                  http_client: HttpClient = None, index: DownloadIndex = None, store: ContentStore = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE, preallocate: bool = False,
+                  admission: Admission = None):
     """Downloads a file from the provided url.
 
+    The content is first written to a ``.part`` file, which is only renamed to the final name once its size matches
+    the ``Content-Length`` announced by the server. If a ``.part`` file is left by an interrupted download, the
+    transfer is resumed from where it stopped with a ``Range`` request (or restarted if the server ignores it).
+
     :param url: Url for the file.
     :type url: str, optional
 
@@ -109,47 +160,660 @@ def download_file(url: str, save_dir: str, local_filename: str = None, verbose:
     :param verbose: Boolean to toggle wether or not to print additional content.
     :type verbose: bool, optional
 
+    :param segments: Number of parallel connections to split the file into, see download_file_segmented. Falls back
+        to a single stream if the server does not support ranges.
+    :type segments: int, optional
+
+    :param http_client: Client used for the requests, defaults to the client shared by the crawlers.
+    :type http_client: HttpClient, optional
+
+    :param index: Index of the save_dir. If given, it is consulted instead of probing the filesystem to know if the
+        file was already downloaded, and the file is added to it once downloaded.
+    :type index: DownloadIndex, optional
+
+    :param store: Content store where the file is moved (and linked back from save_dir) once downloaded. The content
+        is hashed as it is written, only the resumed part of a file (or a segmented download, which is written out
+        of order) has to be read again to be hashed.
+    :type store: ContentStore, optional
+
+    :param chunk_size: Size in bytes of each read from the connection, see iter_body.
+    :type chunk_size: int, optional
+
+    :param preallocate: Whether to reserve the whole size of the file on disk (with ``posix_fallocate``, where
+        available) before writing it, which keeps it from being fragmented and fails at once if the disk is too full.
+        The content then goes to a ``.alloc.part`` file, which is truncated to the bytes received and renamed to the
+        resumable ``.part`` file if the download fails.
+    :type preallocate: bool, optional
+
+    :param admission: Admission of the download by a DownloadScheduler, told about every chunk received, which paces
+        the download to the bandwidth budget of the scheduler.
+    :type admission: Admission, optional
+
     :returns: The size in bytes of the downloaded content, if it failed, size will be zero.
     :rtype: int
     """
 
+    http_client = http_client or default_client()
     if not local_filename:
         local_filename = url.split('/')[-1]
     localFilePath = save_dir + '/' + local_filename
-    if os.path.exists(localFilePath):
-        file_size = os.path.getsize(localFilePath)
-        if file_size >= 150:
-            print("Already downloaded, skipping!")
-            return file_size
-    with open(localFilePath, 'wb') as f:
-        start = time.clock()
+    video_id, _, extension = local_filename.partition('.')
+    if index is not None:
+        known = index.get(video_id)
+        file_size = known[1] if known and known[0] == extension else 0
+    else:
+        file_size = os.path.getsize(localFilePath) if os.path.exists(localFilePath) else 0
+    if file_size >= 150:
+        print("Already downloaded, skipping!")
+        return file_size
+
+    def completed(size, digest=None):
+        if store is not None:
+            store.add(localFilePath, digest)
+        if index is not None:
+            index.add(video_id, extension, size)
+        return size
+    partFilePath = localFilePath + '.part'
+    resume_from = os.path.getsize(partFilePath) if os.path.exists(partFilePath) else 0
+
+    if segments > 1 and not resume_from:
+        report = download_file_segmented(url, localFilePath, segments, chunk_size, http_client=http_client,
+                                         admission=admission)
+        if report is not None:
+            if verbose:
+                for segment in report['segments']:
+                    print(f"Segment {segment['start']}-{segment['end']}: {sizeof_fmt(segment['bytes'])} at "
+                          f"{sizeof_fmt(segment['throughput'])}/s")
+                print(f"Total: {sizeof_fmt(report['bytes'])} at {sizeof_fmt(report['throughput'])}/s")
+            return completed(report['bytes']) if report['complete'] else 0
+
+    try:
+        r = http_client.get(url, stream=True, headers={'Range': f'bytes={resume_from}-'} if resume_from else None,
+                            rate_limited=False)
+    except Exception as e:
+        print(e)
+        return 0
+
+    with r:
+        if r.status_code == 416 and resume_from:
+            # The range starts at the end of the file: the previous run got every byte but did not rename it
+            total_length = _content_range_total(r.headers.get('content-range'))
+            if total_length == resume_from:
+                os.replace(partFilePath, localFilePath)
+                return completed(total_length)
+            print(f'Could not resume {local_filename}, restarting the download.')
+            os.remove(partFilePath)
+            return download_file(url, save_dir, local_filename, verbose, segments, http_client, index, store,
+                                 chunk_size, preallocate, admission)
+        if r.status_code == 206 and _content_range_start(r.headers.get('content-range')) == resume_from:
+            mode = 'ab'
+            total_length = _content_range_total(r.headers.get('content-range'))
+        elif r.status_code == 200:
+            # The server ignored the range (or there was nothing to resume), so the file comes from the start
+            mode = 'wb'
+            resume_from = 0
+            total_length = r.headers.get('content-length')
+            total_length = int(total_length) if total_length is not None else None
+        else:
+            print(f'Error downloading {url}: {r.status_code} {r.reason}')
+            return 0
+
+        dl = resume_from
+        hasher = store.hasher() if store is not None else None
+        progress = Progress(total_length, resume_from) if verbose else None
+        meter = ByteMeter(http_client.metrics, 'crawler_downloaded_bytes_total',
+                          worker=threading.current_thread().name)
+        writePath = partFilePath
+        if preallocate and total_length and mode == 'wb' and hasattr(os, 'posix_fallocate'):
+            writePath = localFilePath + '.alloc.part'
         try:
-            r = requests.get(url, stream=True)
+            if hasher is not None and resume_from:
+                with open(partFilePath, 'rb') as f:
+                    for chunk in iter(lambda: f.read(chunk_size), b''):
+                        hasher.update(chunk)
+            with open(writePath, mode) as f:
+                if writePath != partFilePath and not _preallocate(f, total_length):
+                    return 0
+                # Download in chunks, each one is only valid until the next one is read
+                for chunk in iter_body(r, chunk_size):
+                    dl += len(chunk)
+                    f.write(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    meter.add(len(chunk))
+                    if progress is not None:
+                        progress.update(len(chunk))
+                    if admission is not None:
+                        admission.consume(len(chunk))
         except Exception as e:
+            # The .part file is kept so the next call can resume from it
             print(e)
             return 0
-        total_length = int(r.headers.get('content-length'))
-        dl = 0
-        if total_length is None:  # no content length header
-            f.write(r.content)
-        else:
-            # Download in chunks
-            for chunk in r.iter_content(1024):
-                dl += len(chunk)
-                f.write(chunk)
-                if verbose:
-                    done = int(50 * dl / total_length)
-                    speed_bytes = dl // (time.clock() - start)
-                    sys.stdout.write("\r[%s%s], Speed: %s Mbps, Total: %s" % (
-                        '=' * done, ' ' * (50 - done), sizeof_fmt(speed_bytes), sizeof_fmt(total_length)))
-                    sys.stdout.flush()
-        return int(r.headers.get('content-length'))
+        finally:
+            meter.flush()
+            if progress is not None:
+                progress.close()
+            if writePath != partFilePath and os.path.exists(writePath) and dl != total_length:
+                # Only the bytes received are kept, as a resumable .part file
+                if dl:
+                    os.truncate(writePath, dl)
+                    os.replace(writePath, partFilePath)
+                else:
+                    os.remove(writePath)
+
+    if total_length is not None and dl != total_length:
+        print(f'Incomplete download of {local_filename}: got {dl} of {total_length} bytes.')
+        return 0
+    os.replace(writePath, localFilePath)
+    return completed(dl, hasher.hexdigest() if hasher is not None else None)
+
+
+def _preallocate(f, size: int):
+    """Reserves the size of a file on disk.
+
+    :returns: False if the disk does not have enough free space, True otherwise (also when the filesystem does not
+        support preallocation, the file is then written as usual).
+    :rtype: bool
+    """
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            print(f'Not enough free space for {sizeof_fmt(size)}.')
+            return False
+    return True
+
+
+def download_file_segmented(url: str, local_file_path: str, segments: int = 4, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                            http_client: HttpClient = None, admission: Admission = None):
+    """Downloads a file over several parallel connections, one per byte range.
+
+    The file is preallocated to its final size and each connection writes its range directly at the right offset,
+    so nothing is reassembled in memory. The content goes to a ``.segments.part`` file, which is renamed to
+    ``local_file_path`` once every range is complete (and removed otherwise).
+
+    :param url: Url for the file.
+    :type url: str
+
+    :param local_file_path: Path where the file will be saved.
+    :type local_file_path: str
+
+    :param segments: Number of byte ranges (and connections) to split the file into.
+    :type segments: int, optional
+
+    :param chunk_size: Size in bytes of each read from the connections.
+    :type chunk_size: int, optional
+
+    :param http_client: Client used for the requests, defaults to the client shared by the crawlers. Its pool should
+        allow at least ``segments`` connections per host.
+    :type http_client: HttpClient, optional
+
+    :param admission: Admission of the download by a DownloadScheduler, told about every chunk received, see
+        download_file.
+    :type admission: Admission, optional
+
+    :returns: None if the server does not support ranges (nothing is downloaded in that case). Otherwise, a dict with
+        'complete', 'bytes', 'elapsed' and 'throughput' (bytes/s) of the whole file and a 'segments' list with the
+        'start', 'end', 'bytes', 'elapsed' and 'throughput' of each range.
+    :rtype: dict
+    """
+    http_client = http_client or default_client()
+    # Asking for the first byte tells if ranges are supported and gives the size of the file
+    try:
+        with http_client.get(url, stream=True, headers={'Range': 'bytes=0-0'}, rate_limited=False) as r:
+            total_length = _content_range_total(r.headers.get('content-range')) if r.status_code == 206 else None
+    except Exception as e:
+        print(e)
+        return None
+    if not total_length:
+        return None
+
+    segments = max(1, min(segments, total_length))
+    bounds = [(n * total_length // segments, (n + 1) * total_length // segments - 1) for n in range(segments)]
+    segments_path = local_file_path + '.segments.part'
+    with open(segments_path, 'wb') as f:
+        f.truncate(total_length)
+
+    worker = threading.current_thread().name  # The segments are counted as bytes of the calling worker
+
+    def fetch(first, last):
+        written = 0
+        segment_start = time.perf_counter()
+        meter = ByteMeter(http_client.metrics, 'crawler_downloaded_bytes_total', worker=worker)
+        try:
+            with http_client.get(url, stream=True, headers={'Range': f'bytes={first}-{last}'},
+                                 rate_limited=False) as r, open(segments_path, 'r+b') as f:
+                if r.status_code != 206 or _content_range_start(r.headers.get('content-range')) != first:
+                    raise IOError(f'Range {first}-{last} refused: {r.status_code} {r.reason}')
+                f.seek(first)
+                for chunk in iter_body(r, chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+                    meter.add(len(chunk))
+                    if admission is not None:
+                        admission.consume(len(chunk))
+        except Exception as e:
+            print(e)
+        meter.flush()
+        elapsed = time.perf_counter() - segment_start
+        return {'start': first, 'end': last, 'bytes': written, 'elapsed': elapsed,
+                'throughput': written / elapsed if elapsed > 0 else 0.0}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        report = list(executor.map(lambda bound: fetch(*bound), bounds))
+    elapsed = time.perf_counter() - start
+
+    downloaded = sum(segment['bytes'] for segment in report)
+    complete = all(segment['bytes'] == segment['end'] - segment['start'] + 1 for segment in report)
+    if complete:
+        os.replace(segments_path, local_file_path)
+    else:
+        os.remove(segments_path)
+    return {'complete': complete, 'bytes': downloaded, 'elapsed': elapsed,
+            'throughput': downloaded / elapsed if elapsed > 0 else 0.0, 'segments': report}
+
+
+def _content_range_start(content_range: str):
+    """Extracts the first byte position from a ``Content-Range`` header (e.g. 'bytes 100-199/1000' gives 100)."""
+    try:
+        return int(content_range.split()[1].split('-')[0])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _content_range_total(content_range: str):
+    """Extracts the complete length from a ``Content-Range`` header (e.g. 'bytes 100-199/1000' gives 1000)."""
+    try:
+        return int(content_range.rsplit('/', 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class CrawlCounters:
+    """Thread-safe success/denied/failed counters shared by the download workers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total_size = 0
+        self.failed_requests = 0
+        self.denied_requests = 0
+        self.successful_requests = 0
+        self.corrupt_videos = 0
+
+    def add(self, **increments):
+        """Atomically increments one or more counters.
+
+        :param increments: Counter names and how much to add to each (e.g. failed_requests=1).
+        """
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        """Returns the current value of every counter.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {'successful_requests': self.successful_requests, 'denied_requests': self.denied_requests,
+                    'failed_requests': self.failed_requests, 'corrupt_videos': self.corrupt_videos,
+                    'total_size': self.total_size}
+
+
+def _number(text: str, kind=float):
+    try:
+        return kind(float(text))
+    except (TypeError, ValueError):
+        return None
+
+
+def _progress(i: int, n_videos: int = None):
+    """Formats the position of a video in the catalog for the log, e.g. '3/10', or '3' if the total is unknown."""
+    return str(i) if n_videos is None else f'{i}/{n_videos}'
+
+
+def parse_versions(xml):
+    """Parses the answer of the versions endpoint into a compact record per version, see VersionPolicy.
+
+    :param xml: The answer of ``/services/video/versions/{id}``.
+    :type xml: bytes
+
+    :returns: A list with a dict per version, in the order of the API, with its 'url', 'format', 'width', 'height',
+        'bitrate' (kbps), 'frame_rate' and 'size' (always None, the API does not tell it). Missing fields are None.
+    :rtype: list
+    """
+    versions = []
+    for element in ElementTree.fromstring(xml):
+        fields = {field.tag: (field.text or '').strip() or None for field in element}
+        versions.append({'url': fields.get('url'), 'format': fields.get('fileFormat'),
+                         'width': _number(fields.get('frameWidth'), int),
+                         'height': _number(fields.get('frameHeight'), int), 'bitrate': _number(fields.get('bitRate')),
+                         'frame_rate': _number(fields.get('frameRate')), 'size': None})
+    return versions
+
+
+def content_length(url: str, http_client: HttpClient = None):
+    """Asks the size of a file with a HEAD request.
+
+    :returns: The size in bytes of the file, or None if the server does not tell it.
+    :rtype: int
+    """
+    http_client = http_client or default_client()
+    try:
+        r = http_client.request('HEAD', url, rate_limited=False, allow_redirects=True)
+    except Exception as e:
+        print(e)
+        return None
+    if r.status_code != 200:
+        return None
+    return _number(r.headers.get('Content-Length'), int)
+
+
+def resolve_version(video_id: str, i: int, n_videos: int, headers: dict, counters: CrawlCounters,
+                    api_url: str = API_URL, state: CrawlState = None, http_client: HttpClient = None,
+                    cache: VersionCache = None, policy: VersionPolicy = None):
+    """Resolves the version of a video to download, i.e. the url and format of its file.
+
+    :param video_id: The Video@RNP id of the video.
+    :type video_id: str
+
+    :param i: Index of the video in the catalog, used for logging.
+    :type i: int
+
+    :param n_videos: Number of videos in the catalog, used for logging, None if unknown.
+    :type n_videos: int
+
+    :param headers: Headers sent to the API (e.g. the client key).
+    :type headers: dict
+
+    :param counters: Counters updated if the version could not be resolved.
+    :type counters: CrawlCounters
+
+    :param api_url: Base address of the Video@RNP API.
+    :type api_url: str, optional
+
+    :param state: Crawl state database where the progress of the video is recorded. If the video's version was
+        already resolved in a previous run, the versions request is skipped.
+    :type state: CrawlState, optional
+
+    :param http_client: Client used for the requests, defaults to the client shared by the crawlers. The pace of the
+        requests is set by its rate limiter.
+    :type http_client: HttpClient, optional
+
+    :param cache: Cache of the versions of the videos, shared between runs. A fresh entry spares the versions request,
+        a stale one is revalidated with its ETag (the server then answers 304 if the versions did not change).
+    :type cache: VersionCache, optional
+
+    :param policy: Policy choosing among the versions of the video. Defaults to the first one, the best version
+        according to the API. When the policy has a max_size, the sizes of the versions it considers are asked with
+        HEAD requests (and cached).
+    :type policy: VersionPolicy, optional
+
+    :returns: A (url, video_format, size) tuple, or None if the version could not be resolved. The size in bytes of
+        the file is None unless the policy asked it.
+    :rtype: tuple
+    """
+    start = time.perf_counter()
+    http_client = http_client or default_client()
+    metrics = http_client.metrics
+    known = state.get(STATE_SOURCE, video_id) if state else None
+    if state:
+        state.mark(STATE_SOURCE, video_id, known['status'] if known else crawl_state.PENDING, new_attempt=True)
+
+    if known and known['status'] in (crawl_state.VERSION_RESOLVED, crawl_state.DOWNLOADING) and known['url']:
+        # The version was resolved in a previous run, no need to ask the API again
+        return known['url'], known['format'], None
+
+    policy = policy or VersionPolicy()
+
+    def failed(message, level, **fields):
+        event(LOGGER, message, level, video_id=video_id, index=i, status=crawl_state.FAILED, **fields)
+        if metrics is not None:
+            metrics.inc('crawler_videos_total', status=crawl_state.FAILED)
+        if state:
+            state.mark(STATE_SOURCE, video_id, crawl_state.FAILED)
+        return None
+
+    def chosen(versions, result, etag=None):
+        version = policy.select(versions, size_of=lambda candidate: content_length(candidate['url'], http_client))
+        if result == 'miss' and cache is not None:
+            cache.put(video_id, {'versions': versions}, etag)  # Along with the sizes found by the policy
+        if metrics is not None and cache is not None:
+            metrics.inc('crawler_metadata_cache_total', result=result)
+        if version is None:
+            return failed(f'Video {_progress(i, n_videos)}, Id:{video_id}, none of its {len(versions)} versions is '
+                          f'acceptable.', logging.WARNING)
+        if state:
+            state.mark(STATE_SOURCE, video_id, crawl_state.VERSION_RESOLVED, url=version['url'],
+                       video_format=version['format'])
+        return version['url'], version['format'], version.get('size')
+
+    cached = cache.get(video_id) if cache is not None else None
+    # Entries cached by older versions of the crawler only have the url and format of the best version
+    cached_versions = cached['record'].get('versions') if cached else None
+    if cached_versions is not None and cached['fresh']:
+        return chosen(cached_versions, 'hit')
+    if cached_versions is not None and cached['etag']:
+        headers = dict(headers, **{'If-None-Match': cached['etag']})
+
+    try:
+        r = http_client.get(f'{api_url}/video/versions/{video_id}', headers=headers)
+    except Exception as e:
+        print(e)
+        return None
+    if r.status_code == 304 and cached_versions is not None:
+        # Stale but still valid, the versions did not change since they were cached
+        cache.refresh(video_id)
+        return chosen(cached_versions, 'revalidated')
+    if r.status_code != 200:
+        if cached and r.status_code == 404:
+            cache.discard(video_id)
+        counters.add(failed_requests=1)
+        return failed(f'Video {_progress(i, n_videos)}, Id:{video_id}, error in request: {r.status_code} {r.reason}.',
+                      logging.WARNING, http_status=r.status_code, latency=round(time.perf_counter() - start, 3))
+
+    versions = [version for version in parse_versions(r.content) if version['url']]
+    if not versions:
+        return failed(f'ERROR! Video id:{video_id}, index: {i}, no url in {r.text}', logging.ERROR,
+                      http_status=r.status_code)
+    return chosen(versions, 'miss', r.headers.get('ETag'))
+
+
+def download_version(video_id: str, i: int, n_videos: int, url: str, video_format: str, save_dir: str,
+                     counters: CrawlCounters, state: CrawlState = None, segments: int = 1,
+                     http_client: HttpClient = None, index: DownloadIndex = None, store: ContentStore = None,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE, preallocate: bool = False, start: float = None,
+                     scheduler: DownloadScheduler = None, expected_size: int = None, api_url: str = API_URL):
+    """Downloads the resolved version of a video, see resolve_version.
+
+    :param video_id: The Video@RNP id of the video.
+    :type video_id: str
+
+    :param i: Index of the video in the catalog, used for logging.
+    :type i: int
+
+    :param n_videos: Number of videos in the catalog, used for logging, None if unknown.
+    :type n_videos: int
+
+    :param url: Url of the file of the version.
+    :type url: str
+
+    :param video_format: Format of the file of the version, e.g. 'MP4'.
+    :type video_format: str
+
+    :param save_dir: Path to where the file will be saved.
+    :type save_dir: str
+
+    :param counters: Counters updated with the outcome of the video.
+    :type counters: CrawlCounters
+
+    :param state: Crawl state database where the progress of the video is recorded.
+    :type state: CrawlState, optional
+
+    :param segments: Number of parallel connections used to download each file.
+    :type segments: int, optional
+
+    :param http_client: Client used for the requests, defaults to the client shared by the crawlers.
+    :type http_client: HttpClient, optional
+
+    :param index: Index of the save_dir, consulted to skip videos that were already downloaded.
+    :type index: DownloadIndex, optional
+
+    :param store: Content store where the downloaded videos are kept, see download_file.
+    :type store: ContentStore, optional
+
+    :param chunk_size: Size in bytes of each read from the connection, see download_file.
+    :type chunk_size: int, optional
+
+    :param preallocate: Whether to reserve the size of each file on disk before writing it, see download_file.
+    :type preallocate: bool, optional
+
+    :param start: When the processing of the video started (a time.perf_counter value), for the latency logged.
+        Defaults to the start of the download.
+    :type start: float, optional
+
+    :param scheduler: Scheduler admitting the download within its storage, bandwidth and free space budgets. A video
+        that does not fit in the storage budget is skipped and kept as resolved for a later run, as is a video whose
+        download is stopped for the lack of free space.
+    :type scheduler: DownloadScheduler, optional
+
+    :param expected_size: Expected size in bytes of the file, reserved in the budgets of the scheduler.
+    :type expected_size: int, optional
+
+    :param api_url: Base address of the Video@RNP API, whose requests are slowed down when downloads are denied.
+    :type api_url: str, optional
+
+    :returns: The size in bytes of the downloaded video, zero if it was not downloaded.
+    :rtype: int
+    """
+    http_client = http_client or default_client()
+    metrics = http_client.metrics
+    video_download_name = video_id + '.' + video_format.lower()
+    admission = None
+    # Videos already in the save_dir are not downloaded again, so they do not go through the scheduler
+    if scheduler is not None and (index is None or video_id not in index):
+        admission = scheduler.admit(expected_size)
+        if admission is None:
+            event(LOGGER, f'Video {_progress(i, n_videos)}, Id:{video_id}, skipped: it does not fit in the storage '
+                          f'budget.', video_id=video_id, index=i, status='skipped', expected_size=expected_size)
+            return 0
+    if state:
+        state.mark(STATE_SOURCE, video_id, crawl_state.DOWNLOADING)
+    if metrics is not None:
+        metrics.adjust('crawler_downloads_in_progress', 1)
+    download_start = time.perf_counter()
+    video_size = 0
+    try:
+        video_size = download_file(url, save_dir, local_filename=video_download_name, verbose=False,
+                                   segments=segments, http_client=http_client, index=index, store=store,
+                                   chunk_size=chunk_size, preallocate=preallocate, admission=admission)
+    finally:
+        if metrics is not None:
+            metrics.adjust('crawler_downloads_in_progress', -1)
+        if admission is not None:
+            # Only the file kept counts in the storage budget, not the bytes of a failed download
+            admission.release(video_size)
+    fields = {'video_id': video_id, 'index': i, 'format': video_format, 'bytes': video_size,
+              'download_seconds': round(time.perf_counter() - download_start, 3),
+              'latency': round(time.perf_counter() - (start or download_start), 3)}
+
+    if video_size == 0 and admission is not None and admission.stopped:
+        # Not denied by the platform, it is downloaded again once there is free space
+        event(LOGGER, f'Video {_progress(i, n_videos)}, Id:{video_id}, stopped: the disk of {save_dir} is almost full.',
+              logging.WARNING, status='stopped', **fields)
+        return 0
+    elif video_size == 0:
+        event(LOGGER, f'Video {_progress(i, n_videos)}, Id:{video_id}, failed to download file. (Probably too many '
+                      f'requests)', logging.WARNING, status=crawl_state.DENIED, **fields)
+        counters.add(denied_requests=1)
+        if http_client.rate_limiter:
+            # The downloads are not paced, the denials slow down the API requests instead
+            http_client.rate_limiter.failure(host_of(api_url))
+        if state:
+            state.mark(STATE_SOURCE, video_id, crawl_state.DENIED)
+    else:
+        event(LOGGER, f'Video {_progress(i, n_videos)}, Id:{video_id}, request successful with size '
+                      f'{sizeof_fmt(video_size)}', status=crawl_state.DONE, **fields)
+        if state:
+            state.mark(STATE_SOURCE, video_id, crawl_state.DONE, size=video_size)
+    counters.add(total_size=video_size, successful_requests=1)
+    if metrics is not None:
+        metrics.inc('crawler_videos_total', status=crawl_state.DENIED if video_size == 0 else crawl_state.DONE)
+        metrics.observe('crawler_video_seconds', fields['latency'])
+    return video_size
+
+
+def verify_download(video_id: str, i: int, path: str, size: int, counters: CrawlCounters, state: CrawlState = None,
+                    index: DownloadIndex = None, metrics: MetricsRegistry = None):
+    """Verifies a downloaded video, see verification.verify_file. A bad file is renamed out of the way (with the
+    verification BAD_SUFFIX) and marked as failed, so that the next run downloads it again.
+
+    :param video_id: The Video@RNP id of the video.
+    :type video_id: str
+
+    :param i: Index of the video in the catalog, used for logging.
+    :type i: int
+
+    :param path: Path to the downloaded file.
+    :type path: str
+
+    :param size: Expected size of the file, i.e. the size of its version or the ``Content-Length`` of its url, None
+        if unknown.
+    :type size: int
+
+    :param counters: Counters updated if the file is bad.
+    :type counters: CrawlCounters
+
+    :param state: Crawl state database, where a bad file is marked as failed.
+    :type state: CrawlState, optional
+
+    :param index: Index of the save_dir, from which a bad file is removed.
+    :type index: DownloadIndex, optional
+
+    :param metrics: Registry where bad files are counted.
+    :type metrics: MetricsRegistry, optional
+
+    :returns: Whether the file is ok.
+    :rtype: bool
+    """
+    result = verify_file(path, size)
+    if result['ok']:
+        return True
+    event(LOGGER, f'Video {i}, Id:{video_id}, bad file: {result["reason"]}', logging.WARNING, video_id=video_id,
+          index=i, status='corrupt', reason=result['reason'])
+    os.replace(path, path + BAD_SUFFIX)
+    counters.add(corrupt_videos=1)
+    if index is not None:
+        index.remove(video_id)
+    if metrics is not None:
+        metrics.inc('crawler_videos_total', status='corrupt')
+    if state:
+        state.mark(STATE_SOURCE, video_id, crawl_state.FAILED)
+    return False
 
 
 def crawl_and_download(client_key: str, save_dir: str, start_id: int = None, start_index: int = 0, max_n: int = 10,
-                       log_file_path=None):
+                       log_file_path=None, lookup_workers: int = 1, download_workers: int = 1,
+                       requests_per_second: float = 1 / 50, max_requests_per_second: float = 1.0,
+                       api_url: str = API_URL, state_db_path: str = None,
+                       segments: int = 1, retry_policy: RetryPolicy = None, index_path: str = None,
+                       store_dir: str = None, metrics_interval: float = 60.0, log_max_bytes: int = 64 * 1024 * 1024,
+                       metrics_port: int = None, metrics_file: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       preallocate: bool = False, verify: bool = False, verify_workers: int = 1,
+                       queue_size: int = None, metadata_cache_path: str = None,
+                       metadata_ttl: float = 7 * 24 * 3600, catalog_path: str = None,
+                       catalog_page_size: int = DEFAULT_PAGE_SIZE, catalog_full: bool = False,
+                       version_policy: VersionPolicy = None, max_bytes: int = None, bytes_per_second: float = None,
+                       bytes_per_day: int = None, min_free_bytes: int = None, download_order: str = 'listed'):
     """Crawls the Video@RNP API, collecting and downloading video data.
 
+    The videos flow through a pipeline: the catalog is streamed to the version resolvers (lookup_workers), whose
+    results are queued for the downloaders (download_workers) and then, optionally, for the verifiers
+    (verify_workers). Each stage has its own bounded queue, so the versions of upcoming videos are resolved while the
+    current ones download, and a slow stage holds back the ones before it. The depth of each queue and the latency
+    of each stage are recorded in the metrics (see metrics_port and metrics_file) and summarized in the log.
+
     :param client_key: The client key provided by the API Admin (Video@RNP).
     :type client_key: str
 
@@ -165,9 +829,126 @@ def crawl_and_download(client_key: str, save_dir: str, start_id: int = None, sta
     :param max_n: Max number of videos to download.
     :type max_n: int, optional
 
-    :param log_file_path: Path to save the logs. Optional. e.g. "./"
+    :param log_file_path: Path to save the logs. Optional. e.g. "./". The log file, probing.log, has a JSON event
+        per line, see crawl_log.
     :type log_file_path: int, optional
 
+    :param lookup_workers: Number of version resolvers, i.e. max number of versions requests in flight.
+    :type lookup_workers: int, optional
+
+    :param download_workers: Number of downloaders, i.e. max number of file downloads in flight.
+    :type download_workers: int, optional
+
+    :param requests_per_second: Initial budget of requests per second to the API, shared by all workers. The
+        budget then speeds up while requests succeed and backs off when they are throttled or fail. The default
+        (one request every 50 seconds) is the pace tolerated by the platform for a single worker.
+    :type requests_per_second: float, optional
+
+    :param max_requests_per_second: The budget of each host never goes above this many requests per second.
+    :type max_requests_per_second: float, optional
+
+    :param api_url: Base address of the Video@RNP API.
+    :type api_url: str, optional
+
+    :param state_db_path: Path to a crawl state database. If given, the progress of every video is recorded in it
+        and a restarted run only goes through the outstanding videos (up to max_n), without fetching the catalog again
+        (start_id and start_index are then ignored). If the previous run was interrupted before the whole catalog was
+        registered, or listed it with a lower max_n, the catalog is fetched again and only its outstanding videos are
+        visited.
+    :type state_db_path: str, optional
+
+    :param segments: Number of parallel connections used to download each file.
+    :type segments: int, optional
+
+    :param retry_policy: Policy deciding which failed requests are retried and how long to wait between attempts.
+        Defaults to exponential backoff with jitter, honoring the ``Retry-After`` of throttled requests.
+    :type retry_policy: RetryPolicy, optional
+
+    :param index_path: Path to a file where the index of the downloaded videos is persisted between runs. The save_dir
+        is scanned once at startup either way, persisting the index only spares reading the sizes of known files.
+    :type index_path: str, optional
+
+    :param store_dir: Path to a content store. If given, each downloaded video is stored there once per content
+        (videos with the same content under different ids share their file) and linked back from the save_dir.
+    :type store_dir: str, optional
+
+    :param metrics_interval: Seconds between two summaries of the counters of the run in the log.
+    :type metrics_interval: float, optional
+
+    :param log_max_bytes: Size at which the log file is rotated.
+    :type log_max_bytes: int, optional
+
+    :param metrics_port: If given, live metrics of the run (bytes downloaded per worker, request latency per endpoint,
+        retries, queued videos, videos per status...) are served in the Prometheus format at
+        ``http://127.0.0.1:<metrics_port>/metrics`` while it lasts.
+    :type metrics_port: int, optional
+
+    :param metrics_file: If given, the same metrics are periodically written to this file (e.g. for the textfile
+        collector of node_exporter).
+    :type metrics_file: str, optional
+
+    :param chunk_size: Size in bytes of each read from the connections, see download_file.
+    :type chunk_size: int, optional
+
+    :param preallocate: Whether to reserve the size of each file on disk before writing it, see download_file.
+    :type preallocate: bool, optional
+
+    :param verify: Whether to verify each downloaded video, see verify_download. The expected sizes of the files are
+        then asked with HEAD requests, unless the versions have them.
+    :type verify: bool, optional
+
+    :param verify_workers: Number of verifiers.
+    :type verify_workers: int, optional
+
+    :param queue_size: Max number of videos waiting in the queue of each stage. Defaults to twice the workers of the
+        stage.
+    :type queue_size: int, optional
+
+    :param metadata_cache_path: Path to a cache of the resolved versions, kept between runs. Reruns then only send
+        versions requests for unknown videos and for entries older than metadata_ttl (conditional requests, answered
+        with a 304 while the versions are unchanged).
+    :type metadata_cache_path: str, optional
+
+    :param metadata_ttl: Seconds a cached version is used without asking the API again.
+    :type metadata_ttl: float, optional
+
+    :param catalog_path: Path to a local copy of the catalog, kept between runs. If given, the catalog is fetched in
+        pages of catalog_page_size videos (lookup_workers pages at the same time) instead of a single request, and
+        once it is known only its tail is fetched, with the new videos (see Catalog.sync). With a state_db_path, the
+        new videos are added to the crawl state and the outstanding ones are visited.
+    :type catalog_path: str, optional
+
+    :param catalog_page_size: Number of videos in each page of the catalog.
+    :type catalog_page_size: int, optional
+
+    :param catalog_full: Whether to fetch the whole catalog again, to find the videos that changed or were removed.
+        The cached versions of the changed videos are discarded.
+    :type catalog_full: bool, optional
+
+    :param version_policy: Policy choosing the version of each video to download (e.g. the smallest one of at least
+        480p), see VersionPolicy. Defaults to the best version according to the API.
+    :type version_policy: VersionPolicy, optional
+
+    :param max_bytes: Storage budget, max bytes of videos in the save_dir (counting the ones already there). Videos
+        that do not fit in what is left of it are skipped, and no more videos are visited once it is spent. The sizes
+        of the files are asked with HEAD requests, see DownloadScheduler.
+    :type max_bytes: int, optional
+
+    :param bytes_per_second: Bandwidth budget, max bytes per second received by all the downloads together.
+    :type bytes_per_second: float, optional
+
+    :param bytes_per_day: Max bytes received in a day, new downloads then wait for the next day.
+    :type bytes_per_day: int, optional
+
+    :param min_free_bytes: Min free space on the disk of the save_dir, new downloads wait (checking every minute)
+        while they would leave less than this free.
+    :type min_free_bytes: int, optional
+
+    :param download_order: Order of the videos waiting to be downloaded, one of ORDERS: as 'listed' in the catalog,
+        the 'smallest' first (the most videos for the budgets) or the 'largest' first, by the size of their files
+        (asked with HEAD requests). Only the videos in the queue of the downloaders are ordered, see queue_size.
+    :type download_order: str, optional
+
     :returns: None, It automatically saves the videos to the save save_dir.
     :rtype: None
     """
@@ -182,110 +963,208 @@ def crawl_and_download(client_key: str, save_dir: str, start_id: int = None, sta
         "clientkey": client_key}
     # 'User-agent': 'Mozilla/5.0'
 
-    # Requesting the main video xml
-    r = requests.get('https://video.rnp.br/services/video',
-                     params=PARAMS, headers=HEADERS, timeout=5000000)
-    xml = minidom.parseString(r.text)
-
-    # log('### RESULT: ', r.status_code, r.reason)
-    # with open("videos.txt","w") as f:
-    #   f.write(r.text)
-    #   f.close() #to change file access modes
-    PARAMS = {}
-    SAVE_DIR = save_dir
-    LOG_NAME = 'probing.log'
-    videos_tag = xml.childNodes[0]
-    videos_nodes = videos_tag.childNodes
-    total_size = 0
-    failed_requests = 0
-    denied_requests = 0
-    successful_requests = 0
-
-    if log_file_path:
-        with open(os.path.join(log_file_path, LOG_NAME), 'a+') as log_file:
-            log(f'Starting run for probing {len(videos_nodes)} videos! At {datetime.datetime.now()}', log_file)
-    else:
-        log(f'Starting run for probing {len(videos_nodes)} videos! At {datetime.datetime.now()}')
+    state = CrawlState(state_db_path) if state_db_path else None
+    index = DownloadIndex(save_dir, index_path)
+    print(f'Indexed {len(index)} downloaded videos in {index.build_time:.2f}s.')
+    store = ContentStore(store_dir) if store_dir else None
+    cache = VersionCache(metadata_cache_path, metadata_ttl) if metadata_cache_path else None
+    # Only the API requests are paced, the downloads of the files are not
+    rate_limiter = AdaptiveRateLimiter(rate=requests_per_second, max_rate=max_requests_per_second)
+    metrics = MetricsRegistry()
+    metrics.describe('crawler_downloaded_bytes_total', 'Bytes of video downloaded, by worker.')
+    metrics.describe('crawler_downloads_in_progress', 'Files being downloaded.')
+    metrics.describe('crawler_videos_total', 'Videos processed, by status (done, denied or failed).')
+    metrics.describe('crawler_video_seconds', 'Time to resolve and download a video.')
+    metrics.describe('crawler_metadata_cache_total', 'Versions resolved from the metadata cache (hit), after a 304 '
+                                                     '(revalidated) or with a full request (miss).')
+    # Enough pooled connections for every in-flight versions request and download segment
+    http_client = HttpClient(pool_maxsize=lookup_workers + download_workers * max(1, segments),
+                             retry_policy=retry_policy, rate_limiter=rate_limiter, metrics=metrics)
+    exporters = []
+    r = catalog = sync = logger = None
+    # The threads, the metrics port, the log file and the databases are released even if the run fails
+    try:
+        if metrics_port is not None:
+            exporters.append(MetricsServer(metrics, metrics_port).start())
+            print(f'Serving metrics at http://127.0.0.1:{exporters[-1].port}/metrics')
+        if metrics_file:
+            exporters.append(MetricsFile(metrics, metrics_file).start())
 
-    for i, video_node in enumerate(videos_nodes):
-        if log_file_path:
-            log_file = open(os.path.join(log_file_path, LOG_NAME), 'a+')
+        if catalog_path:
+            # Syncing the local copy of the catalog page by page, only its tail once it is known
+            catalog = Catalog(catalog_path)
+            sync = catalog.sync(api_url, HEADERS, http_client, catalog_page_size, lookup_workers, max_n, catalog_full)
+            if cache is not None:
+                for video_id in sync['changed']:
+                    cache.discard(video_id)  # Its versions may have changed too
+            video_ids = catalog.video_ids(max_n)
+            if state:
+                state.add(STATE_SOURCE, video_ids)
+                video_ids = [video['video_id'] for video in state.outstanding(STATE_SOURCE)]
+                start_id, start_index = None, 0
+            n_videos = len(video_ids)
+        elif state and state.listing_complete(STATE_SOURCE, max_n):
+            # Resuming a previous run that registered the catalog up to max_n: only the outstanding videos are visited
+            video_ids = [video['video_id'] for video in state.outstanding(STATE_SOURCE)][:max_n]
+            n_videos = len(video_ids)
+            start_id, start_index = None, 0
         else:
-            log_file = None
-        video_id = video_node.childNodes[0].childNodes[0].nodeValue
-        if i < start_index:
-            # print(f'Jumping index {i} until {start_index}.')
-            continue
-        if start_id is not None:
-            if str(start_id) != str(video_id):
-                continue
-            else:
-                print(f' Found id to start from, {start_id} == {video_id}, starting downloads.')
-                start_id = None  # if we already passed our starting point, then we dont need to test forom now on
-
-        if (i % 10 == 0) and (i != 0):
-            log(f'{failed_requests}/{len(videos_nodes)} failed until now.', log_file)
-            log(f'{denied_requests}/{len(videos_nodes)} denied until now.', log_file)
-            log(f'{successful_requests}/{len(videos_nodes)} successful until now.', log_file)
-
-        time.sleep(50)
-        # if len(glob.glob(SAVE_DIR +'/'+video_id+'*')) > 0:
-        #     log('Already downloaded!')
-        #     continue
-        try:
-            r = requests.get(f'https://video.rnp.br/services/video/versions/{video_id}',
-                             params=PARAMS, headers=HEADERS)
-        except Exception as e:
-            print(e)
-            continue
-        if r.status_code != 200:
-            log(f'Video {i}/{len(videos_nodes)}, Id:{video_id}, error in request: {r.status_code} {r.reason}.',
-                log_file)
-            failed_requests += 1
-            continue
-
-        xml = minidom.parseString(r.text)
-        versions = xml.childNodes[0]
-        best_version = versions.childNodes[0]
-        # scandown(best_version.childNodes)
+            # Requesting the main video xml, videos are handed to the workers while the listing is still arriving
+            r = http_client.get(f'{api_url}/video',
+                             params=PARAMS, headers=HEADERS, timeout=5000000, stream=True)
+            r.raw.decode_content = True
+            video_ids = (video['id'] for video in iter_catalog(r.raw))
+            if state:
+                video_ids = _registered(state, video_ids, max_n)
+            n_videos = None  # Unknown until the whole listing arrived, it may have less than max_n videos
+
+        SAVE_DIR = save_dir
+        LOG_NAME = 'probing.log'
+        counters = CrawlCounters()
+
+        logger = setup_logging(log_file_path, LOG_NAME, name=LOGGER.name, max_bytes=log_max_bytes)
+        planned = max_n if n_videos is None else n_videos
+        event(logger, f'Starting run for probing up to {planned} videos! At {datetime.datetime.now()}',
+              event_type='start', max_n=planned, lookup_workers=lookup_workers, download_workers=download_workers,
+              segments=segments)
+        if sync is not None:
+            event(logger, f"Catalog synced in {sync['pages']} pages: {len(sync['new'])} new, {len(sync['changed'])} "
+                          f"changed and {len(sync['removed'])} removed videos" +
+                          (f", stopped by: {sync['error']}" if sync['error'] else ''),
+                  logging.WARNING if sync['error'] else logging.INFO, event_type='catalog', pages=sync['pages'],
+                  new=len(sync['new']), changed=len(sync['changed']), removed=len(sync['removed']), full=sync['full'],
+                  complete=sync['complete'], error=sync['error'])
+
+        scheduler = None
+        if any(budget is not None for budget in (max_bytes, bytes_per_second, bytes_per_day, min_free_bytes)):
+            scheduler = DownloadScheduler(save_dir, max_bytes, index.total_size(), bytes_per_second, bytes_per_day,
+                                          min_free_bytes, metrics=metrics, logger=logger)
+        # The expected size of each file, unless the version policy asked it, comes from a HEAD request
+        priority = size_priority(download_order)
+        sizes = priority is not None or (scheduler is not None and scheduler.needs_sizes) or verify
+
+        def resolve(video):
+            video_id, i = video
+            start = time.perf_counter()
+            version = resolve_version(video_id, i, n_videos, HEADERS, counters, api_url, state, http_client, cache,
+                                      version_policy)
+            if version is None:
+                return None
+            url, video_format, size = version
+            if size is None and sizes:
+                size = content_length(url, http_client)
+            return video_id, i, url, video_format, size, start
+
+        def download(video):
+            video_id, i, url, video_format, expected_size, start = video
+            size = download_version(video_id, i, n_videos, url, video_format, SAVE_DIR, counters, state, segments,
+                                    http_client, index, store, chunk_size, preallocate, start, scheduler, expected_size,
+                                    api_url)
+            path = os.path.join(SAVE_DIR, video_id + '.' + video_format.lower())
+            return (video_id, i, path, size, expected_size) if size else None
+
+        def check(video):
+            video_id, i, path, size, expected_size = video
+            # The file is checked against the size expected before the download, not the bytes it received
+            if not verify_download(video_id, i, path, expected_size, counters, state, index, metrics) and \
+                    scheduler is not None:
+                scheduler.remove(size)  # The bad file no longer counts in the storage budget
+
+        def failed(stage, video, e):
+            event(logger, f'ERROR! Video id:{video[0]}, index: {video[1]}, {e}', logging.ERROR, video_id=video[0],
+                  index=video[1], status='error', stage=stage.name)
+
+        def selected():
+            first_id = start_id
+            for i, video_id in enumerate(video_ids):
+                if scheduler is not None and scheduler.exhausted:
+                    event(logger, f'Storage budget of {sizeof_fmt(max_bytes)} spent, no more videos are visited.',
+                          logging.WARNING, event_type='budget', used_bytes=scheduler.used_bytes)
+                    break
+                if i < start_index:
+                    # print(f'Jumping index {i} until {start_index}.')
+                    continue
+                if first_id is not None:
+                    if str(first_id) != str(video_id):
+                        continue
+                    else:
+                        print(f' Found id to start from, {start_id} == {video_id}, starting downloads.')
+                        # if we already passed our starting point, then we dont need to test forom now on
+                        first_id = None
+                yield video_id, i
+
+        stages = [Stage('resolve', resolve, lookup_workers, queue_size),
+                  Stage('download', download, download_workers, queue_size,
+                        priority=(lambda video: priority(video[4])) if priority is not None else None)]
+        if verify:
+            stages.append(Stage('verify', check, verify_workers, queue_size))
+        pipeline = Pipeline(stages, metrics, on_error=failed)
+        with MetricsReporter(logger, counters.snapshot, metrics_interval):
+            pipeline.run(selected())
+
+        totals = counters.snapshot()
+        event(logger, f'Total size: {sizeof_fmt(totals["total_size"])}', event_type='total', **totals)
+        event(logger, f'Number of successful requests:{totals["successful_requests"]}')
+        event(logger, f'Number of denied requests:{totals["denied_requests"]}')
+        event(logger, f'Number of failed requests:{totals["failed_requests"]}')
+        stats = pipeline.stats()
+        event(logger, 'Stages: ' + ', '.join(f"{name} {stage['items']} videos, {stage['mean_seconds']:.3f}s each, "
+                                             f"queue up to {stage['max_depth']}" for name, stage in stats.items()),
+              event_type='stages', stages=stats)
+        if cache is not None:
+            lookups = {result: int(metrics.value('crawler_metadata_cache_total', result=result))
+                       for result in ('hit', 'revalidated', 'miss')}
+            event(logger, f"Metadata cache: {lookups['hit']} hits, {lookups['revalidated']} revalidated, "
+                          f"{lookups['miss']} misses", event_type='metadata_cache', **lookups)
+        if scheduler is not None:
+            event(logger, f'Storage used: {sizeof_fmt(scheduler.used_bytes)}, {scheduler.skipped} videos skipped over '
+                          f'the budget, downloads paused for {scheduler.paused_seconds:.0f}s', event_type='scheduler',
+                  used_bytes=scheduler.used_bytes, skipped=scheduler.skipped,
+                  paused_seconds=round(scheduler.paused_seconds, 3))
+        if store:
+            event(logger, f'Duplicated videos in the content store: {store.duplicates} '
+                          f'({sizeof_fmt(store.saved_bytes)} saved)', duplicates=store.duplicates,
+                  saved_bytes=store.saved_bytes)
+
+    finally:
+        if r is not None:
+            r.close()
+        if logger is not None:
+            close_logging(logger)
+        for exporter in exporters:
+            exporter.stop()
+        if state:
+            state.close()
+        if cache is not None:
+            cache.close()
+        if catalog is not None:
+            catalog.close()
+        http_client.close()
+        index.save()
 
-        try:
-            url = best_version.getElementsByTagName('url')[0].childNodes[0].nodeValue
-            # log(url)
-        except Exception as e:
-            # log('Error: ', e)
-            log(best_version, log_file)
-            log(best_version.getElementsByTagName('url'), log_file)
-            log(f'ERROR! Video id:{video_id}, index: {i}', log_file)
-            continue
-        video_format = best_version.getElementsByTagName('fileFormat')[0].childNodes[0].nodeValue
-        video_download_name = video_id + '.' + video_format.lower()
-        # log(video_download_name)
-        # r = requests.get(url, stream=True)
-        # video_size = int(r.headers.get('content-length'))
-        video_size = download_file(url, SAVE_DIR, local_filename=video_download_name, verbose=False)
-
-        if video_size == 0:
-            log(f'Video {i}/{len(videos_nodes)}, Id:{video_id}, failed to download file. (Probably too many requests)',
-                log_file)
-            denied_requests += 1
-        else:
-            log(f'Video {i}/{len(videos_nodes)}, Id:{video_id}, request successful with size {sizeof_fmt(video_size)}',
-                log_file)
-        total_size += video_size
-        successful_requests += 1
 
-    if log_file_path and not log_file:
-        log_file = open(os.path.join(log_file_path, LOG_NAME), 'a+')
+def _registered(state: CrawlState, video_ids, max_videos: int, batch_size: int = 500):
+    """Registers the video ids in the crawl state database in batches, passing along the outstanding ones once
+    registered (the catalog is streamed again if a previous run was interrupted before registering all of it). The
+    listing is marked as complete once every id was registered, along with the limit it was asked with (none if it
+    ended before reaching it)."""
+    batch = []
+    n_videos = 0
+    for video_id in video_ids:
+        batch.append(video_id)
+        n_videos += 1
+        if len(batch) == batch_size:
+            yield from _outstanding(state, batch)
+            batch = []
+    yield from _outstanding(state, batch)
+    state.mark_listing_complete(STATE_SOURCE, max_videos if n_videos >= max_videos else None)
 
-    log(f'Total size: {total_size}', log_file)
-    log(f'Total size: {sizeof_fmt(total_size)}', log_file)
-    log(f'Number of successful requests:{successful_requests}', log_file)
-    log(f'Number of denied requests:{denied_requests}', log_file)
-    log(f'Number of failed requests:{failed_requests}', log_file)
 
-    if log_file:
-        log_file.close()
+def _outstanding(state: CrawlState, batch: list):
+    """Registers a batch of video ids, returning the ones that still have to be downloaded."""
+    state.add(STATE_SOURCE, batch)
+    return [video_id for video_id in batch
+            if state.get(STATE_SOURCE, video_id)['status'] in crawl_state.OUTSTANDING_STATUSES]
 
 
 if __name__ == "__main__":
@@ -305,6 +1184,84 @@ if __name__ == "__main__":
                         default=0)
     parser.add_argument("--log_path", type=str,
                         help="Path to save the logs. e.g. './'", default=None)
+    parser.add_argument("--lookup_workers", type=int,
+                        help="Max number of video versions requests in flight at the same time", default=1)
+    parser.add_argument("--download_workers", type=int,
+                        help="Max number of file downloads in flight at the same time", default=1)
+    parser.add_argument("--rps", type=float,
+                        help="Initial budget of requests per second to the API, shared by all workers. It adapts "
+                             "to the responses of the platform", default=1 / 50)
+    parser.add_argument("--max_rps", type=float,
+                        help="Max budget of requests per second to each host", default=1.0)
+    parser.add_argument("--state_db", type=str,
+                        help="Path to a crawl state database used to resume interrupted runs", default=None)
+    parser.add_argument("--segments", type=int,
+                        help="Number of parallel connections used to download each file", default=1)
+    parser.add_argument("--retries", type=int,
+                        help="Max number of retries of a failed or throttled request", default=3)
+    parser.add_argument("--backoff", type=float,
+                        help="Base wait in seconds between retries, doubled at each retry", default=1.0)
+    parser.add_argument("--index_path", type=str,
+                        help="Path to a file where the index of the downloaded videos is kept between runs",
+                        default=None)
+    parser.add_argument("--store_dir", type=str,
+                        help="Path to a content store where each video is kept once per content", default=None)
+    parser.add_argument("--metrics_interval", type=float,
+                        help="Seconds between two summaries of the counters in the log", default=60.0)
+    parser.add_argument("--log_max_mb", type=float,
+                        help="Size in MiB at which the log file is rotated", default=64)
+    parser.add_argument("--metrics_port", type=int,
+                        help="Port of a local endpoint serving live metrics in the Prometheus format", default=None)
+    parser.add_argument("--metrics_file", type=str,
+                        help="Path to a file where live metrics are periodically written in the Prometheus format",
+                        default=None)
+    parser.add_argument("--chunk_kb", type=int,
+                        help="Size in KiB of each read from the connections", default=DEFAULT_CHUNK_SIZE // 1024)
+    parser.add_argument("--preallocate", action='store_true',
+                        help="Reserve the size of each file on disk before writing it")
+    parser.add_argument("--verify", action='store_true',
+                        help="Verify each downloaded video, moving bad files out of the way to download them again")
+    parser.add_argument("--verify_workers", type=int, help="Number of videos verified at the same time", default=1)
+    parser.add_argument("--queue_size", type=int,
+                        help="Max number of videos waiting in the queue of each stage of the pipeline", default=None)
+    parser.add_argument("--metadata_cache", type=str,
+                        help="Path to a cache of the resolved versions of the videos, kept between runs", default=None)
+    parser.add_argument("--metadata_ttl", type=float,
+                        help="Hours a cached version is used without asking the API again", default=7 * 24)
+    parser.add_argument("--catalog", type=str,
+                        help="Path to a local copy of the catalog, synced page by page and kept between runs",
+                        default=None)
+    parser.add_argument("--catalog_page_size", type=int,
+                        help="Number of videos in each page of the catalog", default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--catalog_full", action='store_true',
+                        help="Fetch the whole catalog again, to find the videos that changed or were removed")
+    parser.add_argument("--min_height", type=int,
+                        help="Only download versions of at least this height (resolution), in pixels", default=None)
+    parser.add_argument("--max_height", type=int,
+                        help="Only download versions of at most this height (resolution), in pixels", default=None)
+    parser.add_argument("--max_bitrate", type=float,
+                        help="Only download versions of at most this bitrate, in kbps", default=None)
+    parser.add_argument("--max_size_mb", type=float,
+                        help="Only download versions of at most this size, in MiB (asked with HEAD requests)",
+                        default=None)
+    parser.add_argument("--formats", type=str, nargs='+',
+                        help="Preferred formats of the versions, in order (e.g. mp4 webm)", default=())
+    parser.add_argument("--prefer", type=str, choices=PREFERENCES,
+                        help="Which of the acceptable versions of each video is downloaded: the first one listed by "
+                             "the API (its best version), the smallest or the largest one", default='first')
+    parser.add_argument("--max_total_gb", type=float,
+                        help="Storage budget, max GiB of videos in the save_dir. Videos that do not fit are skipped",
+                        default=None)
+    parser.add_argument("--bandwidth_kb", type=float,
+                        help="Bandwidth budget, max KiB per second received by all the downloads", default=None)
+    parser.add_argument("--daily_gb", type=float,
+                        help="Max GiB received in a day, new downloads then wait for the next day", default=None)
+    parser.add_argument("--min_free_gb", type=float,
+                        help="Pause the downloads while the disk of the save_dir has less than this many GiB free",
+                        default=None)
+    parser.add_argument("--order", type=str, choices=ORDERS,
+                        help="Order of the videos waiting to be downloaded: as listed in the catalog, the smallest or "
+                             "the largest files first", default='listed')
     args = parser.parse_args()
 
     key = None
@@ -315,4 +1272,23 @@ if __name__ == "__main__":
     else:
         quit('Please provide your API key either via arguments or in the start of this script.')
 
-    crawl_and_download(client_key=key, save_dir=args.save_dir, start_id=args.start_id, start_index=args.start_index, max_n=args.limit, log_file_path=args.log_path)
+    crawl_and_download(client_key=key, save_dir=args.save_dir, start_id=args.start_id, start_index=args.start_index, max_n=args.limit, log_file_path=args.log_path,
+                       lookup_workers=args.lookup_workers, download_workers=args.download_workers,
+                       requests_per_second=args.rps, max_requests_per_second=args.max_rps, state_db_path=args.state_db,
+                       segments=args.segments,
+                       retry_policy=RetryPolicy(max_retries=args.retries, backoff_factor=args.backoff),
+                       index_path=args.index_path, store_dir=args.store_dir, metrics_interval=args.metrics_interval,
+                       log_max_bytes=int(args.log_max_mb * 1024 * 1024), metrics_port=args.metrics_port,
+                       metrics_file=args.metrics_file, chunk_size=args.chunk_kb * 1024, preallocate=args.preallocate,
+                       verify=args.verify, verify_workers=args.verify_workers, queue_size=args.queue_size,
+                       metadata_cache_path=args.metadata_cache, metadata_ttl=args.metadata_ttl * 3600,
+                       catalog_path=args.catalog, catalog_page_size=args.catalog_page_size,
+                       catalog_full=args.catalog_full,
+                       version_policy=VersionPolicy(args.min_height, args.max_height, args.max_bitrate,
+                                                    int(args.max_size_mb * 1024 * 1024) if args.max_size_mb else None,
+                                                    args.formats, args.prefer),
+                       max_bytes=int(args.max_total_gb * 1024 ** 3) if args.max_total_gb is not None else None,
+                       bytes_per_second=args.bandwidth_kb * 1024 if args.bandwidth_kb is not None else None,
+                       bytes_per_day=int(args.daily_gb * 1024 ** 3) if args.daily_gb is not None else None,
+                       min_free_bytes=int(args.min_free_gb * 1024 ** 3) if args.min_free_gb is not None else None,
+                       download_order=args.order)
@@ -0,0 +1,288 @@
+"""Mock Video@RNP server for testing
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides a local stand-in for the Video@RNP API, so that the crawler
+can be tested offline. It serves a synthetic video catalog, the versions of each
+video (with an ETag, answering 304 to conditional requests) and the video files
+themselves.
+
+This file contains the following functions:
+
+    * catalog_xml - Builds a synthetic catalog listing the given video ids.
+
+and the following classes:
+
+    * MockRNPServer - Local HTTP server imitating the Video@RNP API.
+"""
+
+import hashlib
+import struct
+import threading
+import time
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+def catalog_xml(video_ids, titles: dict = None):
+    """Builds a synthetic catalog listing the given video ids, in the format of the ``/services/video`` endpoint.
+
+    :param video_ids: Ids of the listed videos.
+    :type video_ids: list
+
+    :param titles: Titles of some of the videos, the others are titled 'Video <id>'.
+    :type titles: dict, optional
+
+    :returns: The catalog xml.
+    :rtype: str
+    """
+    titles = titles or {}
+    videos = ''.join(f'<video><id>{video_id}</id><title>{titles.get(video_id, f"Video {video_id}")}</title></video>'
+                     for video_id in video_ids)
+    return f'<?xml version="1.0" encoding="UTF-8"?><videos>{videos}</videos>'
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MockRNPServer:
+    """Local HTTP server imitating the Video@RNP API. Use it as a context manager.
+
+    :param n_videos: Number of videos in the synthetic catalog.
+    :type n_videos: int, optional
+
+    :param video_size: Size in bytes of each video file.
+    :type video_size: int, optional
+
+    :param client_key: Client key the server expects in the ``clientkey`` header.
+    :type client_key: str, optional
+
+    :param missing_ids: Ids listed in the catalog whose versions request answers 404.
+    :type missing_ids: list, optional
+
+    :param support_ranges: Whether video files are served honoring the ``Range`` header.
+    :type support_ranges: bool, optional
+
+    :param interrupt_after: If given, the first transfer of each video file is cut after this many bytes.
+    :type interrupt_after: int, optional
+
+    :param connection_rate: If given, caps the speed (bytes/s) of each connection serving a video file.
+    :type connection_rate: int, optional
+
+    :param throttle_first: Number of requests answered with ``429 Too Many Requests`` before serving normally.
+    :type throttle_first: int, optional
+
+    :param retry_after: Value of the ``Retry-After`` header sent with the 429 responses.
+    :type retry_after: str, optional
+
+    :param latency: Time in seconds the server waits before answering each request.
+    :type latency: float, optional
+
+    :param fail_every: If given, every n-th request is answered with ``500 Internal Server Error``.
+    :type fail_every: int, optional
+
+    :param renditions: (width, height, bitrate) of the versions of each video, the first one is served at
+        ``/vod/<id>.mp4`` with video_size bytes and the others at ``/vod/<id>_<height>p.mp4``, with sizes proportional
+        to their bitrates.
+    :type renditions: list, optional
+
+    :param video_sizes: Size of the files of some videos, by id, instead of video_size.
+    :type video_sizes: dict, optional
+    """
+
+    def __init__(self, n_videos: int = 10, video_size: int = 4096, client_key: str = 'test-key',
+                 missing_ids: list = None, support_ranges: bool = True, interrupt_after: int = None,
+                 connection_rate: int = None, throttle_first: int = 0, retry_after: str = '0', latency: float = 0.0,
+                 fail_every: int = None, renditions: list = None, video_sizes: dict = None):
+        self.n_videos = n_videos
+        self.latency = latency
+        self.fail_every = fail_every
+        self.throttle_first = throttle_first
+        self.retry_after = retry_after
+        self.connections = 0
+        self.connection_rate = connection_rate
+        self._payloads = {}
+        self.support_ranges = support_ranges
+        self.interrupt_after = interrupt_after
+        self._interrupted = set()
+        self.missing_ids = set(missing_ids or [])
+        self.video_size = video_size
+        self.video_sizes = video_sizes or {}
+        self.renditions = renditions or [(320, 240, 300)]
+        self.client_key = client_key
+        self.video_ids = [str(10000 + i) for i in range(n_videos)] + sorted(self.missing_ids)
+        self.titles = {}
+        self.requests = []
+        self.range_requests = []
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        """Address of the server root, e.g. ``http://127.0.0.1:8000``."""
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    @property
+    def api_url(self):
+        """Address to pass as ``api_url`` to the crawler."""
+        return self.base_url + '/services'
+
+    def payload(self, video_id: str, size: int = None):
+        """Returns the content served for a video file: a minimal mp4 (a ``ftyp`` box and a ``mdat`` box filled with
+        the id of the video) when the size allows, so that the downloaded files pass the verification."""
+        size = self.video_sizes.get(video_id, self.video_size) if size is None else size
+        if (video_id, size) not in self._payloads:
+            pattern = video_id.encode()
+            filler = (pattern * (size // len(pattern) + 1))[:size]
+            header = b''
+            if size >= 32:
+                header = struct.pack('>I4s4sI4s4s', 24, b'ftyp', b'isom', 512, b'isom', b'mp41')
+                header += struct.pack('>I4s', size - 24, b'mdat')
+            self._payloads[video_id, size] = header + filler[len(header):]
+        return self._payloads[video_id, size]
+
+    def file_payload(self, name: str):
+        """Returns the content served at ``/vod/<name>.mp4``, name being the id of a video or ``<id>_<height>p``."""
+        video_id, _, rendition = name.partition('_')
+        sizes = {f'{height}p': self.video_size * bitrate // self.renditions[0][2]
+                 for _, height, bitrate in self.renditions[1:]}
+        return self.payload(video_id, sizes.get(rendition))
+
+    def catalog_xml(self, limit: int, offset: int = 0):
+        return catalog_xml(self.video_ids[offset:offset + limit], self.titles)
+
+    def versions_xml(self, video_id: str):
+        versions = ''
+        for n, (width, height, bitrate) in enumerate(self.renditions):
+            name = video_id if n == 0 else f'{video_id}_{height}p'
+            versions += (f'<version><id>{video_id}</id><fileFormat>MP4</fileFormat><bitRate>{bitrate}</bitRate>'
+                         f'<frameRate>25.0</frameRate><frameWidth>{width}</frameWidth><frameHeight>{height}'
+                         f'</frameHeight><url>{self.base_url}/vod/{name}.mp4</url></version>')
+        return f'<?xml version="1.0" encoding="UTF-8"?><versions>{versions}</versions>'
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keeps connections alive
+
+            def log_message(self, format, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def _send(self, status, body, content_type='application/xml', headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if server.connection_rate and content_type == 'video/mp4':
+                    self._write_throttled(body)
+                else:
+                    self.wfile.write(body)
+
+            def _write_throttled(self, body):
+                chunk_size = max(1, server.connection_rate // 20)
+                view = memoryview(body)
+                for offset in range(0, len(body), chunk_size):
+                    self.wfile.write(view[offset:offset + chunk_size])
+                    time.sleep(chunk_size / server.connection_rate)
+
+            def _send_file(self, name):
+                video_id = name.partition('_')[0]
+                payload = server.file_payload(name)
+                total = len(payload)
+                range_header = self.headers.get('Range')
+                if range_header and server.support_ranges:
+                    with server._lock:
+                        server.range_requests.append((video_id, range_header))
+                    first, last = range_header.split('=', 1)[1].split('-')
+                    first, last = int(first), int(last) if last else total - 1
+                    if first >= total:
+                        return self._send(416, b'', 'text/plain', {'Content-Range': f'bytes */{total}'})
+                    return self._send(206, payload[first:last + 1], 'video/mp4',
+                                      {'Content-Range': f'bytes {first}-{min(last, total - 1)}/{total}',
+                                       'Accept-Ranges': 'bytes'})
+                with server._lock:
+                    interrupt = server.interrupt_after is not None and video_id not in server._interrupted
+                    server._interrupted.add(video_id)
+                if interrupt:
+                    # Announces the whole file but closes the connection midway
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'video/mp4')
+                    self.send_header('Content-Length', str(total))
+                    self.end_headers()
+                    self.wfile.write(payload[:server.interrupt_after])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                headers = {'Accept-Ranges': 'bytes'} if server.support_ranges else None
+                return self._send(200, payload, 'video/mp4', headers)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                with server._lock:
+                    server.requests.append(parsed.path)
+                    throttled = server.throttle_first > 0
+                    server.throttle_first -= int(throttled)
+                    failed = bool(server.fail_every) and len(server.requests) % server.fail_every == 0
+                if server.latency:
+                    time.sleep(server.latency)
+                if failed:
+                    return self._send(500, b'Internal Server Error', 'text/plain')
+                if throttled:
+                    return self._send(429, b'Too Many Requests', 'text/plain', {'Retry-After': server.retry_after})
+                if parsed.path.startswith('/services/') and self.headers.get('clientkey') != server.client_key:
+                    return self._send(401, b'Unauthorized', 'text/plain')
+                if parsed.path == '/services/video':
+                    query = parse_qs(parsed.query)
+                    limit = int(query.get('limit', [len(server.video_ids)])[0])
+                    offset = int(query.get('offset', [0])[0])
+                    return self._send(200, server.catalog_xml(limit, offset).encode())
+                if parsed.path.startswith('/services/video/versions/'):
+                    video_id = parsed.path.rsplit('/', 1)[-1]
+                    if video_id not in server.video_ids or video_id in server.missing_ids:
+                        return self._send(404, b'Not Found', 'text/plain')
+                    body = server.versions_xml(video_id).encode()
+                    etag = '"%s"' % hashlib.md5(body).hexdigest()
+                    if self.headers.get('If-None-Match') == etag:
+                        with server._lock:
+                            server.not_modified += 1
+                        return self._send(304, b'', 'application/xml', {'ETag': etag})
+                    return self._send(200, body, headers={'ETag': etag})
+                if parsed.path.startswith('/vod/'):
+                    return self._send_file(parsed.path.rsplit('/', 1)[-1].split('.')[0])
+                return self._send(404, b'Not Found', 'text/plain')
+
+            def do_HEAD(self):
+                parsed = urlparse(self.path)
+                with server._lock:
+                    server.requests.append('HEAD ' + parsed.path)
+                found = parsed.path.startswith('/vod/')
+                self.send_response(200 if found else 404)
+                self.send_header('Content-Type', 'video/mp4' if found else 'text/plain')
+                name = parsed.path.rsplit('/', 1)[-1].split('.')[0]
+                self.send_header('Content-Length', str(len(server.file_payload(name)) if found else 0))
+                self.end_headers()
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
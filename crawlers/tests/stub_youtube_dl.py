@@ -0,0 +1,122 @@
+"""Stub of youtube_dl for testing
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module provides a stand-in for `youtube_dl.YoutubeDL`, so that the youtube
+crawlers can be tested offline. It understands watch urls and ``ytsearchN:``
+queries, and "downloads" videos by writing a small file named after the output
+template.
+
+This file contains the following classes:
+
+    * StubYoutubeDL - Offline stand-in for youtube_dl.YoutubeDL.
+"""
+
+import os
+import threading
+import time
+
+
+class StubYoutubeDL:
+    """Offline stand-in for youtube_dl.YoutubeDL. Replace ``youtube_dl.YoutubeDL`` with it (e.g. with monkeypatch).
+
+    The class attributes configure every instance and record how they were used, call :meth:`reset` before each test.
+    """
+
+    #: Ids whose next download fails (each id is removed from the set once it fails)
+    fail_once = set()
+    #: Ids whose downloads always fail
+    fail_always = set()
+    #: Ids whose next request is throttled, with a 429 (each id is removed from the set once throttled)
+    throttle_once = set()
+    #: Size in bytes of the written video files
+    video_size = 1024
+    #: Time in seconds each download takes
+    download_time = 0.0
+    #: Every instance created so far
+    instances = []
+    #: Every (url, download) passed to extract_info so far
+    calls = []
+    _lock = threading.Lock()
+
+    @classmethod
+    def reset(cls):
+        """Clears the configuration and the records of every instance."""
+        cls.fail_once = set()
+        cls.fail_always = set()
+        cls.throttle_once = set()
+        cls.video_size = 1024
+        cls.download_time = 0.0
+        cls.instances = []
+        cls.calls = []
+
+    def __init__(self, params: dict = None):
+        self.params = params or {}
+        self.thread = threading.current_thread().name
+        with self._lock:
+            self.instances.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def get_info_extractor(self, ie_key: str):
+        return None
+
+    def info(self, video_id: str):
+        """Returns the metadata of a synthetic video."""
+        number = sum(map(ord, video_id))
+        return {'id': video_id, 'display_id': video_id, 'title': f'Video {video_id}', 'ext': 'mp4',
+                'duration': 60 + number % 600, 'height': [240, 360, 480, 720, 1080][number % 5],
+                'filesize': self.video_size, 'upload_date': '20200101',
+                'webpage_url': 'https://www.youtube.com/watch?v=' + video_id,
+                'formats': [{'format_id': '18', 'ext': 'mp4', 'height': 360, 'filesize': self.video_size},
+                            {'format_id': '22', 'ext': 'mp4', 'height': 720, 'filesize': 2 * self.video_size}]}
+
+    def extract_info(self, url: str, download: bool = True, process: bool = True, **kwargs):
+        with self._lock:
+            self.calls.append((url, download))
+        if url.startswith('ytsearch'):
+            prefix, query = url.split(':', 1)
+            n = int(prefix[len('ytsearch'):] or 1)
+            entries = [{'_type': 'url', 'ie_key': 'Youtube', 'id': f'{query.replace(" ", "_")}{i}',
+                        'url': f'{query.replace(" ", "_")}{i}', 'title': f'{query} {i}'} for i in range(n)]
+            if process:
+                entries = [self.extract_info(entry['url'], download=download) for entry in entries]
+            return {'_type': 'playlist', 'id': query, 'title': query, 'entries': entries}
+
+        video_id = url.split('v=')[-1]
+        with self._lock:
+            failed = video_id in self.fail_always or video_id in self.fail_once
+            self.fail_once.discard(video_id)
+            throttled = video_id in self.throttle_once
+            self.throttle_once.discard(video_id)
+        if throttled:
+            if self.params.get('ignoreerrors'):
+                return None
+            raise Exception(f'ERROR: {video_id}: Unable to download webpage: HTTP Error 429: Too Many Requests')
+        if failed:
+            if self.params.get('ignoreerrors'):
+                return None
+            raise Exception(f'ERROR: {video_id}: Video unavailable')
+        info = self.info(video_id)
+        if download:
+            time.sleep(self.download_time)
+            path = self.params.get('outtmpl', '%(id)s.%(ext)s') % info
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(path, 'wb') as f:
+                f.write(b'\0' * self.video_size)
+        return info
+
+    def download(self, urls: list):
+        retcode = 0
+        for url in urls:
+            if self.extract_info(url, download=True) is None:
+                retcode = 1
+        return retcode
@@ -0,0 +1,76 @@
+from crawlers.rnp.catalog import Catalog
+from crawlers.common.http_client import HttpClient, RetryPolicy
+from crawlers.tests.mock_server import MockRNPServer
+
+import os
+
+test_db_path = './test_catalog.db'
+
+
+def clean_db():
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(test_db_path + suffix):
+            os.remove(test_db_path + suffix)
+
+
+def catalog_requests(server):
+    return len([path for path in server.requests if path == '/services/video'])
+
+
+def test_sync():
+    clean_db()
+    catalog = Catalog(test_db_path)
+    http_client = HttpClient()
+    with MockRNPServer(n_videos=10) as server:
+        headers = {'clientkey': server.client_key}
+        sync = catalog.sync(server.api_url, headers, http_client, page_size=3, workers=2)
+        assert sync['full'] and sync['complete']
+        assert sync['pages'] == 4 and len(sync['new']) == 10
+        assert catalog.video_ids() == server.video_ids, 'The order of the listing should be kept.'
+        assert catalog.get('10001')['title'] == 'Video 10001'
+
+        # Only the tail is fetched, from the last known page
+        server.video_ids += ['20000', '20001']
+        requests_before = catalog_requests(server)
+        sync = catalog.sync(server.api_url, headers, http_client, page_size=3, workers=1)
+        assert not sync['full'] and sync['complete']
+        assert sync['new'] == ['20000', '20001']
+        assert catalog_requests(server) - requests_before == 2
+        assert catalog.video_ids() == server.video_ids
+
+        # A full sync finds the changed entries
+        server.titles['10001'] = 'Renamed'
+        sync = catalog.sync(server.api_url, headers, http_client, page_size=3, workers=3, full=True)
+        assert sync['changed'] == ['10001'] and sync['new'] == [] and sync['removed'] == []
+        assert catalog.get('10001')['title'] == 'Renamed'
+
+        # A video removed before the tail shifts the listing, which is then fetched again
+        server.video_ids.remove('10002')
+        sync = catalog.sync(server.api_url, headers, http_client, page_size=3, workers=2)
+        assert sync['full'] and sync['removed'] == ['10002']
+        assert catalog.video_ids() == server.video_ids
+    catalog.close()
+    http_client.close()
+    clean_db()
+
+
+def test_sync_limit_and_failure():
+    clean_db()
+    catalog = Catalog(test_db_path)
+    http_client = HttpClient(retry_policy=RetryPolicy(max_retries=0))
+    with MockRNPServer(n_videos=10, fail_every=3) as server:
+        headers = {'clientkey': server.client_key}
+        sync = catalog.sync(server.api_url, headers, http_client, page_size=3, limit=7)
+        assert sync['error'] and not sync['complete'], 'The third request should fail.'
+        assert catalog.video_ids() == server.video_ids[:6], 'The pages fetched before the failure should be kept.'
+
+        server.fail_every = None
+        sync = catalog.sync(server.api_url, headers, http_client, page_size=3, limit=7)
+        assert not sync['error'] and not sync['complete'], 'The listing goes on after the limit.'
+        assert sync['new'] == ['10006'], 'The sync should resume from the stored pages.'
+        assert len(catalog) == 7
+
+        assert catalog.sync(server.api_url, headers, http_client, page_size=3, limit=5)['pages'] == 0
+    catalog.close()
+    http_client.close()
+    clean_db()
@@ -0,0 +1,44 @@
+from crawlers.common.content_store import ContentStore
+
+import hashlib
+import json
+import os
+import shutil
+
+test_store_dir = './tmp_content_store/'
+test_save_dir = './tmp_content_store_videos/'
+
+
+def clean():
+    for directory in [test_store_dir, test_save_dir]:
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+
+
+def test_add():
+    clean()
+    os.makedirs(test_save_dir)
+    contents = {'abc.mp4': b'same content', 'def.mp4': b'same content', 'ghi.mp4': b'other content'}
+    for name, content in contents.items():
+        with open(os.path.join(test_save_dir, name), 'wb') as f:
+            f.write(content)
+
+    store = ContentStore(test_store_dir)
+    digest = store.add(os.path.join(test_save_dir, 'abc.mp4'), hashlib.sha256(b'same content').hexdigest())
+    assert store.add(os.path.join(test_save_dir, 'def.mp4')) == digest, 'The file should be hashed if needed.'
+    store.add(os.path.join(test_save_dir, 'ghi.mp4'))
+
+    assert store.duplicates == 1 and store.saved_bytes == len(b'same content')
+    objects = [name for _, _, names in os.walk(os.path.join(test_store_dir, 'objects')) for name in names]
+    assert len(objects) == 2, 'Equal contents should be stored once.'
+    assert os.path.exists(store.object_path(digest, 'mp4'))
+    for name, content in contents.items():
+        with open(os.path.join(test_save_dir, name), 'rb') as f:
+            assert f.read() == content, 'Files should stay available under their names.'
+    assert os.path.samefile(os.path.join(test_save_dir, 'abc.mp4'), os.path.join(test_save_dir, 'def.mp4'))
+
+    with open(store.manifest_path) as f:
+        manifest = [json.loads(line) for line in f]
+    assert [os.path.basename(entry['path']) for entry in manifest] == ['abc.mp4', 'def.mp4', 'ghi.mp4']
+    assert manifest[0]['digest'] == manifest[1]['digest'] != manifest[2]['digest']
+    clean()
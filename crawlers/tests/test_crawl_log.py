@@ -0,0 +1,51 @@
+from crawlers.common.crawl_log import setup_logging, close_logging, event, MetricsReporter
+
+import json
+import logging
+import os
+import shutil
+
+test_log_dir = './tmp_crawl_log/'
+
+
+def read_events(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_buffered_json_events():
+    shutil.rmtree(test_log_dir, ignore_errors=True)
+    log_path = os.path.join(test_log_dir, 'test.log')
+    logger = setup_logging(test_log_dir, 'test.log', name='crawlers.test', buffer_capacity=10, console=False)
+
+    for i in range(5):
+        event(logger, f'Video {i} done', video_id=str(i), status='done', bytes=100 * i)
+    assert os.path.getsize(log_path) == 0, 'Events should be buffered.'
+    event(logger, 'Video 5 failed', logging.WARNING, video_id='5', status='failed', http_status=429)
+    events = read_events(log_path)
+    assert len(events) == 6, 'A warning should flush the buffered events.'
+    assert events[2]['video_id'] == '2' and events[2]['bytes'] == 200 and events[2]['level'] == 'INFO'
+    assert events[5]['http_status'] == 429 and events[5]['message'] == 'Video 5 failed'
+
+    counters = {'videos': 6}
+    with MetricsReporter(logger, lambda: dict(counters), interval=60):
+        counters['videos'] = 12
+    metrics = read_events(log_path)[-1]
+    assert metrics['event_type'] == 'metrics' and metrics['videos'] == 12, 'A last summary should be logged.'
+
+    close_logging(logger)
+    assert not logger.handlers
+    shutil.rmtree(test_log_dir)
+
+
+def test_rotation():
+    shutil.rmtree(test_log_dir, ignore_errors=True)
+    logger = setup_logging(test_log_dir, 'test.log', name='crawlers.test', max_bytes=1000, backup_count=2,
+                           buffer_capacity=1, console=False)
+    for i in range(100):
+        event(logger, f'Video {i} done', video_id=str(i))
+    close_logging(logger)
+
+    assert sorted(os.listdir(test_log_dir)) == ['test.log', 'test.log.1', 'test.log.2']
+    assert all(os.path.getsize(os.path.join(test_log_dir, name)) <= 1000 for name in os.listdir(test_log_dir))
+    shutil.rmtree(test_log_dir)
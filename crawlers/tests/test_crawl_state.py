@@ -0,0 +1,62 @@
+from crawlers.common import crawl_state
+from crawlers.common.crawl_state import CrawlState
+
+import os
+
+test_db_path = './test_crawl_state.db'
+
+
+def clean_db():
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(test_db_path + suffix):
+            os.remove(test_db_path + suffix)
+
+
+def test_add_and_outstanding():
+    clean_db()
+    state = CrawlState(test_db_path)
+
+    assert not state.has_videos('rnp'), 'A new database should be empty.'
+    assert state.add('rnp', ['1', '2', '3']) == 3, 'Three new videos should be registered.'
+    assert state.add('rnp', ['2', '3', '4']) == 1, 'Known videos should not be registered twice.'
+    assert state.has_videos('rnp')
+    assert not state.has_videos('youtube'), 'Sources should not mix.'
+
+    assert not state.listing_complete('rnp'), 'The listing should only be complete once marked.'
+    state.mark_listing_complete('rnp', 4)
+    assert state.listing_complete('rnp', 3) and state.listing_complete('rnp', 4)
+    assert not state.listing_complete('rnp', 5), 'A listing cut at a limit should not cover a larger one.'
+    assert not state.listing_complete('rnp'), 'A listing cut at a limit should not cover the whole listing.'
+    state.mark_listing_complete('rnp')
+    assert state.listing_complete('rnp') and state.listing_complete('rnp', 10 ** 6)
+    assert not state.listing_complete('youtube')
+
+    state.mark('rnp', '2', crawl_state.DONE, size=10, new_attempt=True)
+    outstanding = [video['video_id'] for video in state.outstanding('rnp')]
+    assert outstanding == ['1', '3', '4'], 'Done videos should not be outstanding and the order should be kept.'
+
+    state.close()
+    clean_db()
+
+
+def test_mark_and_resume():
+    clean_db()
+    state = CrawlState(test_db_path)
+    state.add('youtube', [('abc', 'https://www.youtube.com/watch?v=abc')])
+    state.mark('youtube', 'abc', crawl_state.VERSION_RESOLVED, url='http://host/abc.mp4', video_format='MP4',
+               new_attempt=True)
+    state.mark('youtube', 'abc', crawl_state.DENIED, new_attempt=True)
+    state.close()
+
+    # Reopening the database should give back the same state
+    state = CrawlState(test_db_path)
+    video = state.get('youtube', 'abc')
+    assert video['status'] == crawl_state.DENIED
+    assert video['url'] == 'http://host/abc.mp4', 'The resolved url should be kept.'
+    assert video['format'] == 'MP4'
+    assert video['attempts'] == 2
+    assert state.outstanding('youtube', max_attempts=2) == [], 'Videos over the attempts limit should be left out.'
+    assert state.counts('youtube')[crawl_state.DENIED] == 1
+
+    state.close()
+    clean_db()
@@ -0,0 +1,79 @@
+from crawlers.common.download_index import DownloadIndex
+
+import os
+import shutil
+
+test_dir = './test_download_index/'
+test_index_path = './test_download_index.json'
+
+
+def clean():
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    if os.path.exists(test_index_path):
+        os.remove(test_index_path)
+
+
+def write(name, size):
+    with open(os.path.join(test_dir, name), 'wb') as f:
+        f.write(b'\0' * size)
+
+
+def test_scan():
+    clean()
+    os.makedirs(test_dir)
+    write('abc.mp4', 10)
+    write('def.webm', 20)
+    write('ghi.mkv', 0)
+    write('jkl.mp4.part', 5)
+    write('mno.f137.mp4', 5)
+    write('notes.txt', 5)
+
+    index = DownloadIndex(test_dir)
+    assert len(index) == 3, 'Only complete videos should be indexed.'
+    assert index.get('abc') == ('mp4', 10)
+    assert 'def' in index
+    assert 'ghi' not in index, 'Empty files should not count as downloaded.'
+    assert 'jkl' not in index and 'mno' not in index, 'Partial and intermediate files should not count.'
+    assert not index.is_downloaded('def', min_size=21)
+    clean()
+
+
+def test_add_remove_and_persist():
+    clean()
+    os.makedirs(test_dir)
+    write('abc.mp4', 10)
+
+    index = DownloadIndex(test_dir, test_index_path)
+    write('def.mp4', 20)
+    index.add('def', 'mp4', 20)
+    index.remove('abc')
+    assert 'def' in index and 'abc' not in index
+    index.save()
+
+    os.remove(os.path.join(test_dir, 'def.mp4'))
+    write('ghi.mp4', 30)
+    index = DownloadIndex(test_dir, test_index_path)
+    assert 'def' not in index, 'Deleted files should be dropped from a persisted index.'
+    assert index.get('abc') == ('mp4', 10), 'Files on disk should be indexed even if missing from the index file.'
+    assert index.get('ghi') == ('mp4', 30)
+    clean()
+
+
+def test_total_size_links():
+    clean()
+    os.makedirs(test_dir)
+    write('abc.mp4', 10)
+    write('def.mp4', 20)
+    os.link(os.path.join(test_dir, 'def.mp4'), os.path.join(test_dir, 'ghi.mp4'))
+    os.symlink(os.path.abspath(os.path.join(test_dir, 'def.mp4')), os.path.join(test_dir, 'jkl.mp4'))
+
+    index = DownloadIndex(test_dir)
+    assert len(index) == 4
+    assert index.total_size() == 30, 'Files linked to the same content should be counted once.'
+    os.link(os.path.join(test_dir, 'abc.mp4'), os.path.join(test_dir, 'mno.mp4'))
+    index.add('mno', 'mp4', 10)
+    assert index.total_size() == 30
+    index.remove('abc')
+    assert index.total_size() == 30, 'The content is still used by the other video.'
+    clean()
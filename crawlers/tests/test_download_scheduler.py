@@ -0,0 +1,131 @@
+from crawlers.common import download_scheduler
+from crawlers.common.download_scheduler import DownloadScheduler, size_priority
+from crawlers.common.metrics import MetricsRegistry
+
+import collections
+import threading
+import time
+
+import pytest
+
+DiskUsage = collections.namedtuple('DiskUsage', 'total used free')
+
+
+def test_size_priority():
+    sizes = [300, None, 100, 200]
+    assert sorted(sizes, key=size_priority('smallest')) == [100, 200, 300, None], 'Unknown sizes should come last.'
+    assert sorted(sizes, key=size_priority('largest')) == [300, 200, 100, None]
+    assert size_priority('listed') is None
+    with pytest.raises(ValueError):
+        size_priority('random')
+
+
+def test_storage_budget():
+    metrics = MetricsRegistry()
+    scheduler = DownloadScheduler('.', max_bytes=1000, used_bytes=300, metrics=metrics)
+    admission = scheduler.admit(500)
+    assert admission is not None
+    assert scheduler.admit(300) is None, 'The reserved size should count in the budget.'
+    admission.consume(250)
+    assert scheduler.used_bytes == 550, 'The bytes received should move from the reservation to the bytes used.'
+    assert scheduler.admit(200) is not None, 'The bytes received should not be counted twice.'
+    admission.consume(250)
+    admission.release(500)
+    assert scheduler.used_bytes == 800 and scheduler.exhausted, 'The other admission still reserves 200 bytes.'
+
+    scheduler = DownloadScheduler('.', max_bytes=1000, used_bytes=300, metrics=metrics)
+    admission = scheduler.admit(None)
+    assert admission is not None, 'Downloads of unknown size should be admitted while the budget is not spent.'
+    admission.consume(400)
+    admission.release(0)
+    assert scheduler.used_bytes == 300, 'The bytes of a failed download should not count.'
+    admission = scheduler.admit(None)
+    admission.consume(800)
+    admission.release(800)
+    assert scheduler.exhausted
+    assert scheduler.admit(None) is None
+    scheduler.remove(800)
+    assert not scheduler.exhausted, 'The bytes of a removed file should not count anymore.'
+    assert scheduler.skipped == 1
+    assert metrics.value('crawler_downloads_skipped_total') == 2
+
+
+def test_bandwidth_budget():
+    admission = DownloadScheduler('.', bytes_per_second=1000000).admit()
+    start = time.perf_counter()
+    for _ in range(15):
+        admission.consume(100000)
+    # The first second worth of bytes is received right away
+    assert time.perf_counter() - start >= 0.45, 'The bytes should be paced to the budget.'
+
+
+def test_daily_budget(monkeypatch):
+    monkeypatch.setattr(download_scheduler, 'DAY', 0.2)
+    scheduler = DownloadScheduler('.', bytes_per_day=1000, check_interval=0.01)
+    time.sleep(0.3)
+    admission = scheduler.admit()
+    admission.consume(1000)
+    admission.release(1000)
+    start = time.perf_counter()
+    assert scheduler.admit() is not None, 'A new download should wait for the next day.'
+    # The day starts with the first bytes received, not when the scheduler is created
+    assert time.perf_counter() - start >= 0.15
+    assert scheduler.paused_seconds > 0
+
+
+def test_min_free_space(monkeypatch):
+    checks = []
+
+    def disk_usage(path):
+        checks.append(path)
+        return DiskUsage(10 ** 9, 10 ** 9 - 100, 100 if len(checks) < 3 else 10 ** 6)
+
+    monkeypatch.setattr(download_scheduler.shutil, 'disk_usage', disk_usage)
+    metrics = MetricsRegistry()
+    scheduler = DownloadScheduler('videos', min_free_bytes=1000, check_interval=0.01, metrics=metrics)
+    admission = scheduler.admit(500)
+    assert admission is not None, 'The download should wait until there is enough free space.'
+    assert checks == ['videos'] * 3
+    assert scheduler.paused_seconds >= 0.02
+    assert metrics.value('crawler_downloads_paused', reason='disk') == 0
+
+    # 10 ** 6 bytes free: the first download fits, but not along with the other one still to be written
+    monkeypatch.setattr(download_scheduler.shutil, 'disk_usage', lambda path: DiskUsage(10 ** 9, 10 ** 9, 10 ** 6))
+    scheduler = DownloadScheduler('videos', min_free_bytes=1000, check_interval=0.01)
+    first = scheduler.admit(600000)
+    assert first is not None and scheduler.paused_seconds == 0
+    admit = threading.Thread(target=scheduler.admit, args=(600000,))
+    admit.start()
+    time.sleep(0.1)
+    assert admit.is_alive(), 'The reservations of the running downloads should be subtracted from the free space.'
+    first.release(0)
+    admit.join(1)
+    assert not admit.is_alive()
+    assert scheduler.needs_sizes, 'The expected sizes are needed to check the free space they would leave.'
+
+
+def test_min_free_space_running(monkeypatch):
+    free = [10 ** 6]
+    monkeypatch.setattr(download_scheduler.shutil, 'disk_usage', lambda path: DiskUsage(10 ** 9, 0, free[0]))
+    monkeypatch.setattr(download_scheduler, 'DISK_CHECK_INTERVAL', 0)
+    scheduler = DownloadScheduler('videos', min_free_bytes=1000, check_interval=0.01)
+    first, second = scheduler.admit(), scheduler.admit()  # Of unknown sizes, so they fit at admission
+    first.consume(500000)
+    free[0] = 500
+    with pytest.raises(OSError):
+        first.consume(500000)
+    assert first.stopped
+    with pytest.raises(OSError):
+        second.consume(100)
+    assert second.stopped, 'Every running download should be stopped once the disk is below the min free space.'
+    first.release(0)
+    second.release(0)
+    assert scheduler.used_bytes == 0
+
+    admit = threading.Thread(target=scheduler.admit)
+    admit.start()
+    time.sleep(0.1)
+    assert admit.is_alive(), 'New downloads should wait for free space.'
+    free[0] = 10 ** 6
+    admit.join(1)
+    assert not admit.is_alive()
@@ -0,0 +1,107 @@
+from crawlers.common.http_client import HttpClient, RetryPolicy, retry_after_seconds, iter_body
+from crawlers.common.rate_limiter import AdaptiveRateLimiter, host_of
+from crawlers.tests.mock_server import MockRNPServer
+
+import email.utils
+import time
+
+import requests
+
+
+def make_response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return response
+
+
+def test_retry_policy():
+    policy = RetryPolicy(max_retries=3, backoff_factor=2, max_backoff=10, jitter=False)
+
+    assert policy.should_retry(0, response=make_response(429)), 'Throttled requests should be retried.'
+    assert policy.should_retry(2, response=make_response(503))
+    assert not policy.should_retry(3, response=make_response(503)), 'Retries should stop at max_retries.'
+    assert not policy.should_retry(0, response=make_response(404)), 'Client errors should not be retried.'
+    assert policy.should_retry(0, exception=requests.ConnectionError()), 'Connection errors should be retried.'
+
+    assert [policy.delay(attempt) for attempt in range(4)] == [2, 4, 8, 10], 'Backoff should double up to the cap.'
+    assert policy.delay(0, make_response(429, {'Retry-After': '7'})) == 7, 'Retry-After should be honored.'
+    assert policy.delay(0, make_response(503, {'Retry-After': '3600'})) == 10, 'Retry-After should be capped.'
+
+    jittered = RetryPolicy(backoff_factor=2, jitter=True)
+    assert all(0 <= jittered.delay(2) <= 8 for _ in range(100)), 'Jitter should stay within the backoff.'
+
+
+def test_retry_after_date():
+    in_a_minute = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 <= retry_after_seconds(make_response(429, {'Retry-After': in_a_minute})) <= 60
+    assert retry_after_seconds(make_response(429)) is None
+    assert retry_after_seconds(make_response(429, {'Retry-After': 'soon'})) is None
+
+
+def test_http_client_retries_and_pooling():
+    with MockRNPServer(n_videos=2, throttle_first=2) as server:
+        client = HttpClient(pool_maxsize=2, retry_policy=RetryPolicy(max_retries=3, jitter=False))
+        response = client.get(f'{server.api_url}/video/versions/{server.video_ids[0]}',
+                              headers={'clientkey': server.client_key})
+        assert response.status_code == 200, 'Throttled requests should eventually succeed.'
+        assert len(server.requests) == 3, 'Two throttled attempts and a successful one were expected.'
+
+        for _ in range(5):
+            client.get(f'{server.api_url}/video/versions/{server.video_ids[1]}',
+                       headers={'clientkey': server.client_key}).content
+        assert server.connections == 1, 'Sequential requests should reuse a single kept-alive connection.'
+
+        client.close()
+
+    with MockRNPServer(throttle_first=10) as server:
+        client = HttpClient(retry_policy=RetryPolicy(max_retries=1, jitter=False))
+        assert client.get(f'{server.api_url}/video').status_code == 429, 'The last response should be returned.'
+        assert len(server.requests) == 2
+        client.close()
+
+
+def test_http_client_rate_limiter_feedback():
+    limiter = AdaptiveRateLimiter(rate=100, increase_factor=1.5, decrease_factor=0.5, max_rate=1000)
+    with MockRNPServer(throttle_first=1) as server:
+        client = HttpClient(retry_policy=RetryPolicy(max_retries=2, jitter=False), rate_limiter=limiter)
+        host = host_of(server.base_url)
+        assert client.get(f'{server.api_url}/video', headers={'clientkey': server.client_key}).status_code == 200
+        # Throttled once (100 * 0.5), then successful once (50 * 1.5)
+        assert limiter.current_rate(host) == 75, 'The client should report the outcome of each attempt.'
+        client.close()
+
+
+def test_http_client_not_rate_limited():
+    limiter = AdaptiveRateLimiter(rate=0.01)  # One request every 100 seconds
+    with MockRNPServer() as server:
+        client = HttpClient(rate_limiter=limiter)
+        start = time.perf_counter()
+        for _ in range(3):
+            assert client.get(f'{server.base_url}/vod/10000.mp4', rate_limited=False).status_code == 200
+        assert time.perf_counter() - start < 5, 'File requests should not wait for the budget of the API.'
+        assert limiter.current_rate(host_of(server.base_url)) == 0.01, 'Their outcome should not tune the budget.'
+        client.close()
+
+
+def test_iter_body():
+    with MockRNPServer(n_videos=1, video_size=100001) as server:
+        client = HttpClient(pool_maxsize=1)
+        url = f'{server.base_url}/vod/{server.video_ids[0]}.mp4'
+        for _ in range(3):
+            with client.get(url, stream=True) as response:
+                chunks = [bytes(chunk) for chunk in iter_body(response, chunk_size=16384)]
+            assert b''.join(chunks) == server.payload(server.video_ids[0])
+            assert max(len(chunk) for chunk in chunks) <= 16384
+        assert server.connections == 1, 'The connection should be released to the pool once the body is read.'
+        client.close()
+
+
+def test_http_client_retries_failures():
+    with MockRNPServer(n_videos=1, fail_every=2, latency=0.01) as server:
+        client = HttpClient(retry_policy=RetryPolicy(max_retries=1, jitter=False, backoff_factor=0))
+        statuses = [client.get(f'{server.api_url}/video/versions/{server.video_ids[0]}',
+                               headers={'clientkey': server.client_key}).status_code for _ in range(3)]
+        assert statuses == [200, 200, 200], 'Every failed request should succeed when retried.'
+        assert len(server.requests) == 5, 'The 2nd and 4th requests should have failed and been retried.'
+        client.close()
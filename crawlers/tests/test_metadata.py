@@ -0,0 +1,69 @@
+from crawlers.youtube.metadata import MetadataCache, MetadataFilter, prefetch_metadata, permanent_error, YOUTUBE_HOST
+from crawlers.common.rate_limiter import AdaptiveRateLimiter
+from crawlers.youtube.video_urls import watch_url
+from crawlers.tests import utils
+from crawlers.tests.stub_youtube_dl import StubYoutubeDL
+
+import youtube_dl
+
+test_cache_dir = './tmp_metadata/'
+
+
+def test_metadata_filter():
+    info = {'id': 'abc', 'duration': 120, 'height': 720, 'filesize': 1000, 'upload_date': '20200101'}
+    assert MetadataFilter()(info), 'An empty filter should accept every video.'
+    assert MetadataFilter(min_duration=60, max_duration=600, max_height=1080, max_filesize=1000,
+                          uploaded_after='20190101', uploaded_before='20200101')(info)
+    assert not MetadataFilter(max_duration=60)(info)
+    assert not MetadataFilter(min_height=1080)(info)
+    assert not MetadataFilter(max_filesize=999)(info)
+    assert not MetadataFilter(max_filesize=999)({'filesize': None, 'filesize_approx': 2000})
+    assert not MetadataFilter(uploaded_after='20210101')(info)
+    assert MetadataFilter(max_duration=60)({'id': 'abc'}), 'Videos missing a field should be accepted.'
+    assert MetadataFilter().rejection({'id': 'abc', 'error': 'Video unavailable'}) == 'Video unavailable'
+    assert permanent_error('ERROR: abc: Private video. Sign in if you\'ve been granted access to this video')
+    assert not permanent_error('ERROR: abc: Unable to download webpage: HTTP Error 429: Too Many Requests')
+
+
+def test_prefetch_metadata(monkeypatch):
+    utils.clean_temporary_dir(test_cache_dir)
+    StubYoutubeDL.reset()
+    monkeypatch.setattr(youtube_dl, 'YoutubeDL', StubYoutubeDL)
+    StubYoutubeDL.fail_always = {'video000003'}
+    StubYoutubeDL.throttle_once = {'video000004'}
+
+    video_ids = [f'video{i:06d}' for i in range(20)]
+    videos = [(video_id, watch_url(video_id)) for video_id in video_ids]
+    video_filter = MetadataFilter(max_height=480)
+    expected = {video_id for video_id in video_ids
+                if video_id != 'video000003' and StubYoutubeDL().info(video_id)['height'] <= 480}
+    assert 0 < len(expected) < 19 and 'video000004' in expected
+
+    rejected = []
+    rate_limiter = AdaptiveRateLimiter(rate=1000, increase_factor=1.0)
+    accepted = prefetch_metadata(videos, MetadataCache(test_cache_dir), video_filter, workers=4,
+                                 rate_limiter=rate_limiter, rejected=rejected)
+    assert {video_id for video_id, _, _ in accepted} == expected - {'video000004'}
+    assert len(rejected) == 21 - len(expected)
+    assert ('video000003', watch_url('video000003'), 'ERROR: video000003: Video unavailable') in rejected
+    assert rate_limiter.current_rate(YOUTUBE_HOST) < 1000, 'A 429 should slow the pace down.'
+    assert all(not download for _, download in StubYoutubeDL.calls), 'No video should be downloaded.'
+    assert len(StubYoutubeDL.calls) == 20
+
+    # A rerun should be answered by the cache alone, unavailable videos included, except for the throttled one
+    StubYoutubeDL.calls = []
+    accepted = prefetch_metadata(videos, MetadataCache(test_cache_dir), video_filter, workers=4)
+    assert {video_id for video_id, _, _ in accepted} == expected
+    assert StubYoutubeDL.calls == [(watch_url('video000004'), False)], \
+        'Only videos that failed for a transient reason should be queried again.'
+
+    # The metadata cached for the best format does not tell the height of another one
+    StubYoutubeDL.calls, StubYoutubeDL.instances = [], []
+    accepted = prefetch_metadata(videos, MetadataCache(test_cache_dir), video_filter, workers=4,
+                                 video_format='worst')
+    assert {video_id for video_id, _, _ in accepted} == expected
+    assert len(StubYoutubeDL.calls) == 19, 'Videos cached for another format should be queried again.'
+    assert all(ydl.params['format'] == 'worst' for ydl in StubYoutubeDL.instances), \
+        'The metadata should be resolved for the format of the run.'
+
+    utils.clean_temporary_dir(test_cache_dir)
@@ -0,0 +1,80 @@
+from crawlers.common.metrics import MetricsRegistry, MetricsServer, MetricsFile, ByteMeter, Progress, endpoint_of
+
+import io
+import os
+import shutil
+import time
+import requests
+
+
+def test_registry_render():
+    metrics = MetricsRegistry(buckets=(0.1, 1.0))
+    metrics.describe('crawler_videos_total', 'Videos processed.')
+    metrics.inc('crawler_videos_total', status='done')
+    metrics.inc('crawler_videos_total', 2, status='done')
+    metrics.inc('crawler_videos_total', status='denied')
+    metrics.adjust('crawler_queued_videos', 3)
+    metrics.adjust('crawler_queued_videos', -1)
+    for latency in (0.05, 0.5, 5.0):
+        metrics.observe('crawler_http_request_seconds', latency, endpoint='host/video/{id}')
+
+    lines = metrics.render().splitlines()
+    assert '# HELP crawler_videos_total Videos processed.' in lines
+    assert '# TYPE crawler_videos_total counter' in lines
+    assert 'crawler_videos_total{status="done"} 3' in lines
+    assert 'crawler_videos_total{status="denied"} 1' in lines
+    assert 'crawler_queued_videos 2' in lines
+    assert 'crawler_http_request_seconds_bucket{endpoint="host/video/{id}",le="0.1"} 1' in lines
+    assert 'crawler_http_request_seconds_bucket{endpoint="host/video/{id}",le="1.0"} 2' in lines
+    assert 'crawler_http_request_seconds_bucket{endpoint="host/video/{id}",le="+Inf"} 3' in lines
+    assert 'crawler_http_request_seconds_count{endpoint="host/video/{id}"} 3' in lines
+    assert metrics.value('crawler_videos_total', status='done') == 3
+
+    try:
+        metrics.observe('crawler_videos_total', 1.0)
+        assert False, 'A counter should not be observed as a histogram.'
+    except ValueError:
+        pass
+
+
+def test_endpoint_of():
+    assert endpoint_of('https://video.rnp.br/services/video/versions/123') == \
+        'video.rnp.br/services/video/versions/{id}'
+    assert endpoint_of('http://127.0.0.1:8000/files/00001.mp4') == '127.0.0.1:8000/files/{id}'
+
+
+def test_server_and_file():
+    metrics = MetricsRegistry()
+    metrics.inc('crawler_downloaded_bytes_total', 1024, worker='rnp-worker_0')
+    with MetricsServer(metrics) as server:
+        r = requests.get(f'http://127.0.0.1:{server.port}/metrics')
+        assert r.status_code == 200 and r.headers['content-type'].startswith('text/plain')
+        assert 'crawler_downloaded_bytes_total{worker="rnp-worker_0"} 1024' in r.text
+        assert requests.get(f'http://127.0.0.1:{server.port}/other').status_code == 404
+
+    metrics_dir = './tmp_metrics/'
+    path = os.path.join(metrics_dir, 'crawler.prom')
+    with MetricsFile(metrics, path, interval=60):
+        metrics.inc('crawler_downloaded_bytes_total', 1024, worker='rnp-worker_0')
+    with open(path) as f:
+        assert 'crawler_downloaded_bytes_total{worker="rnp-worker_0"} 2048' in f.read(), \
+            'The final metrics should be written when stopped.'
+    shutil.rmtree(metrics_dir)
+
+
+def test_throttled_updates():
+    metrics = MetricsRegistry()
+    meter = ByteMeter(metrics, 'bytes_total', interval=60, worker='w')
+    for _ in range(1000):
+        meter.add(1024)
+    assert metrics.value('bytes_total', worker='w') == 0, 'Bytes should be buffered until the interval passes.'
+    meter.flush()
+    assert metrics.value('bytes_total', worker='w') == 1024 * 1000
+
+    stream = io.StringIO()
+    progress = Progress(total=1024 * 1000, interval=60, stream=stream)
+    for _ in range(1000):
+        progress.update(1024)
+    progress.close()
+    assert stream.getvalue().count('\r') == 2, 'The bar should only be drawn once per interval and when closed.'
+    assert '1000.0 KiB of 1000.0 KiB' in stream.getvalue()
@@ -0,0 +1,90 @@
+from crawlers.common.pipeline import Pipeline, Stage
+from crawlers.common.metrics import MetricsRegistry
+
+import threading
+import time
+
+
+def test_pipeline_stages():
+    metrics = MetricsRegistry()
+    verified = []
+    lock = threading.Lock()
+    read = []
+
+    def source():
+        for n in range(20):
+            read.append(n)
+            yield n
+
+    def resolve(n):
+        return None if n % 5 == 0 else n * 10  # Every 5th item leaves the pipeline
+
+    def download(n):
+        time.sleep(0.01)  # The slowest stage
+        if n == 70:
+            raise ValueError('download failed')
+        return n + 1
+
+    def verify(n):
+        with lock:
+            verified.append(n)
+
+    errors = []
+    stages = [Stage('resolve', resolve, workers=2), Stage('download', download, workers=2, queue_size=3),
+              Stage('verify', verify)]
+    pipeline = Pipeline(stages, metrics, on_error=lambda stage, item, e: errors.append((stage.name, item)))
+    pipeline.run(source())
+
+    expected = [n * 10 + 1 for n in range(20) if n % 5 and n != 7]
+    assert sorted(verified) == expected, 'Every item should go through every stage, unless dropped or failed.'
+    assert errors == [('download', 70)]
+    stats = pipeline.stats()
+    assert stats['resolve']['items'] == 20 and stats['download']['items'] == 16 and stats['verify']['items'] == 15
+    assert stats['download']['max_depth'] <= 3, 'The queue of a stage should be bounded.'
+    assert stats['download']['mean_seconds'] >= 0.01
+    assert metrics.value('crawler_stage_items_total', stage='download') == 16
+    assert metrics.value('crawler_stage_seconds', stage='verify') == 15
+    for stage in ('resolve', 'download', 'verify'):
+        assert metrics.value('crawler_stage_queue_depth', stage=stage) == 0
+        assert metrics.value('crawler_stage_busy_workers', stage=stage) == 0
+
+
+def test_pipeline_backpressure():
+    read = []
+    release = threading.Event()
+
+    def source():
+        for n in range(100):
+            read.append(n)
+            yield n
+
+    stages = [Stage('slow', lambda n: release.wait(), workers=1, queue_size=2)]
+    pipeline = Pipeline(stages)
+    thread = threading.Thread(target=pipeline.run, args=(source(),))
+    thread.start()
+    time.sleep(0.1)
+    # One item being processed, two queued and one waiting for room in the queue
+    assert len(read) <= 4, 'The source should only be read as the first stage has room.'
+    release.set()
+    thread.join()
+    assert len(read) == 100
+
+
+def test_pipeline_priority():
+    processed = []
+    release = threading.Event()
+
+    def download(size):
+        release.wait()
+        processed.append(size)
+
+    sizes = [50, 20, 40, 10, 30, 60]
+    pipeline = Pipeline([Stage('download', download, workers=1, queue_size=10, priority=lambda size: size)])
+    thread = threading.Thread(target=pipeline.run, args=(sizes,))
+    thread.start()
+    time.sleep(0.1)
+    release.set()
+    thread.join()
+    assert sorted(processed) == sorted(sizes)
+    # The first item was taken before the others arrived, the rest wait in the queue
+    assert processed[1:] == sorted(processed[1:]), 'The queued items should be processed in the order of their keys.'
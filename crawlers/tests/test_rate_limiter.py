@@ -0,0 +1,45 @@
+from crawlers.common.rate_limiter import AdaptiveRateLimiter, host_of
+
+import time
+
+
+def test_adaptive_rate_limiter():
+    limiter = AdaptiveRateLimiter(rate=1.0, min_rate=0.1, max_rate=4.0, increase_factor=2.0, decrease_factor=0.5,
+                                  failure_threshold=2)
+
+    limiter.success('a.com')
+    limiter.success('a.com')
+    assert limiter.current_rate('a.com') == 4.0, 'Successes should speed up the host.'
+    limiter.success('a.com')
+    assert limiter.current_rate('a.com') == 4.0, 'The rate should not go above max_rate.'
+    assert limiter.current_rate('b.com') == 1.0, 'Each host should have its own rate.'
+
+    limiter.throttled('a.com')
+    assert limiter.current_rate('a.com') == 2.0, 'Throttled requests should back off the host.'
+
+    limiter.failure('b.com')
+    assert limiter.current_rate('b.com') == 1.0, 'A single failure should not back off the host.'
+    limiter.failure('b.com')
+    assert limiter.current_rate('b.com') == 0.5, 'Consecutive failures should back off the host.'
+
+    for _ in range(10):
+        limiter.throttled('b.com')
+    assert limiter.current_rate('b.com') == 0.1, 'The rate should not go below min_rate.'
+
+
+def test_adaptive_rate_limiter_pacing():
+    limiter = AdaptiveRateLimiter(rate=20, increase_factor=1.0)
+    start = time.perf_counter()
+    for _ in range(5):
+        limiter.acquire('a.com')
+    assert time.perf_counter() - start >= 0.19, 'Requests should be paced at the rate of the host.'
+
+    limiter.throttled('a.com', retry_after=0.3)
+    assert limiter.acquire('a.com') >= 0.25, 'Retry-After should block the host.'
+
+    start = time.perf_counter()
+    limiter.acquire('other.com')
+    assert time.perf_counter() - start < 0.1, 'Other hosts should not be blocked.'
+
+    assert host_of('https://video.rnp.br/services/video') == 'video.rnp.br'
+    assert host_of('video.rnp.br') == 'video.rnp.br'
@@ -1,12 +1,29 @@
 from crawlers.rnp.rnp_crawler import \
     log, \
     crawl_and_download, \
+    download_version, \
+    API_URL, \
+    CrawlCounters, \
     scandown, \
     download_file, \
+    download_file_segmented, \
+    iter_catalog, \
     sizeof_fmt
 
+from crawlers.rnp import rnp_crawler
 from crawlers.tests import utils
-import os, pickle
+from crawlers.tests.mock_server import MockRNPServer
+from crawlers.common import crawl_state
+from crawlers.common.crawl_state import CrawlState
+from crawlers.common import download_scheduler
+from crawlers.common.content_store import ContentStore
+from crawlers.common.download_scheduler import DownloadScheduler
+from crawlers.common.http_client import HttpClient
+from crawlers.common.rate_limiter import AdaptiveRateLimiter, host_of
+from crawlers.common.version_policy import VersionPolicy
+import collections, hashlib, io, json, logging, os, pickle, shutil, threading, time
+
+import pytest
 
 test_save_dir = './tmp/'
 CLIENT_KEY = None
@@ -66,3 +83,556 @@ def test_sizeof_fmt():
     assert sizeof_fmt(2048) == f'2.0 KiB', '2048 bytes should be 2.0 KiB.'
     assert sizeof_fmt(1024 * 1024) == f'1.0 MiB', '1024*1024 bytes should be 1.0 MiB.'
     assert sizeof_fmt(1024 ** 3) == f'1.0 GiB', '1024**3 bytes should be 1.0 GiB.'
+
+
+def test_crawl_and_download_concurrent():
+    save_dir = './tmp_concurrent/'
+    utils.create_dir(save_dir)
+
+    with MockRNPServer(n_videos=6) as server:
+        start = time.perf_counter()
+        crawl_and_download(server.client_key, save_dir, max_n=6, lookup_workers=3, download_workers=2,
+                           requests_per_second=20, api_url=server.api_url)
+        elapsed = time.perf_counter() - start
+
+    # Checking if the videos were successfully downloaded and have the content served by the mock
+    utils.check_videos(save_dir, expected_number_of_videos=6)
+    for video_id in server.video_ids:
+        with open(os.path.join(save_dir, video_id + '.mp4'), 'rb') as f:
+            assert f.read() == server.payload(video_id), 'Downloaded content should match the served file.'
+
+    # 6 versions requests at 20 requests per second should take at least 0.25s
+    assert elapsed >= 0.25, 'The global requests per second budget should be respected.'
+
+    utils.clean_temporary_dir(save_dir)
+
+
+def test_crawl_and_download_counters():
+    save_dir = './tmp_counters/'
+    log_dir = './tmp_counters_log/'
+    utils.create_dir(save_dir)
+    utils.create_dir(log_dir)
+
+    # One of the listed videos answers 404 to the versions request
+    with MockRNPServer(n_videos=4, missing_ids=['99999']) as server:
+        crawl_and_download(server.client_key, save_dir, max_n=5, log_file_path=log_dir, lookup_workers=4,
+                           download_workers=4, requests_per_second=None, api_url=server.api_url)
+
+    with open(os.path.join(log_dir, 'probing.log')) as log_file:
+        events = [json.loads(line) for line in log_file]
+    messages = [event['message'] for event in events]
+    assert 'Number of successful requests:4' in messages, 'Successful requests should be aggregated across workers.'
+    assert 'Number of failed requests:1' in messages, 'Failed requests should be aggregated across workers.'
+    assert 'Number of denied requests:0' in messages, 'No download should have been denied.'
+
+    # Each video should have a structured event, and the run a final metrics summary
+    done = [event for event in events if event.get('status') == crawl_state.DONE]
+    assert sorted(event['video_id'] for event in done) == sorted(set(server.video_ids) - {'99999'})
+    assert all(event['bytes'] > 0 and event['latency'] >= 0 for event in done)
+    failed = [event for event in events if event.get('status') == crawl_state.FAILED]
+    assert [(event['video_id'], event['http_status']) for event in failed] == [('99999', 404)]
+    metrics = [event for event in events if event.get('event_type') == 'metrics']
+    assert metrics and metrics[-1]['successful_requests'] == 4
+
+    utils.clean_temporary_dir(save_dir)
+    utils.clean_temporary_dir(log_dir)
+
+
+def test_crawl_and_download_metrics():
+    save_dir = './tmp_metrics_run/'
+    metrics_path = './tmp_metrics_run.prom'
+    utils.create_dir(save_dir)
+
+    with MockRNPServer(n_videos=3, missing_ids=['99999']) as server:
+        crawl_and_download(server.client_key, save_dir, max_n=4, lookup_workers=2, download_workers=2,
+                           requests_per_second=None, api_url=server.api_url, metrics_file=metrics_path)
+
+    with open(metrics_path) as f:
+        lines = f.read().splitlines()
+    assert 'crawler_videos_total{status="done"} 3' in lines
+    assert 'crawler_videos_total{status="failed"} 1' in lines
+    assert 'crawler_stage_queue_depth{stage="download"} 0' in lines and 'crawler_downloads_in_progress 0' in lines
+    downloaded = sum(float(line.split()[-1]) for line in lines if line.startswith('crawler_downloaded_bytes_total{'))
+    assert downloaded == sum(len(server.payload(video_id)) for video_id in server.video_ids if video_id != '99999')
+    assert any(line.startswith('crawler_http_request_seconds_count{endpoint="127.0.0.1:') and
+               '/services/video/versions/{id}"} 4' in line for line in lines), 'Latency should be kept per endpoint.'
+
+    utils.clean_temporary_dir(save_dir)
+    os.remove(metrics_path)
+
+
+def test_crawl_and_download_verify():
+    save_dir = './tmp_verify/'
+    log_dir = './tmp_verify_log/'
+    db_path = './tmp_verify.db'
+    utils.clean_temporary_dir(log_dir)
+
+    # Valid mp4 files pass the verification stage
+    with MockRNPServer(n_videos=4) as server:
+        crawl_and_download(server.client_key, save_dir, max_n=4, log_file_path=log_dir, lookup_workers=2,
+                           download_workers=1, requests_per_second=None, api_url=server.api_url, verify=True,
+                           queue_size=1)
+    utils.check_videos(save_dir, expected_number_of_videos=4)
+    with open(os.path.join(log_dir, 'probing.log')) as log_file:
+        stages = [json.loads(line) for line in log_file if '"stages"' in line][-1]['stages']
+    assert [stages[name]['items'] for name in ('resolve', 'download', 'verify')] == [4, 4, 4]
+    assert stages['download']['max_depth'] <= 1
+    utils.clean_temporary_dir(save_dir)
+
+    # Files that are not videos are moved out of the way and marked as failed, to be downloaded again
+    with MockRNPServer(n_videos=2, video_size=20) as server:
+        crawl_and_download(server.client_key, save_dir, max_n=2, requests_per_second=None, api_url=server.api_url,
+                           verify=True, state_db_path=db_path)
+    assert sorted(os.listdir(save_dir)) == sorted(video_id + '.mp4.corrupt' for video_id in server.video_ids)
+    state = CrawlState(db_path)
+    assert state.counts('rnp')[crawl_state.FAILED] == 2
+    state.close()
+    utils.clean_temporary_dir(save_dir)
+
+    # A valid mp4 left with another size than the one of the file served is found to be bad too
+    utils.clean_temporary_dir(log_dir)
+    utils.create_dir(save_dir)
+    with MockRNPServer(n_videos=1) as server:
+        with open(os.path.join(save_dir, server.video_ids[0] + '.mp4'), 'wb') as f:
+            f.write(server.payload(server.video_ids[0], 200))
+        crawl_and_download(server.client_key, save_dir, max_n=1, log_file_path=log_dir, requests_per_second=None,
+                           api_url=server.api_url, verify=True)
+    with open(os.path.join(log_dir, 'probing.log')) as log_file:
+        corrupt = [json.loads(line) for line in log_file if '"corrupt"' in line]
+    assert [event['reason'] for event in corrupt] == ['size 200 differs from the expected 4096']
+
+    utils.clean_temporary_dir(save_dir)
+    utils.clean_temporary_dir(log_dir)
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def test_crawl_and_download_metadata_cache():
+    save_dir = './tmp_metadata_cache/'
+    cache_path = './tmp_metadata_cache.db'
+
+    def versions_requests(server):
+        return len([path for path in server.requests if '/versions/' in path])
+
+    with MockRNPServer(n_videos=3) as server:
+        crawl_and_download(server.client_key, save_dir, max_n=3, requests_per_second=None, api_url=server.api_url,
+                           metadata_cache_path=cache_path)
+        assert versions_requests(server) == 3
+
+        # Fresh entries spare the versions requests
+        crawl_and_download(server.client_key, save_dir, max_n=3, requests_per_second=None, api_url=server.api_url,
+                           metadata_cache_path=cache_path)
+        assert versions_requests(server) == 3, 'Cached versions should not be requested again.'
+
+        # Stale entries are revalidated with their ETag
+        crawl_and_download(server.client_key, save_dir, max_n=3, requests_per_second=None, api_url=server.api_url,
+                           metadata_cache_path=cache_path, metadata_ttl=0)
+        assert versions_requests(server) == 6
+        assert server.not_modified == 3, 'Unchanged versions should be answered with a 304.'
+    utils.check_videos(save_dir, expected_number_of_videos=3)
+
+    utils.clean_temporary_dir(save_dir)
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(cache_path + suffix):
+            os.remove(cache_path + suffix)
+
+
+def test_crawl_and_download_catalog():
+    save_dir = './tmp_catalog/'
+    catalog_path = './tmp_catalog.db'
+
+    with MockRNPServer(n_videos=5) as server:
+        crawl_and_download(server.client_key, save_dir, max_n=100, requests_per_second=None, api_url=server.api_url,
+                           lookup_workers=2, catalog_path=catalog_path, catalog_page_size=2)
+        utils.check_videos(save_dir, expected_number_of_videos=5)
+        assert server.requests.count('/services/video') == 4
+
+        # Later runs only fetch the tail of the catalog, with the new videos
+        server.video_ids.append('20000')
+        crawl_and_download(server.client_key, save_dir, max_n=100, requests_per_second=None, api_url=server.api_url,
+                           catalog_path=catalog_path, catalog_page_size=2)
+        assert server.requests.count('/services/video') == 6
+        assert os.path.exists(os.path.join(save_dir, '20000.mp4'))
+
+    utils.clean_temporary_dir(save_dir)
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(catalog_path + suffix):
+            os.remove(catalog_path + suffix)
+
+
+def test_crawl_and_download_version_policy():
+    save_dir = './tmp_version_policy/'
+    renditions = [(1280, 720, 2000), (854, 480, 800), (320, 240, 300)]
+
+    with MockRNPServer(n_videos=2, video_size=20000, renditions=renditions) as server:
+        crawl_and_download(server.client_key, save_dir, max_n=2, requests_per_second=None, api_url=server.api_url,
+                           version_policy=VersionPolicy(min_height=480, prefer='smallest'))
+        assert sorted(path for path in server.requests if path.startswith('/vod/')) == \
+            ['/vod/10000_480p.mp4', '/vod/10001_480p.mp4'], 'The smallest version of at least 480p should be chosen.'
+        for video_id in server.video_ids:
+            assert os.path.getsize(os.path.join(save_dir, video_id + '.mp4')) == 8000
+        utils.clean_temporary_dir(save_dir)
+
+        # The sizes of the versions are asked with HEAD requests, until one fits
+        crawl_and_download(server.client_key, save_dir, max_n=2, requests_per_second=None, api_url=server.api_url,
+                           version_policy=VersionPolicy(max_size=10000))
+        assert server.requests.count('HEAD /vod/10000.mp4') == 1
+        assert server.requests.count('HEAD /vod/10000_480p.mp4') == 1
+        assert 'HEAD /vod/10000_240p.mp4' not in server.requests
+        utils.check_videos(save_dir, expected_number_of_videos=2)
+        assert os.path.getsize(os.path.join(save_dir, '10000.mp4')) == 8000
+
+    utils.clean_temporary_dir(save_dir)
+
+
+def test_crawl_and_download_scheduler():
+    save_dir = './tmp_scheduler/'
+    video_sizes = {'10000': 30000, '10001': 10000, '10002': 20000}
+
+    with MockRNPServer(n_videos=3, video_sizes=video_sizes) as server:
+        crawl_and_download(server.client_key, save_dir, max_n=3, requests_per_second=None, api_url=server.api_url,
+                           max_bytes=35000, bytes_per_second=10 ** 7, download_order='smallest')
+        assert sorted(path for path in server.requests if path.startswith('HEAD ')) == \
+            ['HEAD /vod/10000.mp4', 'HEAD /vod/10001.mp4', 'HEAD /vod/10002.mp4'], \
+            'The size of each file should be asked before it is queued.'
+        downloaded = [name for name in os.listdir(save_dir) if name.endswith('.mp4')]
+        assert 0 < len(downloaded) < 3, 'Videos that do not fit in the storage budget should be skipped.'
+        assert sum(os.path.getsize(os.path.join(save_dir, name)) for name in downloaded) <= 35000
+        first_run_requests = len(server.requests)
+
+        # The videos already in the save_dir count in the budget of the next run
+        crawl_and_download(server.client_key, save_dir, max_n=3, requests_per_second=None, api_url=server.api_url,
+                           max_bytes=35000)
+        assert not [path for path in server.requests[first_run_requests:] if path.startswith('/vod/')]
+
+    utils.clean_temporary_dir(save_dir)
+
+
+def test_crawl_and_download_resume():
+    save_dir = './tmp_resume/'
+    db_path = './tmp_resume.db'
+    utils.create_dir(save_dir)
+
+    with MockRNPServer(n_videos=4, missing_ids=['99999']) as server:
+        crawl_and_download(server.client_key, save_dir, max_n=5, requests_per_second=None, api_url=server.api_url,
+                           state_db_path=db_path)
+        first_run_requests = len(server.requests)
+
+        # A restarted run should only visit the video that failed, without fetching the catalog again
+        crawl_and_download(server.client_key, save_dir, max_n=5, requests_per_second=None, api_url=server.api_url,
+                           state_db_path=db_path)
+        second_run_requests = server.requests[first_run_requests:]
+
+    assert second_run_requests == ['/services/video/versions/99999'], 'Only outstanding videos should be visited.'
+
+    state = CrawlState(db_path)
+    counts = state.counts('rnp')
+    assert counts[crawl_state.DONE] == 4, 'Downloaded videos should be recorded as done.'
+    assert state.get('rnp', '99999')['attempts'] == 2, 'Attempts should be counted across runs.'
+    state.close()
+
+    utils.check_videos(save_dir, expected_number_of_videos=4)
+    utils.clean_temporary_dir(save_dir)
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def test_crawl_and_download_resume_incomplete_listing():
+    save_dir = './tmp_resume_listing/'
+    db_path = './tmp_resume_listing.db'
+    utils.create_dir(save_dir)
+    # A previous run was interrupted after registering (and downloading) only part of the catalog
+    state = CrawlState(db_path)
+    state.add('rnp', ['10000', '10001'])
+    state.mark('rnp', '10000', crawl_state.DONE, size=4096)
+    state.close()
+
+    with MockRNPServer(n_videos=4) as server:
+        crawl_and_download(server.client_key, save_dir, max_n=4, requests_per_second=None, api_url=server.api_url,
+                           state_db_path=db_path)
+        assert '/services/video' in server.requests, 'The catalog should be fetched again.'
+        assert '/services/video/versions/10000' not in server.requests, 'Done videos should not be visited.'
+        first_run_requests = len(server.requests)
+
+        crawl_and_download(server.client_key, save_dir, max_n=4, requests_per_second=None, api_url=server.api_url,
+                           state_db_path=db_path)
+        assert server.requests[first_run_requests:] == [], 'Once registered, the catalog should not be fetched again.'
+
+    state = CrawlState(db_path)
+    assert state.counts('rnp')[crawl_state.DONE] == 4
+    state.close()
+    utils.clean_temporary_dir(save_dir)
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def test_crawl_and_download_teardown(monkeypatch):
+    save_dir = './tmp_teardown/'
+    log_dir = './tmp_teardown_log/'
+    utils.create_dir(save_dir)
+    utils.clean_temporary_dir(log_dir)
+
+    def broken_catalog(source):
+        yield {'id': '10000'}
+        raise ValueError('The connection was reset')
+    monkeypatch.setattr(rnp_crawler, 'iter_catalog', broken_catalog)
+
+    with MockRNPServer(n_videos=3) as server:
+        with pytest.raises(ValueError):
+            crawl_and_download(server.client_key, save_dir, max_n=3, log_file_path=log_dir, requests_per_second=None,
+                               api_url=server.api_url, metrics_port=0)
+
+    # The threads, the metrics port and the log file should be released all the same
+    assert not [thread.name for thread in threading.enumerate()
+                if thread.name in ('metrics-server', 'metrics-reporter')]
+    assert not logging.getLogger(rnp_crawler.LOGGER.name).handlers
+    with open(os.path.join(log_dir, 'probing.log')) as log_file:
+        events = [json.loads(line) for line in log_file]
+    assert any(event.get('video_id') == '10000' and event.get('status') == crawl_state.DONE for event in events)
+    # The progress of a streamed catalog is logged without a total, which is unknown
+    assert any(event['message'].startswith('Video 0, Id:10000') for event in events)
+
+    utils.clean_temporary_dir(save_dir)
+    utils.clean_temporary_dir(log_dir)
+
+
+def test_crawl_and_download_resume_larger_limit():
+    save_dir = './tmp_resume_limit/'
+    db_path = './tmp_resume_limit.db'
+    utils.create_dir(save_dir)
+
+    with MockRNPServer(n_videos=6) as server:
+        crawl_and_download(server.client_key, save_dir, max_n=2, requests_per_second=None, api_url=server.api_url,
+                           state_db_path=db_path)
+        first_run_requests = len(server.requests)
+
+        # The catalog was only listed up to 2 videos, so it is listed again for more
+        crawl_and_download(server.client_key, save_dir, max_n=4, requests_per_second=None, api_url=server.api_url,
+                           state_db_path=db_path)
+        assert '/services/video' in server.requests[first_run_requests:]
+        utils.check_videos(save_dir, expected_number_of_videos=4)
+
+        # Listed to its end, the catalog covers any limit, and the outstanding videos are capped at it
+        crawl_and_download(server.client_key, save_dir, max_n=10, requests_per_second=None, api_url=server.api_url,
+                           state_db_path=db_path)
+        second_run_requests = len(server.requests)
+        state = CrawlState(db_path)
+        state.mark('rnp', '10000', crawl_state.FAILED)
+        state.mark('rnp', '10001', crawl_state.FAILED)
+        state.close()
+        crawl_and_download(server.client_key, save_dir, max_n=1, requests_per_second=None, api_url=server.api_url,
+                           state_db_path=db_path)
+        assert server.requests[second_run_requests:] == ['/services/video/versions/10000'], \
+            'Only max_n outstanding videos should be visited, without listing the catalog again.'
+
+    state = CrawlState(db_path)
+    assert state.counts('rnp')[crawl_state.DONE] == 5 and state.get('rnp', '10001')['status'] == crawl_state.FAILED
+    state.close()
+    utils.clean_temporary_dir(save_dir)
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def test_download_file_resume():
+    save_dir = './tmp_resume_file/'
+    utils.create_dir(save_dir)
+
+    with MockRNPServer(n_videos=1, video_size=10000) as server:
+        video_id = server.video_ids[0]
+        url = f'{server.base_url}/vod/{video_id}.mp4'
+
+        # Leaving a partial file behind, as an interrupted download would
+        with open(os.path.join(save_dir, video_id + '.mp4.part'), 'wb') as f:
+            f.write(server.payload(video_id)[:4000])
+
+        assert download_file(url, save_dir, local_filename=video_id + '.mp4', verbose=False) == 10000
+        assert server.range_requests == [(video_id, 'bytes=4000-')], 'The download should resume from the part file.'
+
+    with open(os.path.join(save_dir, video_id + '.mp4'), 'rb') as f:
+        assert f.read() == server.payload(video_id), 'The resumed file should match the served file.'
+    assert not os.path.exists(os.path.join(save_dir, video_id + '.mp4.part')), 'The part file should be renamed.'
+
+    utils.clean_temporary_dir(save_dir)
+
+
+def test_download_file_interrupted():
+    save_dir = './tmp_interrupted/'
+    utils.create_dir(save_dir)
+
+    for support_ranges in [True, False]:
+        with MockRNPServer(n_videos=1, video_size=10000, support_ranges=support_ranges,
+                           interrupt_after=3000) as server:
+            video_id = server.video_ids[0]
+            url = f'{server.base_url}/vod/{video_id}.mp4'
+            local_filename = f'{video_id}_{support_ranges}.mp4'
+
+            # The first transfer is cut midway, so nothing should be renamed into place
+            assert download_file(url, save_dir, local_filename=local_filename, verbose=False) == 0
+            assert not os.path.exists(os.path.join(save_dir, local_filename))
+
+            # The second one resumes (or restarts, when ranges are not supported) and completes the file
+            assert download_file(url, save_dir, local_filename=local_filename, verbose=False) == 10000
+            assert len(server.range_requests) == int(support_ranges)
+
+        with open(os.path.join(save_dir, local_filename), 'rb') as f:
+            assert f.read() == server.payload(video_id), 'The completed file should match the served file.'
+
+    utils.clean_temporary_dir(save_dir)
+
+
+def test_download_file_preallocate():
+    save_dir = './tmp_preallocate/'
+    utils.create_dir(save_dir)
+
+    with MockRNPServer(n_videos=1, video_size=100000, interrupt_after=30000) as server:
+        video_id = server.video_ids[0]
+        url = f'{server.base_url}/vod/{video_id}.mp4'
+
+        # The interrupted transfer is truncated to the bytes received and kept as a resumable .part file
+        assert download_file(url, save_dir, local_filename=video_id + '.mp4', verbose=False, chunk_size=4096,
+                             preallocate=True) == 0
+        assert os.path.getsize(os.path.join(save_dir, video_id + '.mp4.part')) == 30000
+        assert not os.path.exists(os.path.join(save_dir, video_id + '.mp4.alloc.part'))
+
+        assert download_file(url, save_dir, local_filename=video_id + '.mp4', verbose=False, chunk_size=4096,
+                             preallocate=True) == 100000
+    with open(os.path.join(save_dir, video_id + '.mp4'), 'rb') as f:
+        assert f.read() == server.payload(video_id)
+
+    with MockRNPServer(n_videos=1, video_size=100000) as server:
+        video_id = server.video_ids[0]
+        assert download_file(f'{server.base_url}/vod/{video_id}.mp4', save_dir, local_filename='whole.mp4',
+                             verbose=False, preallocate=True) == 100000
+    with open(os.path.join(save_dir, 'whole.mp4'), 'rb') as f:
+        assert f.read() == server.payload(video_id)
+    assert sorted(os.listdir(save_dir)) == [video_id + '.mp4', 'whole.mp4']
+
+    utils.clean_temporary_dir(save_dir)
+
+
+def test_download_file_segmented():
+    save_dir = './tmp_segmented/'
+    utils.create_dir(save_dir)
+
+    with MockRNPServer(n_videos=1, video_size=100001) as server:
+        video_id = server.video_ids[0]
+        url = f'{server.base_url}/vod/{video_id}.mp4'
+
+        report = download_file_segmented(url, os.path.join(save_dir, video_id + '.mp4'), segments=4)
+        assert report['complete'] and report['bytes'] == 100001, 'Every segment should be downloaded.'
+        assert len(report['segments']) == 4
+        assert sum(segment['bytes'] for segment in report['segments']) == 100001
+        assert report['throughput'] > 0
+
+    with open(os.path.join(save_dir, video_id + '.mp4'), 'rb') as f:
+        assert f.read() == server.payload(video_id), 'The segments should be written at the right offsets.'
+
+    # Servers that ignore ranges fall back to a single stream
+    with MockRNPServer(n_videos=1, video_size=5000, support_ranges=False) as server:
+        video_id = server.video_ids[0]
+        url = f'{server.base_url}/vod/{video_id}.mp4'
+        assert download_file_segmented(url, os.path.join(save_dir, 'fallback.mp4'), segments=4) is None
+        assert download_file(url, save_dir, local_filename='fallback.mp4', verbose=False, segments=4) == 5000
+
+    utils.clean_temporary_dir(save_dir)
+
+
+def test_iter_catalog():
+    catalog = (b'<?xml version="1.0" encoding="UTF-8"?>\n<videos>\n'
+               b'  <video>\n    <id>11445</id>\n    <title>Aula 1</title>\n  </video>\n'
+               b'  <video><id>11446</id><title>Aula 2</title></video>\n</videos>')
+    records = list(iter_catalog(io.BytesIO(catalog)))
+    assert [record['id'] for record in records] == ['11445', '11446'], 'Every video should be yielded in order.'
+    assert records[0]['title'] == 'Aula 1', 'The other fields of the video should be kept.'
+
+    # Records should be yielded before the end of the stream arrives
+    records = iter_catalog(io.BytesIO(catalog.split(b'</videos>')[0] + b'<video><id>'))
+    assert next(records)['id'] == '11445'
+
+
+def test_download_file_store(monkeypatch):
+    save_dir = './tmp_store_videos/'
+    store_dir = './tmp_store/'
+    utils.create_dir(save_dir)
+    store = ContentStore(store_dir)
+
+    with MockRNPServer(n_videos=1, video_size=10000) as server:
+        video_id = server.video_ids[0]
+        url = f'{server.base_url}/vod/{video_id}.mp4'
+        digest = hashlib.sha256(server.payload(video_id)).hexdigest()
+
+        # The content should be hashed as it is written, without reading the file again
+        def hash_file(file_path, chunk_size=None):
+            raise AssertionError('The downloaded file should not be read again.')
+        monkeypatch.setattr(store, 'hash_file', hash_file)
+        assert download_file(url, save_dir, local_filename='first.mp4', verbose=False, store=store) == 10000
+
+        # The same content under another name, resumed from a part file
+        with open(os.path.join(save_dir, 'second.mp4.part'), 'wb') as f:
+            f.write(server.payload(video_id)[:4000])
+        assert download_file(url, save_dir, local_filename='second.mp4', verbose=False, store=store) == 10000
+
+    assert os.path.exists(store.object_path(digest, 'mp4')), 'The file should be stored under its digest.'
+    assert store.duplicates == 1, 'The second download should be found to be a duplicate.'
+    assert os.path.samefile(os.path.join(save_dir, 'first.mp4'), os.path.join(save_dir, 'second.mp4'))
+    with open(os.path.join(save_dir, 'second.mp4'), 'rb') as f:
+        assert f.read() == server.payload(video_id)
+
+    utils.clean_temporary_dir(save_dir)
+    shutil.rmtree(store_dir)
+
+
+def test_download_version_denied():
+    save_dir = './tmp_denied/'
+    utils.create_dir(save_dir)
+    api_url = 'http://api.example.org/services'
+    limiter = AdaptiveRateLimiter(rate=4.0)
+
+    with MockRNPServer(n_videos=1) as server:
+        client = HttpClient(rate_limiter=limiter)
+        counters = CrawlCounters()
+        for i in range(3):
+            # The file is not found, as when the platform denies the download
+            assert download_version(f'1000{i}', i, 3, f'{server.base_url}/missing/1000{i}.mp4', 'MP4', save_dir,
+                                    counters, http_client=client, api_url=api_url) == 0
+        client.close()
+
+    assert counters.snapshot()['denied_requests'] == 3
+    assert limiter.current_rate(host_of(api_url)) < 4.0, 'Repeated denials should slow down the API requests.'
+    assert limiter.current_rate(host_of(server.base_url)) == 4.0, 'The host of the files is not paced.'
+
+    utils.clean_temporary_dir(save_dir)
+
+
+def test_download_version_disk_full(monkeypatch):
+    save_dir = './tmp_disk_full/'
+    utils.create_dir(save_dir)
+    monkeypatch.setattr(download_scheduler, 'DISK_CHECK_INTERVAL', 0)
+    checks = []
+
+    def disk_usage(path):
+        # The disk fills up once the download is running
+        checks.append(path)
+        return collections.namedtuple('DiskUsage', 'total used free')(10 ** 9, 0, 10 ** 6 if len(checks) == 1 else 100)
+    monkeypatch.setattr(download_scheduler.shutil, 'disk_usage', disk_usage)
+    limiter = AdaptiveRateLimiter(rate=4.0)
+    scheduler = DownloadScheduler(save_dir, min_free_bytes=1000)
+
+    with MockRNPServer(n_videos=1, video_size=100000) as server:
+        client = HttpClient(rate_limiter=limiter)
+        counters = CrawlCounters()
+        video_id = server.video_ids[0]
+        assert download_version(video_id, 0, 1, f'{server.base_url}/vod/{video_id}.mp4', 'MP4', save_dir, counters,
+                                http_client=client, scheduler=scheduler) == 0
+        client.close()
+
+    assert counters.snapshot()['denied_requests'] == 0, 'A download stopped for the disk was not denied.'
+    assert limiter.current_rate(host_of(API_URL)) == 4.0
+    assert os.path.exists(os.path.join(save_dir, video_id + '.mp4.part')), 'It should be resumed by a later run.'
+    assert scheduler.used_bytes == 0
+
+    utils.clean_temporary_dir(save_dir)
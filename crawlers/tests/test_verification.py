@@ -0,0 +1,93 @@
+from crawlers.common import crawl_state
+from crawlers.common.crawl_state import CrawlState
+from crawlers.common.verification import VerificationResults, verify_dir, verify_file, sniff_container, BAD_SUFFIX
+
+import os
+import shutil
+import struct
+
+test_save_dir = './tmp_verification/'
+test_db_path = './test_verification.db'
+test_state_path = './test_verification_state.db'
+
+
+def clean():
+    if os.path.exists(test_save_dir):
+        shutil.rmtree(test_save_dir)
+    for db_path in [test_db_path, test_state_path]:
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+
+def box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def write(name, content):
+    with open(os.path.join(test_save_dir, name), 'wb') as f:
+        f.write(content)
+
+
+def test_verify_file():
+    clean()
+    os.makedirs(test_save_dir)
+    mp4 = box(b'ftyp', b'isom\0\0\0\0isomiso2') + box(b'moov', b'\0' * 100) + box(b'mdat', b'\1' * 1000)
+    write('good.mp4', mp4)
+    write('truncated.mp4', mp4[:-10])
+    write('good.webm', b'\x1a\x45\xdf\xa3' + b'\0' * 100)
+    write('good.flv', b'FLV\x01' + b'\0' * 100)
+    write('good.mp3', b'ID3\x04\0\0\0\0\0\0' + b'\xff\xfb\x90\x64' + b'\0' * 100)
+    write('untagged.mp3', b'\xff\xfb\x90\x64' + b'\0' * 100)
+    write('good.aac', b'\xff\xf1\x50\x80' + b'\0' * 100)
+    write('good.wav', b'RIFF\x24\0\0\0WAVEfmt ' + b'\0' * 100)
+    write('page.mp4', b'<!DOCTYPE html><html><body>Too many requests</body></html>')
+    write('empty.mp4', b'')
+
+    assert sniff_container(os.path.join(test_save_dir, 'good.webm')) == 'matroska'
+    results = {name: verify_file(os.path.join(test_save_dir, name)) for name in os.listdir(test_save_dir)}
+    assert [name for name, result in sorted(results.items()) if result['ok']] == \
+        ['good.aac', 'good.flv', 'good.mp3', 'good.mp4', 'good.wav', 'good.webm', 'untagged.mp3'], \
+        'Audio files should be recognized too.'
+    assert results['untagged.mp3']['container'] == 'mp3' and results['good.aac']['container'] == 'aac'
+    assert results['truncated.mp4']['reason'] == 'truncated mp4'
+    assert results['page.mp4']['container'] == 'html'
+    assert results['empty.mp4']['reason'] == 'empty file'
+    assert not verify_file(os.path.join(test_save_dir, 'good.mp4'), expected_size=len(mp4) + 1)['ok']
+    clean()
+
+
+def test_verify_dir():
+    clean()
+    os.makedirs(test_save_dir)
+    mp4 = box(b'ftyp', b'isom\0\0\0\0isomiso2') + box(b'mdat', b'\1' * 1000)
+    for i in range(20):
+        write(f'{i}.mp4', mp4)
+    write('20.mp4', mp4[:500])
+    write('21.mp4', b'<html>Error</html>')
+    write('22.mp4', mp4)
+    write('notes.txt', b'not a video')
+    state = CrawlState(test_state_path)
+    state.add('rnp', [str(i) for i in range(23)])
+    state.mark('rnp', '22', crawl_state.DONE, size=len(mp4) + 10)  # The server announced more bytes than were kept
+
+    results = VerificationResults(test_db_path)
+    counts = verify_dir(test_save_dir, results, workers=4, state=state, source='rnp')
+    assert counts == {'files': 23, 'skipped': 0, 'ok': 20, 'bad': 3, 'requeued': 0}
+    assert [os.path.basename(result['path']) for result in results.bad()] == ['20.mp4', '21.mp4', '22.mp4']
+
+    # Verification is incremental: only new or changed files are verified again
+    write('0.mp4', mp4[:100])
+    counts = verify_dir(test_save_dir, results, workers=4, state=state, source='rnp')
+    assert counts['skipped'] == 22 and counts['bad'] == 1
+
+    # Re-queuing moves every bad file out of the way, the ones found by earlier runs included
+    counts = verify_dir(test_save_dir, results, workers=4, state=state, source='rnp', requeue=True)
+    assert counts['skipped'] == 19 and counts['bad'] == 4 and counts['requeued'] == 4
+    assert os.path.exists(os.path.join(test_save_dir, '0.mp4' + BAD_SUFFIX))
+    assert not os.path.exists(os.path.join(test_save_dir, '0.mp4')), 'Re-queued files should be moved out of the way.'
+    assert state.get('rnp', '0')['status'] == crawl_state.FAILED
+
+    results.close()
+    state.close()
+    clean()
@@ -0,0 +1,81 @@
+from crawlers.common.version_cache import VersionCache
+
+import os
+import sqlite3
+import time
+
+test_db_path = './test_version_cache.db'
+
+
+def clean_db():
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(test_db_path + suffix):
+            os.remove(test_db_path + suffix)
+
+
+def test_get_put_and_ttl():
+    clean_db()
+    cache = VersionCache(test_db_path, ttl=0.2)
+    assert cache.get('1') is None
+    cache.put('1', {'url': 'http://host/1.mp4', 'format': 'MP4'}, etag='"abc"')
+    entry = cache.get('1')
+    assert entry['record'] == {'url': 'http://host/1.mp4', 'format': 'MP4'}
+    assert entry['etag'] == '"abc"'
+    assert entry['fresh']
+
+    time.sleep(0.25)
+    assert not cache.get('1')['fresh'], 'Entries should go stale after their time to live.'
+    cache.refresh('1')
+    assert cache.get('1')['fresh'], 'Revalidated entries should be fresh again.'
+    cache.close()
+
+    # Entries are kept between runs
+    cache = VersionCache(test_db_path)
+    assert len(cache) == 1
+    assert cache.get('1')['record']['format'] == 'MP4'
+    cache.discard('1')
+    assert cache.get('1') is None and len(cache) == 0
+    cache.close()
+    clean_db()
+
+
+def test_lru_eviction():
+    clean_db()
+    cache = VersionCache(test_db_path, max_entries=3)
+    for key in ['1', '2', '3']:
+        cache.put(key, {'n': key})
+        time.sleep(0.01)
+    cache.get('1')  # '2' is now the least recently used
+    cache.put('3', {'n': 'updated'})
+    assert len(cache) == 3, 'Replacing an entry should not count twice.'
+    cache.put('4', {'n': '4'})
+    assert len(cache) == 3
+    assert cache.get('2') is None, 'The least recently used entry should be evicted.'
+    assert all(cache.get(key) is not None for key in ['1', '3', '4'])
+    assert cache.get('3')['record'] == {'n': 'updated'}
+    cache.close()
+    clean_db()
+
+
+def test_migration():
+    clean_db()
+    # A database created by the cache under its former name
+    conn = sqlite3.connect(test_db_path)
+    conn.executescript("""
+        CREATE TABLE metadata (key TEXT PRIMARY KEY, record TEXT NOT NULL, etag TEXT, fetched_at REAL NOT NULL,
+                               used_at REAL NOT NULL);
+        CREATE INDEX metadata_by_use ON metadata (used_at);
+    """)
+    conn.execute('INSERT INTO metadata VALUES (?, ?, ?, ?, ?)', ('1', '{"format": "MP4"}', '"abc"', time.time(),
+                                                                 time.time()))
+    conn.commit()
+    conn.close()
+
+    cache = VersionCache(test_db_path)
+    assert len(cache) == 1 and cache.get('1')['record'] == {'format': 'MP4'}, 'The entries should be kept.'
+    cache.close()
+    conn = sqlite3.connect(test_db_path)
+    names = {row[0] for row in conn.execute('SELECT name FROM sqlite_master')}
+    conn.close()
+    assert names == {'versions', 'versions_by_use', 'sqlite_autoindex_versions_1'}
+    clean_db()
@@ -0,0 +1,49 @@
+from crawlers.common.version_policy import VersionPolicy
+
+import pytest
+
+VERSIONS = [
+    {'url': 'http://host/720.mp4', 'format': 'MP4', 'width': 1280, 'height': 720, 'bitrate': 2000.0, 'size': None},
+    {'url': 'http://host/480.webm', 'format': 'WEBM', 'width': 854, 'height': 480, 'bitrate': 700.0, 'size': None},
+    {'url': 'http://host/480.mp4', 'format': 'MP4', 'width': 854, 'height': 480, 'bitrate': 800.0, 'size': None},
+    {'url': 'http://host/240.mp4', 'format': 'MP4', 'width': 320, 'height': 240, 'bitrate': 300.0, 'size': None},
+]
+
+
+def chosen(policy, **kwargs):
+    version = policy.select([dict(version) for version in VERSIONS], **kwargs)
+    return version['url'] if version else None
+
+
+def test_select():
+    assert chosen(VersionPolicy()) == 'http://host/720.mp4', 'By default the first version should be chosen.'
+    assert chosen(VersionPolicy(prefer='smallest')) == 'http://host/240.mp4'
+    assert chosen(VersionPolicy(min_height=480, prefer='smallest')) == 'http://host/480.webm'
+    assert chosen(VersionPolicy(min_height=480, formats=('mp4',), prefer='smallest')) == 'http://host/480.mp4', \
+        'Preferred formats should come first.'
+    assert chosen(VersionPolicy(max_height=480, prefer='largest')) == 'http://host/480.mp4'
+    assert chosen(VersionPolicy(max_bitrate=750)) == 'http://host/480.webm'
+    assert chosen(VersionPolicy(min_height=1080)) is None, 'No version should be acceptable.'
+    with pytest.raises(ValueError):
+        VersionPolicy(prefer='best')
+
+
+def test_select_max_size():
+    sizes = {'http://host/720.mp4': 2000, 'http://host/480.webm': 700, 'http://host/480.mp4': 800,
+             'http://host/240.mp4': 300}
+    asked = []
+
+    def size_of(version):
+        asked.append(version['url'])
+        return sizes[version['url']]
+
+    assert chosen(VersionPolicy(max_size=750), size_of=size_of) == 'http://host/480.webm'
+    assert asked == ['http://host/720.mp4', 'http://host/480.webm'], 'Sizes should only be asked until a fit.'
+    assert chosen(VersionPolicy(max_size=750)) == 'http://host/720.mp4', 'Unknown sizes should be accepted.'
+
+
+def test_ytdl_format():
+    assert VersionPolicy().ytdl_format() == 'best'
+    assert VersionPolicy(max_height=480).ytdl_format() == 'best[height<=?480]'
+    assert VersionPolicy(min_height=360, max_size=10 ** 8, formats=('MP4',), prefer='smallest').ytdl_format() == \
+        'worst[ext=mp4][height>=?360][filesize<=?100000000]/worst[height>=?360][filesize<=?100000000]'
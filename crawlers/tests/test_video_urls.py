@@ -0,0 +1,58 @@
+from crawlers.youtube.video_urls import video_id_from_url, iter_csv_videos, watch_url
+
+import os
+
+test_csv_path = './tmp_video_urls.csv'
+
+
+def test_video_id_from_url():
+    video_id = 'sQ3aeclQ3QA'
+    urls = ['https://www.youtube.com/watch?v=sQ3aeclQ3QA',
+            'http://youtube.com/watch?feature=share&v=sQ3aeclQ3QA&t=10',
+            'www.youtube.com/watch?v=sQ3aeclQ3QA',
+            'https://m.youtube.com/watch?v=sQ3aeclQ3QA',
+            'https://music.youtube.com/watch?v=sQ3aeclQ3QA&list=RD',
+            'https://youtu.be/sQ3aeclQ3QA?t=42',
+            'https://www.youtube.com/embed/sQ3aeclQ3QA',
+            'https://www.youtube-nocookie.com/embed/sQ3aeclQ3QA',
+            'https://www.youtube.com/shorts/sQ3aeclQ3QA',
+            'https://www.youtube.com/live/sQ3aeclQ3QA?feature=share',
+            'https://www.youtube.com/v/sQ3aeclQ3QA',
+            '  https://www.youtube.com/watch?v=sQ3aeclQ3QA  ']
+    for url in urls:
+        assert video_id_from_url(url) == video_id, f'The id should be extracted from {url}.'
+
+    assert video_id_from_url(video_id) is None, 'Bare ids should only be accepted when allowed.'
+    assert video_id_from_url(video_id, allow_bare_id=True) == video_id
+    for url in ['https://www.example.com/watch?v=sQ3aeclQ3QA', 'https://www.youtube.com/watch?v=short',
+                'https://www.youtube.com/channel/UCsQ3aeclQ3QA', 'not a video', '']:
+        assert video_id_from_url(url, allow_bare_id=True) is None, f'{url} is not a video url.'
+
+
+def test_iter_csv_videos():
+    with open(test_csv_path, 'w') as f:
+        f.write('title,link,views\n'
+                'first,https://www.youtube.com/watch?v=RNPqbBcOS9M,10\n'
+                '"second, with a comma",https://youtu.be/t3nx8axVxlk,20\n'
+                'duplicate,https://www.youtube.com/shorts/RNPqbBcOS9M,30\n'
+                'broken,https://www.example.com/,40\n'
+                '\n'
+                'third,https://www.youtube.com/embed/hAyZ9K2EBF0\n')
+    videos = iter_csv_videos(test_csv_path)
+    assert next(videos) == ('RNPqbBcOS9M', watch_url('RNPqbBcOS9M')), 'Videos should be yielded as they are read.'
+    assert [video_id for video_id, _ in videos] == ['t3nx8axVxlk', 'hAyZ9K2EBF0'], \
+        'The header, duplicates and rows without videos should be skipped.'
+
+    # Header names that look like ids should still be taken as a header
+    with open(test_csv_path, 'w') as f:
+        f.write('youtube_url\nt3nx8axVxlk\n')
+    assert [video_id for video_id, _ in iter_csv_videos(test_csv_path)] == ['t3nx8axVxlk']
+
+    # Single column files without header, as the ones the tool always took, with ids mixed with urls
+    with open(test_csv_path, 'w') as f:
+        f.write('https://www.youtube.com/watch?v=RNPqbBcOS9M,\nt3nx8axVxlk\nhAyZ9K2EBF0,\n')
+    seen = {'hAyZ9K2EBF0'}
+    assert [video_id for video_id, _ in iter_csv_videos(test_csv_path, seen)] == ['RNPqbBcOS9M', 't3nx8axVxlk']
+    assert seen == {'RNPqbBcOS9M', 't3nx8axVxlk', 'hAyZ9K2EBF0'}, 'The seen set should be shared between calls.'
+
+    os.remove(test_csv_path)
@@ -1,10 +1,18 @@
 import os
 from crawlers.youtube.yt_downloader_from_csv import \
+    VideoDownloader,\
     download,\
     already_downloaded,\
     read_csv_and_download_videos
 
+from crawlers.youtube import yt_downloader_from_csv
 from crawlers.tests import utils
+from crawlers.tests.stub_youtube_dl import StubYoutubeDL
+from crawlers.common.rate_limiter import AdaptiveRateLimiter
+from crawlers.youtube.metadata import MetadataFilter
+from crawlers.common.version_policy import VersionPolicy
+
+import youtube_dl
 
 test_save_dir = './tmp/'
 test_csv_path = './test_urls.csv'
@@ -67,3 +75,118 @@ def test_read_csv_and_download_videos():
     # Clean up test files
     utils.clean_temporary_dir(test_save_dir)
 
+
+def test_read_csv_and_download_videos_parallel(monkeypatch):
+    save_dir = './tmp_parallel/'
+    csv_path = './tmp_parallel_urls.csv'
+    StubYoutubeDL.reset()
+    monkeypatch.setattr(youtube_dl, 'YoutubeDL', StubYoutubeDL)
+
+    video_ids = [f'video{i:06d}' for i in range(12)]
+    with open(csv_path, 'w') as csv_file:
+        csv_file.write('\n'.join(f'https://www.youtube.com/watch?v={video_id},' for video_id in video_ids))
+    StubYoutubeDL.fail_once = {'video000003', 'video000007'}
+    StubYoutubeDL.download_time = 0.05
+
+    read_csv_and_download_videos(csv_path, save_dir, wait_time=0, rate_limiter=AdaptiveRateLimiter(rate=None),
+                                 workers=4)
+
+    # The videos that failed once should have been retried in the next round
+    utils.check_videos(save_dir, expected_number_of_videos=12)
+    downloads = [url for url, download in StubYoutubeDL.calls if download]
+    assert len(downloads) == 14, 'Each video should be downloaded once, plus one retry for each failure.'
+
+    # Every worker should reuse its own YoutubeDL instance across urls
+    assert len(StubYoutubeDL.instances) <= 8, 'At most one instance per worker and round was expected.'
+    assert len({instance.thread for instance in StubYoutubeDL.instances}) == len(StubYoutubeDL.instances)
+
+    os.remove(csv_path)
+    utils.clean_temporary_dir(save_dir)
+
+
+def test_read_csv_and_download_videos_give_up(monkeypatch):
+    save_dir = './tmp_give_up/'
+    csv_path = './tmp_give_up_urls.csv'
+    StubYoutubeDL.reset()
+    monkeypatch.setattr(youtube_dl, 'YoutubeDL', StubYoutubeDL)
+    monkeypatch.setattr(yt_downloader_from_csv, 'MAX_FAILS_SEQUENCE', 1)
+
+    video_ids = [f'video{i:06d}' for i in range(6)]
+    with open(csv_path, 'w') as csv_file:
+        csv_file.write('\n'.join(f'https://www.youtube.com/watch?v={video_id}' for video_id in video_ids))
+    StubYoutubeDL.fail_once = {'video000000', 'video000001'}
+
+    read_csv_and_download_videos(csv_path, save_dir, wait_time=0, rate_limiter=AdaptiveRateLimiter(rate=None))
+
+    # The first round gives up after two consecutive failures, the videos it did not try must not be lost
+    utils.check_videos(save_dir, expected_number_of_videos=6)
+
+    os.remove(csv_path)
+    utils.clean_temporary_dir(save_dir)
+
+
+def test_video_downloader(monkeypatch):
+    save_dir = './tmp_video_downloader/'
+    utils.create_dir(save_dir)
+    StubYoutubeDL.reset()
+    monkeypatch.setattr(youtube_dl, 'YoutubeDL', StubYoutubeDL)
+
+    downloader = VideoDownloader(save_dir)
+    for i in range(5):
+        assert downloader.download(f'https://www.youtube.com/watch?v=video{i}'), 'Download should be sucessfull.'
+
+    assert len(StubYoutubeDL.instances) == 1, 'A single YoutubeDL instance should be reused for every url.'
+    assert downloader.urls == 5
+    assert downloader.overhead_per_url == downloader.setup_time / 5, 'The setup should be amortized over the urls.'
+    utils.check_videos(save_dir, expected_number_of_videos=5)
+
+    utils.clean_temporary_dir(save_dir)
+
+
+def test_read_csv_and_download_videos_metadata(monkeypatch):
+    save_dir = './tmp_metadata_csv/'
+    metadata_dir = './tmp_metadata_csv_cache/'
+    csv_path = './tmp_metadata_urls.csv'
+    StubYoutubeDL.reset()
+    monkeypatch.setattr(youtube_dl, 'YoutubeDL', StubYoutubeDL)
+
+    video_ids = [f'video{i:06d}' for i in range(10)]
+    with open(csv_path, 'w') as csv_file:
+        csv_file.write('\n'.join(f'https://www.youtube.com/watch?v={video_id}' for video_id in video_ids))
+    StubYoutubeDL.fail_always = {'video000004'}
+    video_filter = MetadataFilter(max_duration=287)
+    expected = [video_id for video_id in video_ids
+                if video_id != 'video000004' and StubYoutubeDL().info(video_id)['duration'] <= 287]
+
+    read_csv_and_download_videos(csv_path, save_dir, wait_time=0, rate_limiter=AdaptiveRateLimiter(rate=None),
+                                 metadata_dir=metadata_dir, video_filter=video_filter)
+
+    # Only the available videos that pass the filter should be downloaded, without retrying the unavailable one
+    utils.check_videos(save_dir, expected_number_of_videos=len(expected))
+    downloads = sorted(url.split('v=')[-1] for url, download in StubYoutubeDL.calls if download)
+    assert downloads == expected
+
+    os.remove(csv_path)
+    utils.clean_temporary_dir(save_dir)
+    utils.clean_temporary_dir(metadata_dir)
+
+
+def test_read_csv_and_download_videos_format(monkeypatch):
+    save_dir = './tmp_format_csv/'
+    csv_path = './tmp_format_urls.csv'
+    StubYoutubeDL.reset()
+    monkeypatch.setattr(youtube_dl, 'YoutubeDL', StubYoutubeDL)
+
+    with open(csv_path, 'w') as csv_file:
+        csv_file.write('\n'.join(f'https://www.youtube.com/watch?v=video{i:06d}' for i in range(3)))
+    video_format = VersionPolicy(max_height=480, prefer='smallest').ytdl_format()
+    read_csv_and_download_videos(csv_path, save_dir, wait_time=0, rate_limiter=AdaptiveRateLimiter(rate=None),
+                                 video_filter=MetadataFilter(), video_format=video_format)
+
+    utils.check_videos(save_dir, expected_number_of_videos=3)
+    assert StubYoutubeDL.instances, 'YoutubeDL should be used.'
+    assert all(ydl.params['format'] == video_format for ydl in StubYoutubeDL.instances), \
+        'The metadata and the downloads should use the given format.'
+
+    os.remove(csv_path)
+    utils.clean_temporary_dir(save_dir)
@@ -1,8 +1,16 @@
-from crawlers.youtube.yt_search import search
+from crawlers.youtube.yt_search import search, search_manifest, search_many, read_queries, read_membership
+from crawlers.youtube.manifest import read_manifest
+from crawlers.youtube.video_urls import iter_videos
 from crawlers.tests import utils
+from crawlers.tests.stub_youtube_dl import StubYoutubeDL
+from crawlers.common.rate_limiter import AdaptiveRateLimiter
+
+import youtube_dl
 
 from glob import glob
+import json
 import os
+import shutil
 
 def test_search():
     test_query = ['sudoku']
@@ -18,4 +26,70 @@ def test_search():
     utils.check_videos(test_save_dir, expected_number_of_videos = 2)
 
     # Clean up test files
-    utils.clean_temporary_dir(test_save_dir)
\ No newline at end of file
+    utils.clean_temporary_dir(test_save_dir)
+
+
+def test_search_manifest(monkeypatch):
+    manifest_path = './tmp_manifest.jsonl'
+    StubYoutubeDL.reset()
+    monkeypatch.setattr(youtube_dl, 'YoutubeDL', StubYoutubeDL)
+
+    # The results of 'a' (a0 ... a11) and of 'a1' (a10 ... a111) overlap in a10 and a11
+    assert search_manifest(['a', 'a1'], manifest_path, 12, workers=2) == 22
+    records = list(read_manifest(manifest_path))
+    assert len({record['id'] for record in records}) == 22, 'Videos found by two queries should be written once.'
+    assert {record['query'] for record in records if record['id'] in ('a10', 'a11')} <= {'a', 'a1'}
+    record = next(record for record in records if record['id'] == 'a0')
+    assert record['query'] == 'a' and record['duration'] and record['formats'][0]['format_id'] == '18'
+    assert all(not download for _, download in StubYoutubeDL.calls), 'No video should be downloaded.'
+
+    # The manifest can be given to the csv downloader
+    assert len(list(iter_videos(manifest_path))) == 22
+
+    # Flat manifests only need the search results
+    StubYoutubeDL.calls = []
+    assert search_manifest(['a'], manifest_path, 12, resolve=False) == 12
+    assert len(StubYoutubeDL.calls) == 1, 'A single request per query was expected.'
+    assert all(record['formats'] is None and record['title'] for record in read_manifest(manifest_path))
+
+    os.remove(manifest_path)
+
+
+def test_search_many(monkeypatch):
+    save_dir = './tmp_search_many/'
+    queries_path = './tmp_queries.txt'
+    StubYoutubeDL.reset()
+    monkeypatch.setattr(youtube_dl, 'YoutubeDL', StubYoutubeDL)
+    with open(queries_path, 'w') as f:
+        f.write('# terms\na\n\na1\na\n')
+    queries = read_queries(queries_path)
+    assert queries == ['a', 'a1'], 'Comments, blank lines and repeated terms should be skipped.'
+
+    # The results of 'a' (a0 ... a11) and of 'a1' (a10 ... a111) overlap in a10 and a11
+    counts = search_many(queries, save_dir, 12, workers=2, download_workers=3, rate_limiter=AdaptiveRateLimiter(rate=None))
+    assert counts == {'queries': 2, 'videos': 22, 'downloaded': 22, 'skipped': 0, 'failed': 0}
+    utils.check_videos(os.path.join(save_dir, 'videos'), expected_number_of_videos=22)
+    assert len([url for url, download in StubYoutubeDL.calls if download]) == 22, 'Each video should be downloaded once.'
+
+    with open(os.path.join(save_dir, 'membership.jsonl')) as f:
+        membership = [json.loads(line) for line in f]
+    assert len(membership) == 24, 'Every (query, video) pair should be recorded.'
+    for query_string in queries:
+        links = glob(os.path.join(save_dir, 'queries', query_string, '*.mp4'))
+        assert len(links) == 12 and all(os.path.islink(link) and os.path.isfile(link) for link in links)
+
+    # A rerun finds everything in the store
+    StubYoutubeDL.calls = []
+    counts = search_many(queries, save_dir, 12, rate_limiter=AdaptiveRateLimiter(rate=None))
+    assert counts['skipped'] == 22 and not [url for url, download in StubYoutubeDL.calls if download]
+    assert len(read_membership(save_dir)) == 24
+
+    # The membership of a run with other terms is added to the one of the previous runs
+    search_many(['b'], save_dir, 3, rate_limiter=AdaptiveRateLimiter(rate=None))
+    membership = read_membership(save_dir)
+    assert len(membership) == 27 and {record['query'] for record in membership} == {'a', 'a1', 'b'}
+    with open(os.path.join(save_dir, 'membership.jsonl')) as f:
+        assert len(f.readlines()) == 27, 'Pairs recorded by a previous run should not be written again.'
+
+    os.remove(queries_path)
+    shutil.rmtree(save_dir)
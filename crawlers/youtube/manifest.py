@@ -0,0 +1,164 @@
+"""Youtube dataset manifest
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module writes and reads dataset manifests: one record per candidate video
+(id, url, title, duration, resolution, size, upload date, formats and the
+query term that found it), so that a dataset can be sized before any video is
+downloaded, and later downloaded with the Youtube Downloader from CSV.
+
+Manifests are written as JSON Lines, or as Parquet when the path ends with
+``.parquet``, which requires `pyarrow` to be installed within the Python
+environment you are running this tool in.
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * manifest_record - Builds the manifest record of a video from its metadata.
+    * read_manifest - Lazily reads the records of a manifest.
+
+and the following classes:
+
+    * ManifestWriter - Writes manifest records to a JSON Lines or Parquet file.
+"""
+
+import json
+import os
+
+# Fields of each manifest record
+FIELDS = ('id', 'url', 'title', 'duration', 'height', 'filesize', 'upload_date', 'formats', 'query')
+
+# Fields kept for each format of a video
+FORMAT_FIELDS = ('format_id', 'ext', 'height', 'width', 'fps', 'vcodec', 'acodec', 'filesize')
+
+# Number of records written at once to a Parquet file
+PARQUET_BATCH_SIZE = 1000
+
+
+def manifest_record(info: dict, query: str = None):
+    """Builds the manifest record of a video from its metadata.
+
+    :param info: Metadata of the video, either fully resolved or a flat search result (which lacks most fields).
+    :type info: dict
+
+    :param query: The query term that found the video.
+    :type query: str, optional
+
+    :returns: A dict with the FIELDS of the record, missing fields are None.
+    :rtype: dict
+    """
+    formats = info.get('formats')
+    if formats is not None:
+        formats = [{field: video_format.get(field) for field in FORMAT_FIELDS} for video_format in formats]
+    return {
+        'id': info['id'],
+        'url': info.get('webpage_url') or 'https://www.youtube.com/watch?v=' + info['id'],
+        'title': info.get('title'),
+        'duration': info.get('duration'),
+        'height': info.get('height'),
+        'filesize': info.get('filesize') or info.get('filesize_approx'),
+        'upload_date': info.get('upload_date'),
+        'formats': formats,
+        'query': query,
+    }
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet manifests require pyarrow, install it or use a .jsonl manifest.')
+    return pyarrow
+
+
+def _parquet_schema(pa):
+    format_type = pa.struct([('format_id', pa.string()), ('ext', pa.string()), ('height', pa.int64()),
+                             ('width', pa.int64()), ('fps', pa.float64()), ('vcodec', pa.string()),
+                             ('acodec', pa.string()), ('filesize', pa.int64())])
+    return pa.schema([('id', pa.string()), ('url', pa.string()), ('title', pa.string()), ('duration', pa.float64()),
+                      ('height', pa.int64()), ('filesize', pa.int64()), ('upload_date', pa.string()),
+                      ('formats', pa.list_(format_type)), ('query', pa.string())])
+
+
+class ManifestWriter:
+    """Writes manifest records to a JSON Lines or Parquet file. Use it as a context manager.
+
+    JSON Lines records are flushed as they are written, so an interrupted run keeps every record written so far.
+    Parquet records are written in batches, the file is complete only once the writer is closed.
+
+    :param path: Path to the manifest, written as Parquet if it ends with '.parquet', as JSON Lines otherwise.
+    :type path: str
+
+    :param append: Whether to append to an existing JSON Lines manifest, instead of replacing it.
+    :type append: bool, optional
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self.records = 0
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if path.endswith('.parquet'):
+            self._pa = _import_pyarrow()
+            self._schema = _parquet_schema(self._pa)
+            self._writer = self._pa.parquet.ParquetWriter(path, self._schema)
+            self._batch = []
+            self._file = None
+        else:
+            self._writer = None
+            self._file = open(path, 'a' if append else 'w')
+
+    def write(self, record: dict):
+        """Writes a record, see manifest_record."""
+        if self._file is not None:
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+        else:
+            self._batch.append(record)
+            if len(self._batch) >= PARQUET_BATCH_SIZE:
+                self._write_batch()
+        self.records += 1
+
+    def _write_batch(self):
+        if self._batch:
+            self._writer.write_table(self._pa.Table.from_pylist(self._batch, schema=self._schema))
+            self._batch = []
+
+    def close(self):
+        """Writes the pending records and closes the file."""
+        if self._file is not None:
+            self._file.close()
+        else:
+            self._write_batch()
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def read_manifest(path: str):
+    """Lazily reads the records of a manifest.
+
+    :param path: Path to the manifest, read as Parquet if it ends with '.parquet', as JSON Lines otherwise.
+    :type path: str
+
+    :returns: A generator of records (dicts).
+    :rtype: generator
+    """
+    if path.endswith('.parquet'):
+        pa = _import_pyarrow()
+        for batch in pa.parquet.ParquetFile(path).iter_batches(batch_size=PARQUET_BATCH_SIZE):
+            yield from batch.to_pylist()
+        return
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,305 @@
+"""Youtube metadata prefetch
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module resolves the metadata of youtube videos (without downloading them)
+before the download phase, concurrently, so that unavailable, private or
+unwanted videos (too long, too short, too large, too old...) are discarded
+without spending a download slot on them. The metadata of each video is cached
+as a JSON file named after its id, so reruns over the same videos do not query
+youtube again.
+
+This tool requires `youtube_dl` to be installed within the Python
+environment you are running this tool in.
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * permanent_error - Checks if an error of youtube_dl means the video will not become available.
+    * metadata_options - Builds the youtube_dl options used to resolve metadata.
+    * prefetch_metadata - Resolves the metadata of videos concurrently, yielding the ones that pass a filter.
+
+and the following classes:
+
+    * MetadataCache - Stores the metadata of each video as a JSON file.
+    * MetadataFilter - Accepts or rejects videos based on their metadata.
+"""
+
+import json
+import os
+import threading
+import youtube_dl
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from crawlers.common.rate_limiter import AdaptiveRateLimiter
+
+# Key of youtube in the rate limiter
+YOUTUBE_HOST = 'www.youtube.com'
+
+# Key of the cached metadata storing the youtube_dl format it was resolved for
+FORMAT_KEY = 'metadata_format'
+
+# Holds the YoutubeDL of each metadata worker thread
+_worker = threading.local()
+
+# Parts of the youtube_dl errors of videos that will not become available (private, removed, geo-blocked...). The
+# other errors (throttling, network errors, extractor hiccups...) may not happen again on the next run
+PERMANENT_ERRORS = ('video unavailable', 'private video', 'has been removed', 'no longer available',
+                    'not available in your country', 'not made this video available in your country',
+                    'account associated with this video has been terminated', 'copyright')
+
+
+def permanent_error(message: str):
+    """Checks if an error of youtube_dl means the video will not become available, see PERMANENT_ERRORS.
+
+    :rtype: bool
+    """
+    message = message.lower()
+    return any(part in message for part in PERMANENT_ERRORS)
+
+
+def _throttled(message: str):
+    return 'http error 429' in message.lower() or 'too many requests' in message.lower()
+
+
+class MetadataCache:
+    """Stores the metadata of each video as a JSON file, ``<cache_dir>/<video_id>.info.json``.
+
+    The metadata depends on the youtube_dl format it was resolved for (height, filesize...), which is stored along
+    with it, and an entry resolved for another format counts as not cached.
+
+    Videos that are permanently unavailable (see permanent_error) are cached as well, as ``{'id': ..., 'error': ...}``,
+    so that they are not queried again on every run, whatever the format. Other errors are not cached, so those
+    videos are queried again.
+
+    :param cache_dir: Path to the directory of the JSON files, it is created if it does not exist.
+    :type cache_dir: str
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def path(self, video_id: str):
+        """Returns the path to the JSON file of a video."""
+        return os.path.join(self.cache_dir, video_id + '.info.json')
+
+    def get(self, video_id: str, video_format: str = 'best'):
+        """Returns the cached metadata of a video.
+
+        :param video_id: Id of the video.
+        :type video_id: str
+
+        :param video_format: youtube_dl format the metadata should have been resolved for, see metadata_options.
+        :type video_format: str, optional
+
+        :returns: The metadata, or None if the video is not cached for this format.
+        :rtype: dict
+        """
+        try:
+            with open(self.path(video_id)) as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if info.get('error'):
+            # Cached by older versions if it is not permanent, the error may be transient
+            return info if permanent_error(info['error']) else None
+        if info.pop(FORMAT_KEY, None) != video_format:
+            return None  # Resolved for another format (or by older versions, which did not store it)
+        return info
+
+    def put(self, video_id: str, info: dict, video_format: str = 'best'):
+        """Caches the metadata of a video resolved for a format, replacing the previous one atomically."""
+        tmp_path = self.path(video_id) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(info, **{FORMAT_KEY: video_format}), f, default=str)
+        os.replace(tmp_path, self.path(video_id))
+
+
+class MetadataFilter:
+    """Accepts or rejects videos based on their metadata. Criteria left as None are not checked, and videos missing
+    the field of a criterion are accepted.
+
+    :param min_duration: Min duration of the videos, in seconds.
+    :type min_duration: float, optional
+
+    :param max_duration: Max duration of the videos, in seconds.
+    :type max_duration: float, optional
+
+    :param min_height: Min height (resolution) of the videos, in pixels.
+    :type min_height: int, optional
+
+    :param max_height: Max height (resolution) of the videos, in pixels.
+    :type max_height: int, optional
+
+    :param max_filesize: Max size of the videos, in bytes. The approximate size is used when the exact one is unknown.
+    :type max_filesize: int, optional
+
+    :param uploaded_after: Only videos uploaded on or after this date, as YYYYMMDD.
+    :type uploaded_after: str, optional
+
+    :param uploaded_before: Only videos uploaded on or before this date, as YYYYMMDD.
+    :type uploaded_before: str, optional
+    """
+
+    def __init__(self, min_duration: float = None, max_duration: float = None, min_height: int = None,
+                 max_height: int = None, max_filesize: int = None, uploaded_after: str = None,
+                 uploaded_before: str = None):
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.min_height = min_height
+        self.max_height = max_height
+        self.max_filesize = max_filesize
+        self.uploaded_after = uploaded_after
+        self.uploaded_before = uploaded_before
+
+    def rejection(self, info: dict):
+        """Checks a video against every criterion.
+
+        :param info: Metadata of the video, as resolved by youtube_dl.
+        :type info: dict
+
+        :returns: Why the video is rejected, or None if it is accepted.
+        :rtype: str
+        """
+        if info.get('error'):
+            return info['error']
+        duration = info.get('duration')
+        if duration is not None:
+            if self.min_duration is not None and duration < self.min_duration:
+                return f'shorter than {self.min_duration}s ({duration}s)'
+            if self.max_duration is not None and duration > self.max_duration:
+                return f'longer than {self.max_duration}s ({duration}s)'
+        height = info.get('height')
+        if height is not None:
+            if self.min_height is not None and height < self.min_height:
+                return f'lower than {self.min_height}p ({height}p)'
+            if self.max_height is not None and height > self.max_height:
+                return f'higher than {self.max_height}p ({height}p)'
+        filesize = info.get('filesize') or info.get('filesize_approx')
+        if filesize is not None and self.max_filesize is not None and filesize > self.max_filesize:
+            return f'larger than {self.max_filesize} bytes ({filesize} bytes)'
+        upload_date = info.get('upload_date')
+        if upload_date is not None:
+            if self.uploaded_after is not None and upload_date < self.uploaded_after:
+                return f'uploaded before {self.uploaded_after} ({upload_date})'
+            if self.uploaded_before is not None and upload_date > self.uploaded_before:
+                return f'uploaded after {self.uploaded_before} ({upload_date})'
+        return None
+
+    def __call__(self, info: dict):
+        return self.rejection(info) is None
+
+
+def metadata_options(video_format: str = 'best'):
+    """Builds the youtube_dl options used to resolve metadata.
+
+    :param video_format: youtube_dl format of the downloaded videos, so that the resolved metadata (height, filesize...)
+        is the one of the format that would be downloaded.
+    :type video_format: str, optional
+
+    :returns: The options to pass to youtube_dl.YoutubeDL.
+    :rtype: dict
+    """
+    return {
+        'format': video_format,
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+    }
+
+
+def _resolve(video_id: str, url: str, cache: MetadataCache, rate_limiter: AdaptiveRateLimiter,
+             video_format: str = 'best'):
+    """Resolves (and caches) the metadata of a video with the YoutubeDL of the calling worker thread."""
+    ydl = getattr(_worker, 'ydl', None)
+    if ydl is None or ydl.params.get('format') != video_format:
+        ydl = _worker.ydl = youtube_dl.YoutubeDL(metadata_options(video_format))
+    if rate_limiter:
+        rate_limiter.acquire(YOUTUBE_HOST)
+    try:
+        info = ydl.extract_info(url, download=False)
+        if rate_limiter:
+            rate_limiter.success(YOUTUBE_HOST)
+    except Exception as e:
+        info = {'id': video_id, 'error': str(e)}
+        if rate_limiter and _throttled(str(e)):
+            rate_limiter.throttled(YOUTUBE_HOST)
+        elif rate_limiter and not permanent_error(str(e)):
+            rate_limiter.failure(YOUTUBE_HOST)
+        if not permanent_error(str(e)):
+            return info  # Rejected in this run only, it is queried again on the next one
+    if cache:
+        cache.put(video_id, info, video_format)
+    return info
+
+
+def prefetch_metadata(videos, cache: MetadataCache = None, video_filter: MetadataFilter = None, workers: int = 4,
+                      rate_limiter: AdaptiveRateLimiter = None, rejected: list = None, video_format: str = 'best'):
+    """Resolves the metadata of videos concurrently, yielding the ones that pass a filter.
+
+    Videos are read from the iterable as the workers need them, so it may be a lazily read csv. Cached videos are
+    not queried (nor paced by the rate limiter) again, unless they were cached for another video_format. Videos whose metadata could not be resolved for a transient
+    reason (e.g. throttling) are rejected in this run but not cached.
+
+    :param videos: Iterable of (video_id, url) tuples.
+
+    :param cache: Cache of the metadata, read before and written after querying youtube.
+    :type cache: MetadataCache, optional
+
+    :param video_filter: Filter of the videos, by default only the videos whose metadata could not be resolved are
+        rejected.
+    :type video_filter: MetadataFilter, optional
+
+    :param workers: Number of videos whose metadata is resolved at the same time.
+    :type workers: int, optional
+
+    :param rate_limiter: Limiter pacing the metadata queries, told the outcome of each one.
+    :type rate_limiter: AdaptiveRateLimiter, optional
+
+    :param rejected: If given, the (video_id, url, reason) of each rejected video are appended to it.
+    :type rejected: list, optional
+
+    :param video_format: youtube_dl format of the downloaded videos, see metadata_options.
+    :type video_format: str, optional
+
+    :returns: A generator of (video_id, url, info) tuples of the accepted videos, in the order they are resolved.
+    :rtype: generator
+    """
+    video_filter = video_filter or MetadataFilter()
+    videos = iter(videos)
+
+    def checked(video_id, url, info):
+        reason = video_filter.rejection(info)
+        if reason is None:
+            return True
+        print(f'Skipping {video_id}: {reason}')
+        if rejected is not None:
+            rejected.append((video_id, url, reason))
+        return False
+
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while len(in_flight) < 2 * workers:
+                video = next(videos, None)
+                if video is None:
+                    break
+                video_id, url = video
+                info = cache.get(video_id, video_format) if cache else None
+                if info is not None:
+                    if checked(video_id, url, info):
+                        yield video_id, url, info
+                    continue
+                in_flight[executor.submit(_resolve, video_id, url, cache, rate_limiter, video_format)] = video
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                video_id, url = in_flight.pop(future)
+                info = future.result()
+                if checked(video_id, url, info):
+                    yield video_id, url, info
@@ -0,0 +1,171 @@
+"""Youtube video urls
+
+Author: Pedro Vinicius Almeida de Freitas
+
+Created in: 18/10/2026
+
+This module reads youtube videos from csv files lazily, one row at a time, so
+that url dumps with millions of rows are processed with flat memory and the
+first downloads start right away. Rows may have any number of columns, a header
+is detected (and used to find the url or id column) and the video id is
+extracted from every form of youtube url, so that the same video given by two
+different urls is only yielded once. Dataset manifests (see the manifest module)
+are read the same way.
+
+This file can also be imported as a module and contains the following
+functions:
+
+    * video_id_from_url - Extracts the video id from a youtube url.
+    * watch_url - Builds the canonical url of a video.
+    * iter_csv_videos - Lazily reads the videos of a csv file, without duplicates.
+    * iter_videos - Lazily reads the videos of a csv file or of a manifest, without duplicates.
+"""
+
+import csv
+import re
+from urllib.parse import urlsplit, parse_qs
+
+from crawlers.youtube.manifest import read_manifest
+
+# Extensions of the manifest files
+MANIFEST_EXTENSIONS = ('.jsonl', '.parquet')
+
+# Youtube video ids are 11 characters of the url safe base64 alphabet
+VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+# Hosts serving youtube videos
+YOUTUBE_HOSTS = ('youtube.com', 'youtube-nocookie.com', 'youtu.be')
+
+# Path prefixes followed by the video id, e.g. https://www.youtube.com/shorts/<id>
+ID_PATH_PREFIXES = ('embed', 'shorts', 'v', 'e', 'live')
+
+# Header names of the columns holding the urls (or ids) of the videos
+URL_COLUMNS = ('url', 'urls', 'link', 'video_url', 'youtube_url', 'webpage_url')
+ID_COLUMNS = ('id', 'video_id', 'youtube_id', 'display_id')
+
+
+def video_id_from_url(text: str, allow_bare_id: bool = False):
+    """Extracts the video id from a youtube url.
+
+    Watch urls (also from the mobile and music sites), short ``youtu.be`` urls and embed, shorts, live and ``/v/`` urls
+    are understood, with or without scheme.
+
+    :param text: The url.
+    :type text: str
+
+    :param allow_bare_id: Whether a bare video id (e.g. 'sQ3aeclQ3QA') is accepted as well.
+    :type allow_bare_id: bool, optional
+
+    :returns: The video id, or None if the text is not a youtube video url.
+    :rtype: str
+    """
+    text = text.strip()
+    if allow_bare_id and VIDEO_ID_PATTERN.match(text):
+        return text
+    if '://' not in text:
+        text = 'https://' + text
+    try:
+        parts = urlsplit(text)
+    except ValueError:
+        return None
+    host = (parts.hostname or '').lower()
+    if not any(host == youtube_host or host.endswith('.' + youtube_host) for youtube_host in YOUTUBE_HOSTS):
+        return None
+
+    path = [segment for segment in parts.path.split('/') if segment]
+    if host.endswith('youtu.be'):
+        candidate = path[0] if path else None
+    elif path and path[0] in ID_PATH_PREFIXES and len(path) > 1:
+        candidate = path[1]
+    else:
+        candidate = (parse_qs(parts.query).get('v') or [None])[0]
+    return candidate if candidate and VIDEO_ID_PATTERN.match(candidate) else None
+
+
+def watch_url(video_id: str):
+    """Builds the canonical url of a video.
+
+    :rtype: str
+    """
+    return 'https://www.youtube.com/watch?v=' + video_id
+
+
+def _header_columns(row: list):
+    """Finds the url and id columns of a header row, returns None if the row is not a header."""
+    names = [cell.strip().lower() for cell in row]
+    url_column = next((i for i, name in enumerate(names) if name in URL_COLUMNS), None)
+    id_column = next((i for i, name in enumerate(names) if name in ID_COLUMNS), None)
+    if url_column is not None or id_column is not None:
+        return url_column, id_column
+    cells = [cell for cell in row if cell.strip()]
+    if any(video_id_from_url(cell, allow_bare_id=len(cells) == 1) for cell in cells):
+        return None
+    return None, None
+
+
+def iter_csv_videos(csv_path: str, seen: set = None):
+    """Lazily reads the videos of a csv file, without duplicates.
+
+    The first row is taken as a header if it has no youtube url, in which case the columns named like an url (e.g.
+    'url', 'link') or like an id (e.g. 'id', 'video_id') are looked up first. Otherwise every cell of the row is
+    tried, bare ids being accepted only in single column rows. Rows without a youtube video are skipped.
+
+    :param csv_path: Path to the csv file.
+    :type csv_path: str
+
+    :param seen: Ids of the videos already yielded, updated as the file is read. Pass the same set to several calls to
+        deduplicate videos across files.
+    :type seen: set, optional
+
+    :returns: A generator of (video_id, url) tuples, url being the canonical url of the video.
+    :rtype: generator
+    """
+    seen = set() if seen is None else seen
+    url_column = id_column = None
+    with open(csv_path, newline='') as f:
+        for line, row in enumerate(csv.reader(f)):
+            if line == 0:
+                columns = _header_columns(row)
+                if columns is not None:
+                    url_column, id_column = columns
+                    continue
+
+            video_id = None
+            if url_column is not None and url_column < len(row):
+                video_id = video_id_from_url(row[url_column], allow_bare_id=True)
+            if video_id is None and id_column is not None and id_column < len(row):
+                video_id = video_id_from_url(row[id_column], allow_bare_id=True)
+            if video_id is None:
+                cells = [cell for cell in row if cell.strip()]
+                for cell in cells:
+                    video_id = video_id_from_url(cell, allow_bare_id=len(cells) == 1)
+                    if video_id:
+                        break
+
+            if video_id is None or video_id in seen:
+                continue
+            seen.add(video_id)
+            yield video_id, watch_url(video_id)
+
+
+def iter_videos(path: str, seen: set = None):
+    """Lazily reads the videos of a csv file or of a manifest (a '.jsonl' or '.parquet' file), without duplicates.
+
+    :param path: Path to the csv file or manifest.
+    :type path: str
+
+    :param seen: Ids of the videos already yielded, see iter_csv_videos.
+    :type seen: set, optional
+
+    :returns: A generator of (video_id, url) tuples, url being the canonical url of the video.
+    :rtype: generator
+    """
+    if not path.endswith(MANIFEST_EXTENSIONS):
+        yield from iter_csv_videos(path, seen)
+        return
+    seen = set() if seen is None else seen
+    for record in read_manifest(path):
+        video_id = record.get('id')
+        if video_id and video_id not in seen:
+            seen.add(video_id)
+            yield video_id, watch_url(video_id)
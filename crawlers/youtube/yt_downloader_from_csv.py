@@ -6,7 +6,10 @@ Created in: 05/01/2021
 
 This tool takes a Comma Separated Values file with youtube videos URLS as input
 and downloads them to the specified directory. It avoids downloading videos that
-are already in the destination folder.
+are already in the destination folder. The file is read lazily, so downloads
+start right away and memory stays flat however many rows it has. Optionally,
+the metadata of the videos is resolved (and cached) first, to skip unavailable
+or unwanted videos before downloading them.
 
 This tool requires `youtube_dl` to be installed within the Python
 environment you are running this tool in.
@@ -15,20 +18,56 @@ This file can also be imported as a module and contains the following
 functions:
 
     * already_downloaded - Tests if the video was already downloaded.
+    * download_options - Builds the youtube_dl options used to download videos.
     * download - Downloads a video from a URL.
     * read_csv_and_download_videos - Collects URLs from a csv file and downloads them.
+    * format_from_args - Builds the youtube_dl format given in the arguments of the script.
+
+and the following classes:
+
+    * VideoDownloader - Downloads videos with a single long lived YoutubeDL instance.
 """
 
 import os
+import sys
+import threading
 import youtube_dl
 import argparse
-#from multiprocessing import Pool
-from time import sleep
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from time import sleep, perf_counter
+
+if __package__ in (None, ''):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))  # Running as a script
+
+from crawlers.common import crawl_state
+from crawlers.common.crawl_state import CrawlState
+from crawlers.common.rate_limiter import AdaptiveRateLimiter
+from crawlers.common.download_index import DownloadIndex
+from crawlers.common.content_store import ContentStore
+from crawlers.common.version_policy import VersionPolicy, PREFERENCES
+from crawlers.youtube.video_urls import video_id_from_url, iter_videos
+from crawlers.youtube.metadata import MetadataCache, MetadataFilter, prefetch_metadata
+
+# Key of youtube in the rate limiter
+YOUTUBE_HOST = 'www.youtube.com'
+
+# Name of the videos of this crawler in the crawl state database
+STATE_SOURCE = 'youtube'
+
+# Consecutive failures after which a round of downloads gives up (the remaining videos are tried in the next round)
+MAX_FAILS_SEQUENCE = 100
+
+# Number of csv rows registered at once in the crawl state database
+STATE_BATCH_SIZE = 1000
+
+# Holds the VideoDownloader of each worker thread
+_worker = threading.local()
 
 
 # https://www.youtube.com/watch?v=sQ3aeclQ3QA
 # /media/pedropva/datasets/yt_videos/sQ3aeclQ3QA.mp4
-def already_downloaded(url: str, save_dir: str):
+def already_downloaded(url: str, save_dir: str, index: DownloadIndex = None):
     """Checks (from the url) if a video was already downloaded in the save save_dir.
 
     :param url: Youtube Url for the video.
@@ -37,10 +76,16 @@ def already_downloaded(url: str, save_dir: str):
     :param save_dir: Path to where the videos are saved.
     :type save_dir: str, optional
 
+    :param index: Index of the save_dir. If given, it is consulted instead of probing the filesystem, and it knows
+        every container youtube_dl may produce (not only mp4 and webm).
+    :type index: DownloadIndex, optional
+
     :returns: A boolean, True if the video already exists in the save dir, False otherwise.
     :rtype: bool
     """
-    video_id = url.split('v=')[-1]
+    video_id = video_id_from_url(url, allow_bare_id=True) or url.split('v=')[-1]
+    if index is not None:
+        return video_id in index
     video_path = save_dir + video_id
     if os.path.isfile(video_path + '.mp4') or os.path.isfile(video_path + '.webm'):
         return True
@@ -48,7 +93,36 @@ def already_downloaded(url: str, save_dir: str):
         return False
 
 
-def download(url: str, save_dir: str):
+def download_options(save_dir: str, video_format: str = 'best'):
+    """Builds the youtube_dl options used to download videos.
+
+    :param save_dir: Path to where the videos are saved.
+    :type save_dir: str, optional
+
+    :param video_format: youtube_dl format of the downloaded videos, e.g. 'best[height<=?480]' or one built by
+        VersionPolicy.ytdl_format.
+    :type video_format: str, optional
+
+    :returns: The options to pass to youtube_dl.YoutubeDL.
+    :rtype: dict
+    """
+    return {
+        # 'verbose': True,
+        'format': video_format,
+        'outtmpl': save_dir + '%(id)s.%(ext)s',
+        # "source_address": "10.0.0.4",
+        # 'verbose':False,
+        # 'progress_hooks': [my_hook],
+        # 'noplaylist' : True,
+        # 'postprocessors': [{
+        #    'key': 'FFmpegExtractAudio',
+        #    'preferredcodec': 'mp3',
+        # }],
+    }
+
+
+def download(url: str, save_dir: str, ydl: youtube_dl.YoutubeDL = None, index: DownloadIndex = None,
+             store: ContentStore = None):
     """Downloads a video from the provided url.
 
     :param url: Youtube Url for the video.
@@ -57,39 +131,111 @@ def download(url: str, save_dir: str):
     :param save_dir: Path to where the videos are saved.
     :type save_dir: str, optional
 
+    :param ydl: A YoutubeDL instance (built with download_options) to reuse, instead of building a new one.
+    :type ydl: youtube_dl.YoutubeDL, optional
+
+    :param index: Index of the save_dir, the video is added to it once downloaded.
+    :type index: DownloadIndex, optional
+
+    :param store: Content store where the video is moved (and linked back from save_dir) once downloaded. As
+        youtube_dl writes the file itself, it is read once more to be hashed.
+    :type store: ContentStore, optional
+
     :returns: A boolean, True if the it had success downloading the video, False otherwise.
     :rtype: bool
     """
     try:
-        options = {
-            # 'verbose': True,
-            'format': 'best',
-            'outtmpl': save_dir + '%(id)s.%(ext)s',
-            # "source_address": "10.0.0.4",
-            # 'verbose':False,
-            # 'progress_hooks': [my_hook],
-            # 'noplaylist' : True,
-            # 'postprocessors': [{
-            #    'key': 'FFmpegExtractAudio',
-            #    'preferredcodec': 'mp3',
-            # }],
-        }
-        with youtube_dl.YoutubeDL(options) as ydl:
-            # result = ydl.download([url])
+        if ydl is not None:
             result = ydl.extract_info(url, download=True)
+        else:
+            with youtube_dl.YoutubeDL(download_options(save_dir)) as ydl:
+                # result = ydl.download([url])
+                result = ydl.extract_info(url, download=True)
 
         filepath = save_dir + result['display_id'] + '.' + result['ext']
         print('downloaded: ', filepath)
+        if store is not None:
+            store.add(filepath)
+        if index is not None:
+            index.add(result['display_id'], result['ext'], os.path.getsize(filepath))
         return True
     except Exception as e:
         print(e)
         return False
 
 
-def read_csv_and_download_videos(csv_path: str, save_dir: str, wait_time: int = 30):
-    """Downloads a video from a csv containing youtube urls. One url per line.
+class VideoDownloader:
+    """Downloads videos with a single long lived YoutubeDL instance.
+
+    Building a YoutubeDL (registering every extractor and processing the options) takes tens of milliseconds, which
+    adds up over hundreds of thousands of short clips. A VideoDownloader pays it once, warms up the youtube
+    extractor, and reuses both for every url. It is meant to be used by a single worker thread.
+
+    :param save_dir: Path to where the videos are saved.
+    :type save_dir: str
+
+    :param options: youtube_dl options, defaults to download_options(save_dir).
+    :type options: dict, optional
+
+    :param index: Index of the save_dir, updated with each downloaded video.
+    :type index: DownloadIndex, optional
+
+    :param store: Content store where the downloaded videos are kept, see download.
+    :type store: ContentStore, optional
+    """
 
-    :param csv_path: Path to the csv file with the urls to youtube.
+    def __init__(self, save_dir: str, options: dict = None, index: DownloadIndex = None, store: ContentStore = None):
+        self.save_dir = save_dir
+        self.index = index
+        self.store = store
+        start = perf_counter()
+        self.ydl = youtube_dl.YoutubeDL(options or download_options(save_dir))
+        self.ydl.get_info_extractor('Youtube')  # Instantiated once here instead of on the first url
+        self.setup_time = perf_counter() - start
+        self.urls = 0
+        self.download_time = 0.0
+
+    def download(self, url: str):
+        """Downloads a video from the provided url, see download.
+
+        :returns: A boolean, True if the it had success downloading the video, False otherwise.
+        :rtype: bool
+        """
+        start = perf_counter()
+        result = download(url, self.save_dir, ydl=self.ydl, index=self.index, store=self.store)
+        self.download_time += perf_counter() - start
+        self.urls += 1
+        return result
+
+    @property
+    def overhead_per_url(self):
+        """Setup time of the YoutubeDL instance amortized over the urls downloaded so far, in seconds."""
+        return self.setup_time / max(1, self.urls)
+
+
+def _worker_downloader(save_dir: str, downloaders: list, index: DownloadIndex = None, store: ContentStore = None,
+                       video_format: str = 'best'):
+    """Returns the VideoDownloader of the calling worker thread, building (and listing) it on its first call."""
+    downloader = getattr(_worker, 'downloader', None)
+    if downloader is None or downloader.save_dir != save_dir or downloader.ydl.params.get('format') != video_format:
+        downloader = _worker.downloader = VideoDownloader(save_dir, download_options(save_dir, video_format),
+                                                          index=index, store=store)
+        downloaders.append(downloader)
+    return downloader
+
+
+def read_csv_and_download_videos(csv_path: str, save_dir: str, wait_time: int = 30, state_db_path: str = None,
+                                 rate_limiter: AdaptiveRateLimiter = None, workers: int = 1, index_path: str = None,
+                                 metadata_dir: str = None, video_filter: MetadataFilter = None,
+                                 metadata_workers: int = 4, metadata_rate_limiter: AdaptiveRateLimiter = None,
+                                 store_dir: str = None, video_format: str = 'best'):
+    """Downloads the videos of a csv containing youtube urls, see iter_csv_videos for the accepted layouts. A
+    manifest written by yt_search (a '.jsonl' or '.parquet' file) is accepted as well.
+
+    The csv is read lazily: videos are downloaded as their rows are read, only the ids seen so far (to skip
+    duplicates) and the urls that failed (to retry them in the next round) are kept in memory.
+
+    :param csv_path: Path to the csv file (or manifest) with the urls to youtube.
     :type csv_path: str, optional
 
     :param save_dir: Path to where the videos are saved.
@@ -98,6 +244,45 @@ def read_csv_and_download_videos(csv_path: str, save_dir: str, wait_time: int =
     :param wait_time: Wait time between requests, use it to not get blocked for too many requests.
     :type wait_time: int, optional
 
+    :param state_db_path: Path to a crawl state database. If given, videos are skipped based on the status recorded
+        in it (instead of probing the save_dir) and the outcome of each download is recorded.
+    :type state_db_path: str, optional
+
+    :param rate_limiter: Limiter pacing the downloads, told the outcome of each one so that it speeds up while they
+        succeed and backs off after consecutive failures. Defaults to starting at one download every 30 seconds.
+        It is shared by all workers.
+    :type rate_limiter: AdaptiveRateLimiter, optional
+
+    :param workers: Number of videos downloaded in parallel. Each worker has its own VideoDownloader, reused
+        across urls.
+    :type workers: int, optional
+
+    :param index_path: Path to a file where the index of the downloaded videos is persisted between runs. The save_dir
+        is scanned once at startup either way, persisting the index only spares reading the sizes of known files.
+    :type index_path: str, optional
+
+    :param metadata_dir: Path to a directory where the metadata of each video is cached. If given (or if a
+        video_filter is given), the metadata of the videos is resolved before downloading them, and videos that are
+        unavailable or rejected by the video_filter are not downloaded.
+    :type metadata_dir: str, optional
+
+    :param video_filter: Filter of the videos, based on their metadata.
+    :type video_filter: MetadataFilter, optional
+
+    :param metadata_workers: Number of videos whose metadata is resolved at the same time.
+    :type metadata_workers: int, optional
+
+    :param metadata_rate_limiter: Limiter pacing the metadata queries, separate from the downloads one.
+    :type metadata_rate_limiter: AdaptiveRateLimiter, optional
+
+    :param store_dir: Path to a content store. If given, each downloaded video is stored there once per content and
+        linked back from the save_dir.
+    :type store_dir: str, optional
+
+    :param video_format: youtube_dl format of the downloaded videos, see download_options. The metadata of the videos
+        is resolved for the same format, so the video_filter judges the version that would be downloaded.
+    :type video_format: str, optional
+
     :returns: A boolean, True if the it had success downloading the video, False otherwise.
     :rtype: bool
     """
@@ -106,57 +291,189 @@ def read_csv_and_download_videos(csv_path: str, save_dir: str, wait_time: int =
     if not os.path.exists(save_dir):
         print("Save dir not found, creating save dir in:", save_dir)
         os.makedirs(save_dir)
+    rate_limiter = rate_limiter or AdaptiveRateLimiter(rate=1 / 30, max_rate=1.0)
 
-    # Reading the csv file
-    raw = open(csv_path).read().split('\n')
-    raw = [v.replace(',', '') for v in raw if v != '']
-    # raw = raw[:5500]
-
-    urls_to_download = [url for url in raw if not already_downloaded(url, save_dir)]
-    print(f"{len(raw) - len(urls_to_download)} Videos already downloaded!")
+    index = None
+    if state_db_path:
+        state = CrawlState(state_db_path)
+    else:
+        state = None
+        index = DownloadIndex(save_dir, index_path)
+        print(f'Indexed {len(index)} downloaded videos in {index.build_time:.2f}s.')
+    store = ContentStore(store_dir) if store_dir else None
+    counts = {'videos': 0, 'skipped': 0, 'downloaded': 0}
+    downloaders = []
+
+    def videos_to_download():
+        """Yields the (video_id, url) of the csv that were not downloaded yet, as the rows are read."""
+        batch = []
+        for video in iter_videos(csv_path):
+            batch.append(video)
+            if len(batch) >= STATE_BATCH_SIZE:
+                yield from pending(batch)
+                batch = []
+        yield from pending(batch)
+        print(f"{counts['skipped']} Videos already downloaded!")
+
+    def pending(batch):
+        counts['videos'] += len(batch)
+        if state:
+            state.add(STATE_SOURCE, batch)
+        for video_id, url in batch:
+            if state:
+                downloaded = state.get(STATE_SOURCE, video_id)['status'] == crawl_state.DONE
+            else:
+                downloaded = already_downloaded(url, save_dir, index)
+            if downloaded:
+                counts['skipped'] += 1
+            else:
+                yield video_id, url
+
+    def attempt(video_id, url):
+        print('Downloading from url:', url)
+        if state:
+            state.mark(STATE_SOURCE, video_id, crawl_state.DOWNLOADING, new_attempt=True)
+        rate_limiter.acquire(YOUTUBE_HOST)
+        result = _worker_downloader(save_dir, downloaders, index, store, video_format).download(url)
+        if not result:
+            print('### Failed downloading video! ###')
+            rate_limiter.failure(YOUTUBE_HOST)
+            if state:
+                state.mark(STATE_SOURCE, video_id, crawl_state.FAILED)
+        else:
+            rate_limiter.success(YOUTUBE_HOST)
+            if state:
+                state.mark(STATE_SOURCE, video_id, crawl_state.DONE)
+        return result
 
     # try to download all urls until many consecutive fails or done dowloading all.
-    while (len(urls_to_download) > 0):
+    remaining = videos_to_download()
+    if metadata_dir or video_filter:
+        cache = MetadataCache(metadata_dir) if metadata_dir else None
+        prefetched = prefetch_metadata(remaining, cache, video_filter, metadata_workers, metadata_rate_limiter,
+                                       video_format=video_format)
+        remaining = ((video_id, url) for video_id, url, _ in prefetched)
+    while True:
         fails_sequence = 0
-        failed_urls = []
-        # Uncomment this part and comment the 'for' for multi threading
-        # p = Pool(32)
-        # p.starmap(download, zip(urls_to_download))
-
-        # Try to download each video
-        for url in urls_to_download:
-            print('Downloading from url:', url)
-            result = download(url, save_dir)
-            if not result:
-                print('### Failed downloading video! ###')
-                fails_sequence += 1
-                failed_urls.append(url)
-            else:
-                fails_sequence = 0
+        failed_videos = []
+        in_flight = {}
+
+        # Try to download each video, keeping every worker busy
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                while len(in_flight) < workers and fails_sequence <= MAX_FAILS_SEQUENCE:
+                    video = next(remaining, None)
+                    if video is None:
+                        break
+                    in_flight[executor.submit(attempt, *video)] = video
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    video = in_flight.pop(future)
+                    if future.result():
+                        fails_sequence = 0
+                        counts['downloaded'] += 1
+                    else:
+                        fails_sequence += 1
+                        failed_videos.append(video)
+
+        # if we failed more than N times, then we just gave up: the videos not tried yet go to the next round
+        gave_up = fails_sequence > MAX_FAILS_SEQUENCE
+        print(f"There are {counts['downloaded'] + counts['skipped']} out of {counts['videos']} videos read so far "
+              f"downloaded!")
+        if not gave_up and not failed_videos:
+            break
+        remaining = chain(failed_videos, remaining)
+        sleep(wait_time)
 
-                sleep(30)
+    if state:
+        state.close()
+    if index is not None:
+        index.save()
 
-            if (fails_sequence > 100):  # if we failed more than N times, then just give up and try next time
-                break
+    n_urls = sum(downloader.urls for downloader in downloaders)
+    if n_urls:
+        setup_time = sum(downloader.setup_time for downloader in downloaders)
+        print(f'YoutubeDL setup: {setup_time:.3f}s for {len(downloaders)} instance(s) and {n_urls} url(s), '
+              f'{1000 * setup_time / n_urls:.2f}ms per url.')
 
-        urls_to_download = failed_urls
-        print(f'There are {len(raw) - len(urls_to_download)} out of {len(raw)} videos downloaded!')
 
-        sleep(wait_time)
+def format_from_args(args):
+    """Builds the youtube_dl format given in the arguments of the script (--format, --format_max_height and
+    --format_prefer).
+
+    :rtype: str
+    """
+    if args.format_max_height is None:
+        return args.format
+    return VersionPolicy(max_height=args.format_max_height, prefer=args.format_prefer).ytdl_format()
 
 
 if __name__ == "__main__":
     # Defining the script's arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("csv_path", type=str,
-                        help="Path to the csv file containing a youtube url per line")
+                        help="Path to the csv file containing the youtube urls (or ids) of the videos")
     parser.add_argument("save_dir", type=str,
                         help="The path to the save_dir in which to save the downloads", default='./yt_downloads/')
-    parser.add_argument("--wait",
+    parser.add_argument("--wait", type=float,
                         help="Time in seconds to wait between downloads (so not to overload youtube)",
                         default=10)
+    parser.add_argument("--state_db", type=str,
+                        help="Path to a crawl state database used to resume interrupted runs", default=None)
+    parser.add_argument("--rps", type=float,
+                        help="Initial number of downloads per second, it adapts to the outcome of the downloads",
+                        default=1 / 30)
+    parser.add_argument("--max_rps", type=float,
+                        help="Max number of downloads per second", default=1.0)
+    parser.add_argument("--workers", type=int,
+                        help="Number of videos downloaded in parallel", default=1)
+    parser.add_argument("--index_path", type=str,
+                        help="Path to a file where the index of the downloaded videos is kept between runs",
+                        default=None)
+    parser.add_argument("--store_dir", type=str,
+                        help="Path to a content store where each video is kept once per content", default=None)
+    parser.add_argument("--metadata_dir", type=str,
+                        help="Resolve the metadata of the videos before downloading them, caching it in this dir",
+                        default=None)
+    parser.add_argument("--metadata_workers", type=int,
+                        help="Number of videos whose metadata is resolved at the same time", default=4)
+    parser.add_argument("--metadata_rps", type=float,
+                        help="Initial number of metadata queries per second", default=1.0)
+    parser.add_argument("--min_duration", type=float, help="Skip videos shorter than this, in seconds", default=None)
+    parser.add_argument("--max_duration", type=float, help="Skip videos longer than this, in seconds", default=None)
+    parser.add_argument("--min_height", type=int, help="Skip videos of lower resolution, in pixels", default=None)
+    parser.add_argument("--max_height", type=int, help="Skip videos of higher resolution, in pixels", default=None)
+    parser.add_argument("--max_filesize", type=float, help="Skip videos larger than this, in MiB", default=None)
+    parser.add_argument("--uploaded_after", type=str,
+                        help="Skip videos uploaded before this date (YYYYMMDD)", default=None)
+    parser.add_argument("--uploaded_before", type=str,
+                        help="Skip videos uploaded after this date (YYYYMMDD)", default=None)
+
+    parser.add_argument("--format", type=str,
+                        help="youtube_dl format of the downloaded videos, e.g. 'best[height<=?480]'", default='best')
+    parser.add_argument("--format_max_height", type=int,
+                        help="Download the version of each video of at most this height, in pixels, instead of the "
+                             "best one (overrides --format)", default=None)
+    parser.add_argument("--format_prefer", type=str, choices=PREFERENCES,
+                        help="With --format_max_height, which of the acceptable versions is downloaded",
+                        default='first')
 
     # Parsing arguments
     args = parser.parse_args()
-
-    read_csv_and_download_videos(args.csv_path, args.save_dir, args.wait)
+    criteria = [args.min_duration, args.max_duration, args.min_height, args.max_height, args.max_filesize,
+                args.uploaded_after, args.uploaded_before]
+    video_filter = None
+    if any(criterion is not None for criterion in criteria):
+        max_filesize = int(args.max_filesize * 1024 * 1024) if args.max_filesize is not None else None
+        video_filter = MetadataFilter(args.min_duration, args.max_duration, args.min_height, args.max_height,
+                                      max_filesize, args.uploaded_after, args.uploaded_before)
+
+    read_csv_and_download_videos(args.csv_path, args.save_dir, args.wait, state_db_path=args.state_db,
+                                 rate_limiter=AdaptiveRateLimiter(rate=args.rps, max_rate=args.max_rps),
+                                 workers=args.workers, index_path=args.index_path, metadata_dir=args.metadata_dir,
+                                 video_filter=video_filter, metadata_workers=args.metadata_workers,
+                                 metadata_rate_limiter=AdaptiveRateLimiter(rate=args.metadata_rps,
+                                                                           max_rate=max(args.metadata_rps, 10.0)),
+                                 store_dir=args.store_dir, video_format=format_from_args(args))
@@ -6,7 +6,10 @@ Created in: 09/01/2021
 
 This tool takes a string as input and uses the google search engine to
 look for videos related to the input. Additionally it also downloads the videos
-in the search results.
+in the search results, or, in manifest mode, writes their metadata to a dataset
+manifest without downloading them. Many search terms can be given in a file:
+each video found is then downloaded once, to a single store shared by all the
+terms, and the videos found by each term are recorded apart.
 
 This tool requires `youtube_dl` to be installed within the Python
 environment you are running this tool in.
@@ -15,15 +18,42 @@ This file can also be imported as a module and contains the following
 functions:
 
     * search - Performs a query in youtube then downloads every video to the save save_dir.
+    * search_entries - Runs the queries concurrently, yielding each video found once.
+    * search_manifest - Runs the queries concurrently and writes the videos found to a manifest.
+    * read_queries - Reads the search terms of a file, one per line.
+    * read_membership - Reads the (query, video id) pairs recorded by search_many.
+    * search_many - Runs many queries concurrently and downloads each video found once, to a shared store.
     * main - The main function of the script.
 """
 
 import os
+import sys
+import json
+import threading
 import youtube_dl
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
+if __package__ in (None, ''):
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))  # Running as a script
 
-def search(query: list, save_dir: str, max_n, wait_time: int = 10):
+from crawlers.common.rate_limiter import AdaptiveRateLimiter
+from crawlers.common.download_index import DownloadIndex
+from crawlers.common.version_policy import PREFERENCES
+from crawlers.youtube.manifest import ManifestWriter, manifest_record
+from crawlers.youtube.metadata import MetadataCache, MetadataFilter, prefetch_metadata
+from crawlers.youtube.video_urls import watch_url
+from crawlers.youtube.yt_downloader_from_csv import VideoDownloader, download_options, format_from_args
+
+# Key of youtube in the rate limiter
+YOUTUBE_HOST = 'www.youtube.com'
+
+# Holds the YoutubeDL of each search worker thread
+_worker = threading.local()
+
+
+def search(query: list, save_dir: str, max_n, wait_time: int = 10, rate_limiter: AdaptiveRateLimiter = None,
+           video_format: str = 'best'):
     """Performs a query in youtube then downloads every video to the save save_dir.
 
     :param query: The query strings list, can contain a single string (e.g. ['beach']) or multiple strings (e.g. ['boxing','MMA']).
@@ -35,15 +65,26 @@ def search(query: list, save_dir: str, max_n, wait_time: int = 10):
     :param max_n: Max number of videos to download. It can be a number or simply 'all'
     :type max_n: Any, optional
 
-    :param wait_time: Wait time between requests, use it to not get blocked for too many requests.
+    :param wait_time: Wait time between requests, use it to not get blocked for too many requests. It is the initial
+        pace of the default rate limiter.
     :type wait_time: int, optional
 
+    :param rate_limiter: Limiter pacing the downloads, told the outcome of each one so that it speeds up while they
+        succeed and backs off after consecutive failures. Defaults to starting at one download every wait_time seconds.
+    :type rate_limiter: AdaptiveRateLimiter, optional
+
+    :param video_format: youtube_dl format of the downloaded videos, see download_options.
+    :type video_format: str, optional
+
     :returns: None, It automatically saves the videos to the save save_dir.
     :rtype: None
     """
+    index = DownloadIndex(save_dir)
+    if rate_limiter is None:
+        wait_time = float(wait_time)
+        rate_limiter = AdaptiveRateLimiter(rate=1 / wait_time if wait_time > 0 else None, max_rate=1.0)
     with youtube_dl.YoutubeDL(
             {
-                "sleep_interval": wait_time,
                 # "proxy":'207.91.10.234:8080',
                 "quiet": False,
                 "verbose": False,
@@ -52,17 +93,305 @@ def search(query: list, save_dir: str, max_n, wait_time: int = 10):
                 "forceid": True,
                 "ignoreerrors": True,
                 # "dump_single_json": True,
-                'format': 'best',
+                'format': video_format,
                 "simulate": False,
                 "default_search": f"ytsearch{max_n}",
                 'outtmpl': save_dir + '/' + '%(id)s.%(ext)s',
             }
     ) as ydl:
-        # result = ydl.extract_info(query,download=False) # Uncomment this if we just want to extract the info
-        ydl.download(query)  # Comment this if you dont want to download the video
+        for query_string in query:
+            # Listing the results first, so each download can wait for its turn in the rate limiter
+            results = ydl.extract_info(f'ytsearch{max_n}:{query_string}', download=False, process=False)
+            for entry in (results or {}).get('entries') or []:
+                if entry['id'] in index:
+                    print(f"{entry['id']} already downloaded, skipping!")
+                    continue
+                rate_limiter.acquire(YOUTUBE_HOST)
+                # With ignoreerrors, a failed download gives None instead of raising
+                if ydl.extract_info('https://www.youtube.com/watch?v=' + entry['id'], download=True):
+                    rate_limiter.success(YOUTUBE_HOST)
+                else:
+                    rate_limiter.failure(YOUTUBE_HOST)
+
+
+def _search_query(query_string: str, max_n, rate_limiter: AdaptiveRateLimiter = None):
+    """Lists the results of a query with the YoutubeDL of the calling worker thread, without resolving them."""
+    ydl = getattr(_worker, 'ydl', None)
+    if ydl is None:
+        ydl = _worker.ydl = youtube_dl.YoutubeDL({'quiet': True, 'no_warnings': True, 'ignoreerrors': True})
+    if rate_limiter:
+        rate_limiter.acquire(YOUTUBE_HOST)
+    results = ydl.extract_info(f'ytsearch{max_n}:{query_string}', download=False, process=False)
+    entries = list((results or {}).get('entries') or [])  # The entries are fetched page by page, as they are read
+    if rate_limiter:
+        if results:
+            rate_limiter.success(YOUTUBE_HOST)
+        else:
+            rate_limiter.failure(YOUTUBE_HOST)
+    return entries
+
+
+def search_entries(query: list, max_n, workers: int = 4, rate_limiter: AdaptiveRateLimiter = None,
+                   seen: dict = None, on_result=None):
+    """Runs the queries concurrently, yielding each video found once (for the first query that finds it).
+
+    :param query: The query strings list.
+    :type query: list
+
+    :param max_n: Max number of results of each query. It can be a number or simply 'all'
+    :type max_n: Any
+
+    :param workers: Number of queries run at the same time.
+    :type workers: int, optional
+
+    :param rate_limiter: Limiter pacing the queries.
+    :type rate_limiter: AdaptiveRateLimiter, optional
+
+    :param seen: Maps the id of each video found so far to its query, updated as the results arrive.
+    :type seen: dict, optional
+
+    :param on_result: Called with (query_string, entry) for every result, videos found before by another query
+        included, before the video is yielded.
+    :type on_result: callable, optional
+
+    :returns: A generator of (query_string, entry) tuples, entry being the flat search result of the video (with at
+        least its 'id' and usually its 'title').
+    :rtype: generator
+    """
+    seen = {} if seen is None else seen
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_search_query, query_string, max_n, rate_limiter): query_string
+                   for query_string in query}
+        for future in as_completed(futures):
+            query_string = futures[future]
+            entries = future.result()
+            print(f'{len(entries)} results for "{query_string}"')
+            for entry in entries:
+                if not entry.get('id'):
+                    continue
+                if on_result:
+                    on_result(query_string, entry)
+                if entry['id'] not in seen:
+                    seen[entry['id']] = query_string
+                    yield query_string, entry
+
+
+def search_manifest(query: list, manifest_path: str, max_n, workers: int = 4, resolve: bool = True,
+                    metadata_dir: str = None, video_filter: MetadataFilter = None,
+                    rate_limiter: AdaptiveRateLimiter = None):
+    """Runs the queries concurrently and writes the videos found to a manifest, without downloading them.
+
+    :param query: The query strings list, e.g. ['boxing', 'MMA'].
+    :type query: list
+
+    :param manifest_path: Path to the manifest, see ManifestWriter. It can be given to the Youtube Downloader from CSV
+        to download the videos later.
+    :type manifest_path: str
+
+    :param max_n: Max number of results of each query. It can be a number or simply 'all'
+    :type max_n: Any
+
+    :param workers: Number of queries (and then of videos whose metadata is resolved) at the same time.
+    :type workers: int, optional
+
+    :param resolve: Whether to resolve the full metadata of each video (duration, formats...). Otherwise only the
+        fields of the search results (id and title) are written, with a single request per query.
+    :type resolve: bool, optional
+
+    :param metadata_dir: Path to a directory where the resolved metadata is cached, see MetadataCache.
+    :type metadata_dir: str, optional
+
+    :param video_filter: Filter of the resolved videos, rejected videos are left out of the manifest.
+    :type video_filter: MetadataFilter, optional
+
+    :param rate_limiter: Limiter pacing the requests to youtube.
+    :type rate_limiter: AdaptiveRateLimiter, optional
+
+    :returns: The number of videos written to the manifest.
+    :rtype: int
+    """
+    seen = {}
+    found = search_entries(query, max_n, workers, rate_limiter, seen)
+    with ManifestWriter(manifest_path) as writer:
+        if resolve:
+            cache = MetadataCache(metadata_dir) if metadata_dir else None
+            videos = ((entry['id'], watch_url(entry['id'])) for _, entry in found)
+            for video_id, _, info in prefetch_metadata(videos, cache, video_filter, workers, rate_limiter):
+                writer.write(manifest_record(info, seen[video_id]))
+        else:
+            for query_string, entry in found:
+                writer.write(manifest_record(entry, query_string))
+    print(f'{writer.records} videos written to {manifest_path}')
+    return writer.records
+
+
+def read_queries(queries_path: str):
+    """Reads the search terms of a file, one per line. Blank lines and lines starting with '#' are skipped.
+
+    :returns: The list of search terms, without duplicates.
+    :rtype: list
+    """
+    queries = []
+    with open(queries_path) as f:
+        for line in f:
+            query_string = line.strip()
+            if query_string and not query_string.startswith('#') and query_string not in queries:
+                queries.append(query_string)
+    return queries
+
+
+def read_membership(save_dir: str):
+    """Reads the (query, video id) pairs recorded by search_many in save_dir/membership.jsonl, every run included.
+    Repeated pairs and broken lines (e.g. the last one of an interrupted run) are skipped.
+
+    :returns: A list of dicts with the 'query' and the 'id' of each pair, in the order they were found.
+    :rtype: list
+    """
+    path = os.path.join(save_dir, 'membership.jsonl')
+    records, seen = [], set()
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                pair = record['query'], record['id']
+            except (ValueError, KeyError, TypeError):
+                continue
+            if pair not in seen:
+                seen.add(pair)
+                records.append(record)
+    return records
+
+
+def _link_video(save_dir: str, query_string: str, filename: str):
+    """Links a video of the store to the directory of a query, save_dir/queries/<query>/<filename>."""
+    query_dir = os.path.join(save_dir, 'queries', query_string.replace(os.sep, '_'))
+    if not os.path.exists(query_dir):
+        os.makedirs(query_dir)
+    link_path = os.path.join(query_dir, filename)
+    if not os.path.lexists(link_path):
+        os.symlink(os.path.join('..', '..', 'videos', filename), link_path)
+
+
+def search_many(query: list, save_dir: str, max_n, workers: int = 4, download_workers: int = 1,
+                rate_limiter: AdaptiveRateLimiter = None, links: bool = True, video_format: str = 'best'):
+    """Runs many queries concurrently and downloads each video found once, to a store shared by all queries.
+
+    Videos are saved to save_dir/videos/. Each (query, video id) pair found is added to save_dir/membership.jsonl
+    (which keeps the pairs of the previous runs, as the store does, see read_membership), videos found by several
+    queries included, and, if links is True, each video is also linked (with a symbolic
+    link) from save_dir/queries/<query>/. Downloads start as soon as the first query returns.
+
+    :param query: The query strings list, e.g. read_queries('terms.txt').
+    :type query: list
+
+    :param save_dir: Path to the dataset directory.
+    :type save_dir: str
+
+    :param max_n: Max number of results of each query. It can be a number or simply 'all'
+    :type max_n: Any
+
+    :param workers: Number of queries run at the same time.
+    :type workers: int, optional
+
+    :param download_workers: Number of videos downloaded at the same time.
+    :type download_workers: int, optional
+
+    :param rate_limiter: Limiter pacing the queries and the downloads, told the outcome of each one. Defaults to
+        starting at one request every 10 seconds.
+    :type rate_limiter: AdaptiveRateLimiter, optional
+
+    :param links: Whether to link the videos of each query from its own directory.
+    :type links: bool, optional
 
+    :param video_format: youtube_dl format of the downloaded videos, see download_options.
+    :type video_format: str, optional
 
-def main(query_word: str, save_dir: str, max_n, wait_time: int = 10):
+    :returns: A dict with the number of 'queries', of unique 'videos' found, and of videos 'downloaded', 'skipped'
+        (already in the store) and 'failed'.
+    :rtype: dict
+    """
+    videos_dir = os.path.join(save_dir, 'videos') + os.sep
+    if not os.path.exists(videos_dir):
+        os.makedirs(videos_dir)
+    rate_limiter = rate_limiter or AdaptiveRateLimiter(rate=1 / 10, max_rate=1.0)
+    index = DownloadIndex(videos_dir)
+    counts = {'queries': len(query), 'videos': 0, 'downloaded': 0, 'skipped': 0, 'failed': 0}
+    unlinked = {}  # Queries of each video that is not in the store yet
+
+    def link(video_id, queries):
+        if links:
+            extension = index.get(video_id)[0]
+            for query_string in queries:
+                _link_video(save_dir, query_string, f'{video_id}.{extension}')
+
+    def download_video(video_id):
+        downloader = getattr(_worker, 'downloader', None)
+        if downloader is None or downloader.save_dir != videos_dir:
+            downloader = _worker.downloader = VideoDownloader(videos_dir, download_options(videos_dir, video_format),
+                                                              index=index)
+        rate_limiter.acquire(YOUTUBE_HOST)
+        result = downloader.download(watch_url(video_id))
+        if result:
+            rate_limiter.success(YOUTUBE_HOST)
+        else:
+            rate_limiter.failure(YOUTUBE_HOST)
+        return result
+
+    recorded = {(record['query'], record['id']) for record in read_membership(save_dir)}
+    membership_path = os.path.join(save_dir, 'membership.jsonl')
+    if os.path.exists(membership_path) and os.path.getsize(membership_path):
+        with open(membership_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            complete = f.read() == b'\n'
+    else:
+        complete = True
+    with open(membership_path, 'a') as membership:
+        if not complete:
+            membership.write('\n')  # The last line of an interrupted run is left on its own
+
+        def record(query_string, entry):
+            if (query_string, entry['id']) not in recorded:
+                recorded.add((query_string, entry['id']))
+                membership.write(json.dumps({'query': query_string, 'id': entry['id']}) + '\n')
+            if entry['id'] in index:
+                link(entry['id'], [query_string])
+            else:
+                unlinked.setdefault(entry['id'], []).append(query_string)
+
+        found = search_entries(query, max_n, workers, rate_limiter, on_result=record)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=download_workers) as executor:
+            while True:
+                while len(in_flight) < download_workers:
+                    result = next(found, None)
+                    if result is None:
+                        break
+                    video_id = result[1]['id']
+                    counts['videos'] += 1
+                    if video_id in index:
+                        counts['skipped'] += 1
+                        continue
+                    in_flight[executor.submit(download_video, video_id)] = video_id
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    video_id = in_flight.pop(future)
+                    queries = unlinked.pop(video_id, [])
+                    if future.result():
+                        counts['downloaded'] += 1
+                        link(video_id, queries)
+                    else:
+                        counts['failed'] += 1
+
+    print(f"{counts['videos']} unique videos found by {counts['queries']} queries: {counts['downloaded']} downloaded, "
+          f"{counts['skipped']} already downloaded and {counts['failed']} failed.")
+    return counts
+
+
+def main(query_word: str, save_dir: str, max_n, wait_time: int = 10, video_format: str = 'best'):
     """Performs a query in youtube then downloads every video to the save save_dir.
 
     :param query_word: The query string, can only be a single string (e.g. "beach") .
@@ -77,6 +406,9 @@ def main(query_word: str, save_dir: str, max_n, wait_time: int = 10):
     :param wait_time: Wait time between requests, use it to not get blocked for too many requests.
     :type wait_time: int, optional
 
+    :param video_format: youtube_dl format of the downloaded videos, see download_options.
+    :type video_format: str, optional
+
     :returns: None, It automatically saves the videos to the save save_dir.
     :rtype: None
     """
@@ -89,7 +421,7 @@ def main(query_word: str, save_dir: str, max_n, wait_time: int = 10):
         os.makedirs(save_dir)
 
     print(f"Downloading {max_n} videos of {args.query_word} videos!")
-    search([query_word], save_dir, max_n, wait_time)
+    search([query_word], save_dir, max_n, wait_time, video_format=video_format)
 
 
 if __name__ == "__main__":
@@ -97,10 +429,12 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Search and download youtube videos.')
     parser.add_argument("query_word",
                         type=str,
-                        help="Search term to query in youtube (Only one search term at a time)")
+                        nargs='?',
+                        help="Search term to query in youtube (Only one search term at a time, see --queries)")
     parser.add_argument("save_dir",
                         type=str,
-                        help="The path to the save_dir in which to save the downloads")
+                        nargs='?',
+                        help="The path to the save_dir in which to save the downloads (not needed with --manifest)")
     parser.add_argument("--number",
                         help="Max number of videos to download",
                         default=2000)
@@ -108,7 +442,69 @@ if __name__ == "__main__":
                         help="Time in seconds to wait between downloads (so not to overload youtube)",
                         default=10)
 
+    parser.add_argument("--queries",
+                        type=str,
+                        help="File with many search terms, one per line, used instead of query_word. Each video is "
+                             "downloaded once, to save_dir/videos/",
+                        default=None)
+    parser.add_argument("--download_workers",
+                        type=int,
+                        help="Number of videos downloaded at the same time with --queries",
+                        default=1)
+    parser.add_argument("--manifest",
+                        type=str,
+                        help="Write the videos found to this manifest (.jsonl or .parquet) instead of downloading them",
+                        default=None)
+    parser.add_argument("--flat",
+                        action='store_true',
+                        help="With --manifest, only write the id and title of the search results")
+    parser.add_argument("--workers",
+                        type=int,
+                        help="Number of concurrent requests in manifest mode, or of concurrent queries with --queries",
+                        default=4)
+    parser.add_argument("--metadata_dir",
+                        type=str,
+                        help="With --manifest, cache the metadata of the videos in this dir",
+                        default=None)
+    parser.add_argument("--rps",
+                        type=float,
+                        help="Initial number of requests per second in manifest mode",
+                        default=1.0)
+
+    parser.add_argument("--format",
+                        type=str,
+                        help="youtube_dl format of the downloaded videos, e.g. 'best[height<=?480]'",
+                        default='best')
+    parser.add_argument("--format_max_height",
+                        type=int,
+                        help="Download the version of each video of at most this height, in pixels, instead of the "
+                             "best one (overrides --format)",
+                        default=None)
+    parser.add_argument("--format_prefer",
+                        type=str,
+                        choices=PREFERENCES,
+                        help="With --format_max_height, which of the acceptable versions is downloaded",
+                        default='first')
+
     # Parsing arguments
     args = parser.parse_args()
     # Calling main function
-    main(args.query_word, args.save_dir, args.number, args.wait)
+    if args.queries:
+        queries = read_queries(args.queries)
+    elif args.query_word:
+        queries = [args.query_word]
+    else:
+        parser.error('either query_word or --queries is required')
+    if args.manifest:
+        search_manifest(queries, args.manifest, args.number, workers=args.workers, resolve=not args.flat,
+                        metadata_dir=args.metadata_dir,
+                        rate_limiter=AdaptiveRateLimiter(rate=args.rps, max_rate=max(args.rps, 10.0)))
+    elif args.save_dir and args.queries:
+        wait_time = float(args.wait)
+        search_many(queries, args.save_dir, args.number, workers=args.workers, download_workers=args.download_workers,
+                    rate_limiter=AdaptiveRateLimiter(rate=1 / wait_time if wait_time > 0 else None, max_rate=1.0),
+                    video_format=format_from_args(args))
+    elif args.save_dir:
+        main(args.query_word, args.save_dir, args.number, args.wait, format_from_args(args))
+    else:
+        parser.error('either save_dir or --manifest is required')